@@ -0,0 +1,56 @@
+"""
+AddressNormalizer.py
+Turns raw address text from the CSV files into one canonical string.
+
+Addresses are normalized once, when the distance table and package file are
+read, so the routing code only compares the canonical strings or their IDs
+in the DistanceGraph and never runs a regex.
+"""
+import re
+import sys
+from functools import lru_cache
+
+# Compiled once at import instead of on every call
+_PARENTHESES = re.compile(r"\(.*?\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Distinct raw spellings remembered. A service area has far fewer addresses
+# than packages, so the cache normally holds all of them.
+ADDRESS_CACHE_SIZE = 16384
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def normalize_address(raw):
+    """
+    Cleans a raw address string:
+    - Removes surrounding quotes
+    - Removes parentheses
+    - Strips whitespace
+    - Collapses runs of whitespace into a single space
+
+    The result is interned, so every package and graph entry for an address
+    shares one string object and equal addresses compare by identity first.
+
+    Big O: O(L) for an address of length L the first time it is seen,
+    O(1) for a repeated raw string.
+    """
+    if not raw:
+        return ""
+    cleaned = raw.replace('"', '').strip()
+    cleaned = _PARENTHESES.sub("", cleaned).strip()
+    cleaned = _WHITESPACE.sub(" ", cleaned)
+    return sys.intern(cleaned)
+
+
+def intern_address_id(graph, raw):
+    """
+    Normalizes raw and returns its ID in graph, adding the address if new.
+    """
+    return graph.intern_address(normalize_address(raw))
+
+
+def cache_info():
+    """
+    Hit/miss counters of the normalization cache (functools.lru_cache).
+    """
+    return normalize_address.cache_info()
@@ -0,0 +1,248 @@
+"""
+Benchmark.py
+Times the whole pipeline on synthetic data far larger than the sample.
+
+A seeded generator writes a distance table and a package file in the same
+CSV layouts as WGUPS_Distance_Table.csv and WGUPS_Package_File.csv, then
+each stage (loading, truck loading, delivery, fleet planning, simulation)
+is timed and its peak traced memory recorded. Results are written as JSON
+so runs can be compared:
+
+    python benchmark.py --sizes 100:50 1000:200 10000:1000 -o bench.json
+
+Each size is PACKAGES:ADDRESSES. The quadratic baseline stages
+(load_trucks and the "nearest" delivery engine) are skipped above
+--baseline-limit packages and reported as skipped. --store columnar runs
+every stage on the typed-array PackageStore instead of PackageHashTable,
+to compare their memory use.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from distance_graph import TriangularDistanceGraph
+from package_hash_table import PackageHashTable
+from package_store import PackageStore
+from truck import Truck
+from fleet_planner import plan_fleet
+from simulation import FleetSimulator
+from main import (load_distances_from_csv, load_packages_from_csv, load_trucks,
+                  deliver_all_packages)
+
+DEFAULT_SIZES = ["100:50", "1000:200", "10000:1000"]
+DEFAULT_SEED = 2025
+DEFAULT_BASELINE_LIMIT = 10000
+
+# Package tables selectable with --store
+PACKAGE_TABLES = {"hash": PackageHashTable, "columnar": PackageStore}
+
+# Lines before the header in WGUPS_Package_File.csv
+PACKAGE_PREAMBLE = [
+    [], [], [], ["WGUPS Package File"], [], ["NHP2 : WGUPS Routing Program"], [],
+]
+PACKAGE_HEADER = ["Package\nID", "Address", "City ", "State", "Zip",
+                  "Delivery\nDeadline", "Weight\nKILO", "page 1 of 1PageSpecial Notes"]
+
+STREETS = ["Main St", "State St", "Parkway Blvd", "Canyon Rd", "Taylorsville Blvd",
+           "W Oakland Ave", "S 900 E", "Lester St", "Dalton Ave S", "W Price Ave"]
+DEADLINES = ["9:00 AM"] + ["10:30 AM"] * 4 + ["EOD"] * 15
+# Service area size in miles, addresses are spread uniformly over it
+AREA_MILES = 15.0
+
+
+def generate_dataset(directory, num_packages, num_addresses, seed=DEFAULT_SEED):
+    """
+    Writes distances.csv and packages.csv into directory and returns their
+    paths. The same arguments always produce the same files.
+
+    The distance table is written lower-triangular (each row stops at the
+    diagonal), which load_distances_from_csv reads the same as a full one.
+    About 5% of packages get a special note: a group, a truck restriction
+    or a delay.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    distance_path = os.path.join(directory, "distances.csv")
+    package_path = os.path.join(directory, "packages.csv")
+
+    addresses = ["HUB"] + [f"{100 + i} {STREETS[i % len(STREETS)]}"
+                           for i in range(1, num_addresses)]
+    points = [(rng.uniform(0, AREA_MILES), rng.uniform(0, AREA_MILES)) for _ in addresses]
+    with open(distance_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + addresses)
+        for i, (x, y) in enumerate(points):
+            writer.writerow([addresses[i]] + [
+                f"{math.hypot(x - other_x, y - other_y):.1f}"
+                for other_x, other_y in points[:i + 1]])
+
+    with open(package_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerows(PACKAGE_PREAMBLE)
+        writer.writerow(PACKAGE_HEADER)
+        for package_id in range(1, num_packages + 1):
+            address_id = rng.randrange(1, num_addresses)
+            note = ""
+            roll = rng.random()
+            if roll < 0.02 and package_id > 2:
+                note = f"Must be delivered with {package_id - 1}, {package_id - 2}"
+            elif roll < 0.03:
+                note = "Can only be on truck 2"
+            elif roll < 0.05:
+                note = "Delayed on flight---will not arrive to depot until 9:05 am"
+            writer.writerow([package_id, addresses[address_id], "Salt Lake City", "UT",
+                             f"841{address_id % 100:02d}", rng.choice(DEADLINES),
+                             rng.randint(1, 90), note])
+    return distance_path, package_path
+
+
+class StageTimer:
+    """
+    Runs stages one after another, recording wall time and peak traced
+    memory for each. Output printed by a stage is discarded.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def run(self, name, function, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        stage = {"seconds": round(elapsed, 6)}
+        if self.trace_memory:
+            stage["peak_bytes"] = tracemalloc.get_traced_memory()[1] - baseline
+        self.stages[name] = stage
+        return result
+
+    def skip(self, name, reason):
+        self.stages[name] = {"skipped": reason}
+
+
+def run_size(num_packages, num_addresses, directory, seed=DEFAULT_SEED,
+             baseline_limit=DEFAULT_BASELINE_LIMIT, trace_memory=True, store="hash"):
+    """
+    Generates one dataset and benchmarks every stage on it, keeping the
+    packages in the PACKAGE_TABLES entry named by store.
+    Returns a dict ready for JSON.
+    """
+    table_class = PACKAGE_TABLES[store]
+    timer = StageTimer(trace_memory)
+    distance_path, package_path = timer.run(
+        "generate", generate_dataset, directory, num_packages, num_addresses, seed)
+
+    graph = TriangularDistanceGraph()
+    timer.run("load_distances_from_csv", load_distances_from_csv, distance_path, graph)
+    pkg_table = table_class()
+    timer.run("load_packages_from_csv", load_packages_from_csv, package_path, pkg_table)
+
+    num_trucks = -(-num_packages // Truck.MAX_CAPACITY) + 1
+    if num_packages <= baseline_limit:
+        trucks = [Truck() for _ in range(num_trucks)]
+        timer.run("load_trucks", load_trucks, pkg_table, trucks)
+        timer.run("deliver_all_packages[nearest]", _deliver_fleet,
+                  trucks, pkg_table, graph, "nearest")
+    else:
+        reason = f"more than {baseline_limit} packages"
+        timer.skip("load_trucks", reason)
+        timer.skip("deliver_all_packages[nearest]", reason)
+
+    pkg_table = table_class()
+    load_packages_from_csv(package_path, pkg_table)
+    trucks = [Truck() for _ in range(num_trucks)]
+    left_over = timer.run("plan_fleet", plan_fleet, pkg_table, graph, trucks)
+    simulator = FleetSimulator(pkg_table, graph, trucks, num_drivers=num_trucks)
+    timer.run("simulate", simulator.run)
+
+    delivered = sum(1 for pkg in pkg_table.get_all_packages()
+                    if pkg.get_status() == "Delivered")
+    return {
+        "packages": num_packages,
+        "addresses": num_addresses,
+        "trucks": num_trucks,
+        "store": store,
+        "left_at_hub": len(left_over),
+        "delivered": delivered,
+        "total_miles": round(sum(truck.get_mileage() for truck in trucks), 1),
+        "stages": timer.stages,
+    }
+
+
+def _deliver_fleet(trucks, pkg_table, graph, engine):
+    for truck in trucks:
+        if truck.get_loaded_packages():
+            deliver_all_packages(truck, pkg_table, graph, engine=engine)
+
+
+def _parse_size(text):
+    packages, _, addresses = text.partition(":")
+    num_packages = int(packages)
+    num_addresses = int(addresses) if addresses else max(2, num_packages // 10)
+    return num_packages, min(num_addresses, max(2, num_packages + 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the WGUPS pipeline on synthetic data.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES,
+                        help="PACKAGES:ADDRESSES pairs, e.g. 100000:10000")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--baseline-limit", type=int, default=DEFAULT_BASELINE_LIMIT,
+                        help="largest package count for the quadratic baseline stages")
+    parser.add_argument("--store", choices=sorted(PACKAGE_TABLES), default="hash",
+                        help="package table to run the stages on (default: hash)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc, which slows every stage down")
+    parser.add_argument("--keep-data", metavar="DIR",
+                        help="write the generated CSV files here and keep them")
+    parser.add_argument("-o", "--output", help="JSON file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    trace_memory = not args.no_memory
+    if trace_memory:
+        tracemalloc.start()
+    root = args.keep_data or tempfile.mkdtemp(prefix="wgups_bench_")
+    runs = []
+    try:
+        for size in args.sizes:
+            num_packages, num_addresses = _parse_size(size)
+            directory = os.path.join(root, f"{num_packages}_{num_addresses}")
+            runs.append(run_size(num_packages, num_addresses, directory, args.seed,
+                                 args.baseline_limit, trace_memory, args.store))
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        if not args.keep_data:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "memory_traced": trace_memory,
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Clock.py
+Time of day helpers. Times are carried as float seconds since midnight
+everywhere in the system and only turned into "HH:MM" strings for display.
+"""
+
+SECONDS_PER_MINUTE = 60
+SECONDS_PER_HOUR = 3600
+
+# Deadline used for "EOD" packages, later than any timed deadline
+END_OF_DAY = 24 * SECONDS_PER_HOUR
+
+
+def parse_time(time_str):
+    """
+    Converts 'HH:MM', 'HH:MM AM/PM' or 'EOD' to seconds since midnight.
+    """
+    time_str = time_str.strip().upper()
+    if time_str == "EOD":
+        return END_OF_DAY
+
+    # If no AM/PM
+    if ("AM" not in time_str) and ("PM" not in time_str):
+        hr, mn = time_str.split(":")
+        return float(int(hr) * SECONDS_PER_HOUR + int(mn) * SECONDS_PER_MINUTE)
+
+    # If there's AM/PM
+    parts = time_str.split()
+    if len(parts) != 2:
+        raise ValueError(f"Invalid time format: {time_str}")
+    hh_mm, period = parts
+    hr, mn = hh_mm.split(":")
+    hr = int(hr)
+    mn = int(mn)
+
+    if period == "PM" and hr != 12: hr += 12
+    if period == "AM" and hr == 12: hr = 0
+
+    return float(hr * SECONDS_PER_HOUR + mn * SECONDS_PER_MINUTE)
+
+
+def format_time(seconds):
+    """
+    Formats seconds since midnight as 'HH:MM' (24-hour), truncating any
+    partial minute the way a clock would show it.
+    """
+    total_minutes = int(seconds // SECONDS_PER_MINUTE)
+    return f"{total_minutes // 60:02d}:{total_minutes % 60:02d}"
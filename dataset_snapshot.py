@@ -0,0 +1,170 @@
+"""
+DatasetSnapshot.py
+Compiled, memory-mapped copy of the distance table and package file.
+
+The first run parses the CSV files as usual and writes a snapshot:
+the interned address list, the distances as raw doubles in the graph's own
+layout (a square matrix, or the lower triangle for a
+TriangularDistanceGraph) and the package records. Later runs map the
+distances straight into the DistanceGraph, without copying them, and skip
+CSV parsing and address cleaning entirely. The snapshot is
+rebuilt when a source file's contents change (checked by mtime and size
+first, then by SHA-256 when the mtime moved).
+"""
+import hashlib
+import json
+import mmap
+import os
+
+from package import Package
+
+SNAPSHOT_VERSION = 2
+DEFAULT_SNAPSHOT_DIR = ".wgups_cache"
+
+MANIFEST_FILE = "manifest.json"
+ADDRESSES_FILE = "addresses.json"
+MATRIX_FILE = "distances.f64"
+PACKAGES_FILE = "packages.json"
+
+
+def load_dataset(distance_csv, package_csv, graph, pkg_table,
+                 load_distances, load_packages, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """
+    Fills graph and pkg_table from the snapshot when it is current, or from
+    the CSV files (then writes a fresh snapshot).
+
+    :param load_distances: CSV loader called as load_distances(distance_csv, graph)
+    :param load_packages: CSV loader called as load_packages(package_csv, pkg_table)
+    :return: True if the snapshot was used, False if the CSVs were parsed
+    """
+    sources = {"distances": distance_csv, "packages": package_csv}
+    manifest = _read_manifest(snapshot_dir)
+    # A snapshot written for the other graph layout is rebuilt, not converted
+    if (manifest is not None and manifest.get("layout") == graph.MATRIX_LAYOUT
+            and _sources_current(manifest, sources, snapshot_dir)):
+        try:
+            _load_snapshot(snapshot_dir, graph, pkg_table)
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Snapshot unreadable, rebuilding: {e}")
+
+    load_distances(distance_csv, graph)
+    load_packages(package_csv, pkg_table)
+    try:
+        write_snapshot(snapshot_dir, graph, pkg_table, sources)
+    except OSError as e:
+        print(f"Could not write dataset snapshot: {e}")
+    return False
+
+
+def write_snapshot(snapshot_dir, graph, pkg_table, sources):
+    """
+    Writes the graph and packages to snapshot_dir. The manifest is written
+    last, so a half-written snapshot is never treated as current.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    with open(os.path.join(snapshot_dir, ADDRESSES_FILE), "w", encoding="utf-8") as f:
+        json.dump(graph.addresses, f)
+
+    # Written under a new name and swapped in, so a graph still mapping the
+    # old file keeps reading the old contents
+    matrix_path = os.path.join(snapshot_dir, MATRIX_FILE)
+    with open(matrix_path + ".tmp", "wb") as f:
+        for block in graph.stored_matrix():
+            f.write(block)
+    os.replace(matrix_path + ".tmp", matrix_path)
+
+    records = [[p.get_package_id(), p.get_address(), p.get_city(), p.get_state(),
+                p.get_zip(), p.get_deadline(), p.get_weight(), p.get_special_note()]
+               for p in pkg_table.get_all_packages()]
+    with open(os.path.join(snapshot_dir, PACKAGES_FILE), "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "address_count": graph.size(),
+        "layout": graph.MATRIX_LAYOUT,
+        "sources": {name: _fingerprint(path, with_hash=True) for name, path in sources.items()},
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def _load_snapshot(snapshot_dir, graph, pkg_table):
+    with open(os.path.join(snapshot_dir, ADDRESSES_FILE), encoding="utf-8") as f:
+        addresses = json.load(f)
+
+    # Private copy-on-write mapping: pages are read lazily from the file and
+    # later add_distance calls never write back to the snapshot
+    with open(os.path.join(snapshot_dir, MATRIX_FILE), "rb") as f:
+        if len(addresses) == 0:
+            matrix = memoryview(b"").cast("d")
+        else:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            matrix = memoryview(mapped).cast("d")
+    if len(matrix) != graph.stored_length(len(addresses)):
+        raise ValueError("distance matrix size does not match address table")
+    graph.load_stored_matrix(addresses, matrix)
+
+    with open(os.path.join(snapshot_dir, PACKAGES_FILE), encoding="utf-8") as f:
+        for record in json.load(f):
+            pkg_table.add_package(Package(*record))
+
+
+def _read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        return None
+    return manifest
+
+
+def _sources_current(manifest, sources, snapshot_dir):
+    """
+    True when every source file still matches its recorded fingerprint.
+    A file whose mtime changed but whose contents hash the same is still
+    current; its new mtime is saved so the hash is not recomputed next time.
+    """
+    recorded = manifest.get("sources", {})
+    refreshed = False
+    for name, path in sources.items():
+        saved = recorded.get(name)
+        if saved is None or saved.get("path") != path:
+            return False
+        try:
+            now = _fingerprint(path, with_hash=False)
+        except OSError:
+            return False
+        if now["size"] != saved["size"]:
+            return False
+        if now["mtime_ns"] != saved["mtime_ns"]:
+            if _fingerprint(path, with_hash=True)["sha256"] != saved["sha256"]:
+                return False
+            saved["mtime_ns"] = now["mtime_ns"]
+            refreshed = True
+    if refreshed:
+        try:
+            with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1)
+        except OSError:
+            pass
+    return True
+
+
+def _fingerprint(path, with_hash):
+    stat = os.stat(path)
+    fingerprint = {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
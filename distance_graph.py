@@ -3,44 +3,318 @@ DistanceGraph.py
 
 :author Taylor Ketterling 3/21/2025
 """
+import heapq
+from array import array
+from itertools import accumulate, repeat
+
+# Sentinel stored in the matrix for address pairs with no known distance.
+# Infinity keeps min() based searches over a row correct without filtering.
+MISSING = float("inf")
+
+
+def as_bytes(buffer):
+    """
+    A byte view of a buffer of doubles (array('d') or a memoryview cast to
+    "d"), which frombytes, file writes and hashing accept.
+    """
+    return memoryview(buffer).cast("B")
+
+
 class DistanceGraph:
     """
     Represents distances between delivery locations using a graph structure.
     Distances are symmetric: distance(A, B) = distance(B, A).
+
+    Each address is interned to an integer ID the first time it is seen and
+    distances live in one contiguous row-major matrix of doubles, so lookups
+    by ID are a single index operation. The string API is a thin wrapper
+    that translates addresses to IDs.
     """
 
+    # How stored_matrix() lays the distances out, recorded by dataset snapshots
+    MATRIX_LAYOUT = "square"
+
     def __init__(self):
-        self.distances = {}  # { str -> { str -> float } }
+        self.addresses = []      # [ int(address_id) -> str ]
+        self.address_ids = {}    # { str -> int(address_id) }
+        self.capacity = 0        # allocated rows/columns in the matrix
+        self.matrix = array("d")  # capacity x capacity, row-major
+        self.neighbor_lists = {}  # { int(k) -> [ [address_id, ...] per address ] }
+        self.metric_closure = None  # MetricClosure once close_distances ran
+
+    def intern_address(self, address):
+        """
+        Returns the integer ID for an address, assigning a new one if needed.
+        """
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            address_id = len(self.addresses)
+            self._ensure_capacity(address_id + 1)
+            self.addresses.append(address)
+            self.address_ids[address] = address_id
+            self.matrix[address_id * self.capacity + address_id] = 0.0
+        return address_id
+
+    def load_matrix(self, addresses, matrix):
+        """
+        Replaces the graph with a prebuilt square matrix, e.g. a memory-mapped
+        snapshot. matrix is any buffer of len(addresses)^2 doubles supporting
+        indexing and slicing (array('d') or memoryview).
+        """
+        self.addresses = list(addresses)
+        self.address_ids = {address: i for i, address in enumerate(self.addresses)}
+        self.capacity = len(self.addresses)
+        self.matrix = matrix
+        self.neighbor_lists = {}
+        self.metric_closure = None
+
+    def stored_matrix(self):
+        """
+        The distances as a list of byte buffers of doubles, in MATRIX_LAYOUT
+        order: one row of size() distances per address.
+        """
+        return [as_bytes(self.get_row(address_id)) for address_id in range(len(self.addresses))]
+
+    @staticmethod
+    def stored_length(size):
+        """
+        Doubles stored_matrix() holds for size addresses.
+        """
+        return size * size
+
+    def load_stored_matrix(self, addresses, matrix):
+        """
+        Replaces the graph with distances laid out as stored_matrix()
+        writes them, e.g. a memory-mapped snapshot.
+        """
+        self.load_matrix(addresses, matrix)
+
+    def get_address_id(self, address):
+        """
+        Returns the integer ID for an address or -1 if it is unknown.
+        """
+        return self.address_ids.get(address, -1)
+
+    def get_address(self, address_id):
+        return self.addresses[address_id]
+
+    def size(self):
+        return len(self.addresses)
+
+    def _ensure_capacity(self, needed):
+        """
+        Grows the matrix so it can hold at least `needed` addresses.
+        Capacity doubles, so interning d addresses costs O(d^2) amortized.
+        """
+        if needed <= self.capacity:
+            return
+        new_capacity = max(needed, self.capacity * 2, 8)
+        new_matrix = array("d", [MISSING]) * (new_capacity * new_capacity)
+        old_capacity = self.capacity
+        # A mapped snapshot is a memoryview; copy it into a growable array
+        old_matrix = self.matrix if isinstance(self.matrix, array) else array("d", self.matrix)
+        for row in range(len(self.addresses)):
+            old_start = row * old_capacity
+            new_start = row * new_capacity
+            new_matrix[new_start:new_start + old_capacity] = \
+                old_matrix[old_start:old_start + old_capacity]
+        self.matrix = new_matrix
+        self.capacity = new_capacity
 
     def add_distance(self, address1, address2, distance):
         """
         Adds a distance between two locations (symmetric).
         """
-        if address1 not in self.distances:
-            self.distances[address1] = {}
-        if address2 not in self.distances:
-            self.distances[address2] = {}
+        self.add_distance_by_id(self.intern_address(address1),
+                                self.intern_address(address2),
+                                distance)
 
-        self.distances[address1][address2] = distance
-        self.distances[address2][address1] = distance
+    def add_distance_by_id(self, id1, id2, distance):
+        """
+        Adds a distance between two interned address IDs (symmetric).
+        """
+        self.matrix[id1 * self.capacity + id2] = distance
+        self.matrix[id2 * self.capacity + id1] = distance
+        if self.neighbor_lists:
+            self.neighbor_lists = {}
+        self.metric_closure = None
 
     def get_distance(self, address1, address2):
         """
         Retrieves the distance between two addresses or -1 if not found.
+        Misses are silent; instrumentation.py counts them, unknown
+        addresses included, when enabled.
         """
-        if (address1 in self.distances and
-            address2 in self.distances[address1]):
-            return self.distances[address1][address2]
-
-        print(f"Distance not found between {address1} and {address2}")
+        id1 = self.address_ids.get(address1)
+        id2 = self.address_ids.get(address2)
+        if id1 is not None and id2 is not None:
+            distance = self.get_distance_by_id(id1, id2)
+            if distance != MISSING:
+                return distance
         return -1.0
 
+    def get_distance_by_id(self, id1, id2):
+        """
+        Retrieves the distance between two address IDs, MISSING if unknown.
+        Big O: O(1), no hashing involved.
+        """
+        return self.matrix[id1 * self.capacity + id2]
+
+    def get_row(self, address_id):
+        """
+        Returns the distances from one address to every other address as a
+        slice of the matrix, indexable by address ID.
+        """
+        start = address_id * self.capacity
+        return self.matrix[start:start + len(self.addresses)]
+
+    def get_neighbor_lists(self, k):
+        """
+        Returns, for every address ID, the IDs of its k nearest other
+        addresses ordered by distance. Lists are computed once per k and
+        reused until a distance changes.
+
+        Big O: O(d^2 log k) to build for d addresses, O(1) afterwards.
+        """
+        lists = self.neighbor_lists.get(k)
+        if lists is None:
+            lists = []
+            for address_id in range(len(self.addresses)):
+                row = self.get_row(address_id)
+                # One extra candidate because an address is nearest to itself
+                nearest = heapq.nsmallest(k + 1, range(len(row)), key=row.__getitem__)
+                lists.append([other for other in nearest
+                              if other != address_id and row[other] != MISSING][:k])
+            self.neighbor_lists[k] = lists
+        return lists
+
+    def iter_distances(self):
+        """
+        Yields (from_address, to_address, distance) for every known pair,
+        reading the matrix in place.
+        """
+        addresses = self.addresses
+        for from_id, from_loc in enumerate(addresses):
+            start = from_id * self.capacity
+            for to_id, dist in enumerate(self.matrix[start:start + len(addresses)]):
+                if dist != MISSING:
+                    yield from_loc, addresses[to_id], dist
+
     def print_all_distances(self):
         """
         Debugging method to print all stored distances.
         """
         print("\n--- All Stored Distances ---")
-        for from_loc, to_map in self.distances.items():
-            for to_loc, dist in to_map.items():
-                print(f"{from_loc} -> {to_loc} : {dist:.2f} miles")
+        for from_loc, to_loc, dist in self.iter_distances():
+            print(f"{from_loc} -> {to_loc} : {dist:.2f} miles")
         print("----------------------------\n")
+
+
+class TriangularDistanceGraph(DistanceGraph):
+    """
+    DistanceGraph that stores each symmetric pair once.
+
+    Only the lower triangle (including the diagonal) is kept, in one flat
+    array('d'): the pair (i, j) with j <= i lives at i * (i + 1) // 2 + j.
+    Rows are appended as addresses are interned, so the array never has to
+    be copied to grow, and d addresses take d * (d + 1) / 2 doubles.
+
+    Lookups by ID cost the same as the square matrix. get_row has to gather
+    the part of the row above the diagonal, so it costs O(d).
+    """
+
+    MATRIX_LAYOUT = "triangle"
+
+    def intern_address(self, address):
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            if not isinstance(self.matrix, array):
+                # A mapped snapshot cannot grow; copy it into an array first
+                matrix = array("d")
+                matrix.frombytes(as_bytes(self.matrix))
+                self.matrix = matrix
+            address_id = len(self.addresses)
+            self.addresses.append(address)
+            self.address_ids[address] = address_id
+            self.matrix.extend(repeat(MISSING, address_id))
+            self.matrix.append(0.0)
+            self.capacity = address_id + 1
+        return address_id
+
+    def load_matrix(self, addresses, matrix):
+        """
+        Builds the triangle from a square len(addresses)^2 matrix, copying
+        the lower part of each row as one block of bytes.
+        """
+        size = len(addresses)
+        view = memoryview(matrix)
+        triangle = array("d")
+        for i in range(size):
+            triangle.frombytes(as_bytes(view[i * size:i * size + i + 1]))
+        self.load_stored_matrix(addresses, triangle)
+
+    def stored_matrix(self):
+        """
+        The triangle as it is kept: one byte buffer of size() * (size() + 1)
+        / 2 doubles.
+        """
+        return [as_bytes(self.matrix)]
+
+    @staticmethod
+    def stored_length(size):
+        return size * (size + 1) // 2
+
+    def load_stored_matrix(self, addresses, matrix):
+        """
+        Uses matrix, a lower triangle as stored_matrix() returns it, in
+        place; a memory-mapped snapshot is not copied.
+        """
+        self.addresses = list(addresses)
+        self.address_ids = {address: i for i, address in enumerate(self.addresses)}
+        self.capacity = len(self.addresses)
+        self.matrix = matrix
+        self.neighbor_lists = {}
+        self.metric_closure = None
+
+    def add_distance_by_id(self, id1, id2, distance):
+        if id1 < id2:
+            id1, id2 = id2, id1
+        self.matrix[id1 * (id1 + 1) // 2 + id2] = distance
+        if self.neighbor_lists:
+            self.neighbor_lists = {}
+        self.metric_closure = None
+
+    def get_distance_by_id(self, id1, id2):
+        if id1 < id2:
+            id1, id2 = id2, id1
+        return self.matrix[id1 * (id1 + 1) // 2 + id2]
+
+    def get_row(self, address_id):
+        """
+        The lower part of the row is one slice of the triangle; the rest is
+        column address_id of the later rows, whose positions grow by j + 1
+        from row j to row j + 1 and are gathered with map() in C.
+        """
+        base = address_id * (address_id + 1) // 2
+        row = array("d")
+        row.frombytes(as_bytes(memoryview(self.matrix)[base:base + address_id + 1]))
+        size = len(self.addresses)
+        if address_id + 1 < size:
+            first = (address_id + 1) * (address_id + 2) // 2 + address_id
+            row.extend(map(self.matrix.__getitem__,
+                           accumulate(range(address_id + 2, size), initial=first)))
+        return row
+
+    def iter_distances(self):
+        """
+        Yields (address, other_address, distance) once per stored pair,
+        walking the triangle array in order.
+        """
+        addresses = self.addresses
+        position = 0
+        for from_id, from_loc in enumerate(addresses):
+            for to_id in range(from_id + 1):
+                dist = self.matrix[position]
+                position += 1
+                if dist != MISSING:
+                    yield from_loc, addresses[to_id], dist
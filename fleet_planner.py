@@ -0,0 +1,296 @@
+"""
+FleetPlanner.py
+Splits the packages waiting at the hub across any number of trucks.
+
+Packages are first bundled into units that must ride together (a
+"Must be delivered with" group, or the plain packages for one address).
+Special-note constraints come from a ConstraintIndex: groups are whole
+union-find components, a unit pinned to a truck only goes on that truck,
+and a delayed unit only goes on a truck that leaves after it arrives.
+Units are then clustered with the Clarke-Wright savings heuristic, using
+only the k-nearest-neighbor pairs from the DistanceGraph so the number of
+candidate merges grows linearly with the number of units. Finished clusters
+are handed to trucks earliest deadline first, so the first trucks to leave
+carry the most urgent packages.
+"""
+import heapq
+
+from truck import Truck
+from clock import END_OF_DAY, parse_time
+from package_constraints import ConstraintIndex
+
+# Neighbor pairs considered per unit when computing savings
+DEFAULT_NEIGHBORS = 10
+
+
+def plan_fleet(pkg_table, graph, trucks, hub="HUB", neighbors=DEFAULT_NEIGHBORS,
+               constraints=None, depart_times=None):
+    """
+    Loads every package that is still at the hub onto the given trucks.
+
+    Respects each truck's capacity, mixed capacities included, and the
+    special-note constraints. Returns the packages that did not fit on any
+    truck, and those that cannot leave yet (a wrong address with no
+    correction).
+
+    :param constraints: ConstraintIndex, compiled from pkg_table if None
+    :param depart_times: per truck, the time (seconds) it leaves the hub, or
+                         None if it leaves later, once a driver is free and
+                         its packages have arrived (see departure_times).
+                         Trucks past the end of the list, or None for the
+                         whole list, have no fixed departure.
+
+    Big O: O(n k log(n k)) for n packages and k neighbors per unit, plus the
+    DistanceGraph neighbor lists, which are built once per graph.
+    """
+    capacities = [truck.get_capacity() for truck in trucks] or [Truck.MAX_CAPACITY]
+    capacity = max(capacities)
+    hub_id = graph.get_address_id(hub)
+    if constraints is None:
+        constraints = ConstraintIndex.from_packages(pkg_table.get_all_packages())
+    units, held = _build_units(pkg_table, graph, capacity, constraints)
+    # Routes are merged up to the smallest truck so any truck can take one;
+    # a group only the larger trucks fit stays one unit
+    routes = _savings_routes(graph, hub_id, units, min(capacities), neighbors)
+    return held + _assign_routes(routes, trucks, capacity, depart_times)
+
+
+def departure_times(constraints, num_trucks, start_time="08:00"):
+    """
+    Per truck departure times (seconds) for plan_fleet: the first truck
+    leaves at start_time, and one more waits for each later time held
+    packages become ready (ConstraintIndex.get_ready_times). The list is
+    sized to the fleet; trucks beyond those times get None and leave once
+    a driver is back.
+    """
+    start = parse_time(start_time)
+    later = [at_time for at_time in constraints.get_ready_times() if at_time > start]
+    departures = ([start] + later)[:num_trucks]
+    return departures + [None] * (num_trucks - len(departures))
+
+
+class _Unit:
+    """
+    Packages that travel together, anchored at one address for distances.
+    """
+
+    def __init__(self, packages, stop_id, splittable, truck=None, ready=0.0):
+        self.packages = packages
+        self.stop_id = stop_id
+        self.splittable = splittable  # False for "Must be delivered with" groups
+        self.truck = truck            # required truck number (1-based) or None
+        self.ready = ready            # seconds at which every package is at the hub
+        self.deadline = min(p.get_deadline_seconds() for p in packages)
+        self.urgent = self.deadline < END_OF_DAY
+
+    def size(self):
+        return len(self.packages)
+
+
+def _build_units(pkg_table, graph, capacity, constraints):
+    """
+    Bundles packages at the hub into units no larger than capacity.
+
+    The waiting members of each constraint group form one unit, anchored
+    at the address of its most urgent package. The remaining packages are
+    bundled per address, truck and ready time. Returns (units, held) where
+    held lists packages that cannot leave yet.
+
+    Big O: O(n alpha(n)) for n packages.
+    """
+    waiting = pkg_table.find_by_status("At hub")
+    waiting.sort(key=lambda p: (p.get_deadline_seconds(), p.get_package_id()))
+
+    held = []
+    groups = {}      # { group key -> [Package] }, in deadline order
+    by_address = {}  # { (stop_id, truck, ready) -> [Package] }
+    for pkg in waiting:
+        package_id = pkg.get_package_id()
+        ready = constraints.get_available_time(package_id)
+        if ready is None:
+            held.append(pkg)
+        elif constraints.in_group(package_id):
+            groups.setdefault(constraints.get_group_id(package_id), []).append(pkg)
+        else:
+            key = (graph.get_address_id(pkg.get_address()),
+                   constraints.get_required_truck(package_id), ready)
+            by_address.setdefault(key, []).append(pkg)
+    for pkg in held:
+        print(f"Package #{pkg.get_package_id()} is held until its address is corrected.")
+
+    units = []
+    for group in groups.values():
+        first_id = group[0].get_package_id()
+        if len(group) > capacity:
+            print(f"Group for package #{first_id} exceeds truck capacity, splitting it.")
+        for start in range(0, len(group), capacity):
+            units.append(_Unit(group[start:start + capacity],
+                               graph.get_address_id(group[0].get_address()), False,
+                               constraints.get_required_truck(first_id),
+                               constraints.get_available_time(first_id)))
+    for (stop_id, truck, ready), packages in by_address.items():
+        for start in range(0, len(packages), capacity):
+            units.append(_Unit(packages[start:start + capacity], stop_id, True, truck, ready))
+    return units, held
+
+
+def _savings_routes(graph, hub_id, units, capacity, neighbors):
+    """
+    Clarke-Wright savings restricted to nearby units.
+
+    Each route starts as a single unit. Pairs of units are merged, largest
+    saving first, when both sit at an end of different routes and the
+    combined load fits on a truck, the routes do not need different trucks
+    and their packages reach the hub at the same time. Units whose address
+    is unknown to the graph stay as routes of their own.
+    """
+    dist = graph.get_distance_by_id
+    units_at = {}
+    for index, unit in enumerate(units):
+        units_at.setdefault(unit.stop_id, []).append(index)
+
+    neighbor_lists = graph.get_neighbor_lists(neighbors) if hub_id >= 0 else []
+    savings = []
+    for i, unit in enumerate(units):
+        if unit.stop_id < 0 or hub_id < 0:
+            continue
+        hub_to_i = dist(hub_id, unit.stop_id)
+        for other_stop in [unit.stop_id] + neighbor_lists[unit.stop_id]:
+            for j in units_at.get(other_stop, ()):
+                if j > i:
+                    saving = hub_to_i + dist(hub_id, other_stop) - dist(unit.stop_id, other_stop)
+                    savings.append((-saving, i, j))
+    heapq.heapify(savings)
+
+    # route_of[i] is the route list unit i belongs to; routes are lists of unit indexes
+    route_of = [[i] for i in range(len(units))]
+    load = {id(route): units[route[0]].size() for route in route_of}
+    pinned = {id(route): units[route[0]].truck for route in route_of}
+    while savings:
+        _, i, j = heapq.heappop(savings)
+        route_i, route_j = route_of[i], route_of[j]
+        if route_i is route_j:
+            continue
+        if load[id(route_i)] + load[id(route_j)] > capacity:
+            continue
+        if units[i].ready != units[j].ready or units[i].urgent != units[j].urgent:
+            continue
+        truck_i, truck_j = pinned[id(route_i)], pinned[id(route_j)]
+        if truck_i is not None and truck_j is not None and truck_i != truck_j:
+            continue
+        if i not in (route_i[0], route_i[-1]) or j not in (route_j[0], route_j[-1]):
+            continue
+        # Orient so the routes join as ... i -> j ...
+        if route_i[-1] != i:
+            route_i.reverse()
+        if route_j[0] != j:
+            route_j.reverse()
+        route_i.extend(route_j)
+        load[id(route_i)] += load.pop(id(route_j))
+        pinned[id(route_i)] = truck_i if truck_i is not None else truck_j
+        del pinned[id(route_j)]
+        for index in route_j:
+            route_of[index] = route_i
+
+    routes = []
+    seen = set()
+    for route in route_of:
+        if id(route) not in seen:
+            seen.add(id(route))
+            routes.append([units[index] for index in route])
+    return routes
+
+
+def _assign_routes(routes, trucks, capacity, depart_times=None):
+    """
+    Hands routes to trucks earliest deadline first. A route that does not fit whole on any allowed truck
+    is split into its units, and a plain address unit that still does not
+    fit is split into single packages. Returns the packages that could not
+    be loaded.
+
+    A truck is allowed when it is the unit's pinned truck (if any) and it
+    leaves no earlier than the unit's ready time and before its deadline.
+    Of the allowed trucks, the earliest to leave is used. Free trucks are kept in
+    one heap per remaining capacity for each distinct departure time, so
+    finding the first allowed truck with room costs O(c capacity log t)
+    for t trucks and c distinct departure times.
+    """
+    no_departure = float("inf")
+    departs = [no_departure if depart_times is None or index >= len(depart_times)
+               or depart_times[index] is None else depart_times[index]
+               for index in range(len(trucks))]
+    classes = sorted(set(departs))
+    class_of = [classes.index(depart) for depart in departs]
+
+    room = [truck.get_capacity() - len(truck.get_loaded_packages()) for truck in trucks]
+    # free[c][r] holds trucks of departure class c with r seats left. Entries
+    # whose truck has since filled up are stale and skipped when seen.
+    free = [[[] for _ in range(capacity + 1)] for _ in classes]
+    for index in range(len(trucks)):
+        if room[index] > 0:
+            free[class_of[index]][room[index]].append(index)
+
+    def use(index, size):
+        room[index] -= size
+        if room[index] > 0:
+            heapq.heappush(free[class_of[index]][room[index]], index)
+        return trucks[index]
+
+    def take_truck(size, ready, deadline, pin):
+        if pin is not None:
+            index = pin - 1
+            if (0 <= index < len(trucks) and room[index] >= size
+                    and (ready <= departs[index] < deadline or departs[index] == no_departure)):
+                return use(index, size)
+            return None
+        for cls, depart in enumerate(classes):
+            if depart < ready or (depart >= deadline and depart != no_departure):
+                continue
+            best = None
+            for seats in range(size, capacity + 1):
+                heap = free[cls][seats]
+                while heap and room[heap[0]] != seats:
+                    heapq.heappop(heap)
+                if heap and (best is None or heap[0] < best):
+                    best = heap[0]
+            if best is not None:
+                return use(best, size)
+        return None
+
+    def route_pin(route):
+        for unit in route:
+            if unit.truck is not None:
+                return unit.truck
+        return None
+
+    left_over = []
+    routes.sort(key=lambda route: (min(u.deadline for u in route),
+                                   -sum(u.size() for u in route)))
+    for route in routes:
+        size = sum(unit.size() for unit in route)
+        ready = max(unit.ready for unit in route)
+        deadline = min(unit.deadline for unit in route)
+        truck = take_truck(size, ready, deadline, route_pin(route))
+        if truck:
+            for unit in route:
+                for pkg in unit.packages:
+                    truck.load_package(pkg)
+            continue
+        for unit in sorted(route, key=lambda u: u.deadline):
+            truck = take_truck(unit.size(), unit.ready, unit.deadline, unit.truck)
+            if truck:
+                for pkg in unit.packages:
+                    truck.load_package(pkg)
+            elif unit.splittable:
+                for pkg in unit.packages:
+                    truck = take_truck(1, unit.ready, pkg.get_deadline_seconds(), unit.truck)
+                    if truck:
+                        truck.load_package(pkg)
+                    else:
+                        left_over.append(pkg)
+            else:
+                left_over.extend(unit.packages)
+
+    if left_over:
+        print(f"All trucks full, {len(left_over)} packages remain at the hub.")
+    return left_over
@@ -0,0 +1,153 @@
+"""
+HeldKarp.py
+Exact shortest HUB -> stops -> HUB tour for a single truck load using the
+Held-Karp bitmask dynamic program.
+
+Run this module directly to compare the exact tours against the greedy
+nearest-neighbor mileage and missed deadlines for the WGUPS sample data.
+"""
+import time
+from itertools import compress
+from operator import add
+
+from distance_graph import MISSING
+from routing import nearest_neighbor_route
+from truck import Truck
+
+# Held-Karp is O(2^s * s^2); a full truck load is the largest size we solve exactly.
+HELD_KARP_MAX_STOPS = Truck.MAX_CAPACITY
+
+
+def held_karp_route(graph, start_id, stop_ids):
+    """
+    Returns stop_ids ordered as the shortest tour that starts and ends at
+    start_id. Loads with more than HELD_KARP_MAX_STOPS distinct stops, or
+    with stops that cannot all be reached, fall back to nearest-neighbor.
+
+    dp[mask][j] is the shortest path from the start through every stop in
+    mask, ending at stop j. Each dp entry is one min() over an element-wise
+    sum of the previous subset's row and a distance column, so the inner
+    loop over predecessors runs in C.
+
+    Distances are symmetric, so the tour is split at a middle stop j into
+    two paths that both start at the HUB: one covering a set A and one
+    covering the rest plus j. Only subsets up to about half the stops are
+    needed, which skips roughly a third of the table.
+
+    Big O: O(2^s * s^2) time, O(2^s * s) space for s distinct stops.
+    """
+    stops = list(dict.fromkeys(stop_ids))
+    n = len(stops)
+    if n <= 2 or n > HELD_KARP_MAX_STOPS:
+        return nearest_neighbor_route(graph, start_id, stops)
+
+    dist = graph.get_distance_by_id
+    # columns[j][k] = distance from stop k to stop j
+    columns = [[dist(stops[k], stops[j]) for k in range(n)] for j in range(n)]
+
+    full = (1 << n) - 1
+    half = (n + 2) // 2  # |A| = half, |rest + j| = n - half + 1 <= half
+    bits = [1 << j for j in range(n)]
+    indexed_bits = list(enumerate(bits))
+    blank = [MISSING] * n
+
+    dp = [None] * (1 << n)
+    for j in range(n):
+        row = blank[:]
+        row[j] = dist(start_id, stops[j])
+        dp[bits[j]] = row
+
+    for mask in range(3, full + 1):
+        size = mask.bit_count()
+        if size < 2 or size > half:
+            continue
+        row = blank[:]
+        for j, bit in indexed_bits:
+            if mask & bit:
+                row[j] = min(map(add, dp[mask ^ bit], columns[j]))
+        dp[mask] = row
+
+    # Join the two half paths at their shared end stop
+    best_total, best_mask, best_j = MISSING, 0, 0
+    for mask in range(1, full + 1):
+        if mask.bit_count() != half:
+            continue
+        row = dp[mask]
+        rest = full ^ mask
+        for j, bit in indexed_bits:
+            if mask & bit:
+                total = row[j] + dp[rest | bit][j]
+                if total < best_total:
+                    best_total, best_mask, best_j = total, mask, j
+    if best_total == MISSING:
+        return nearest_neighbor_route(graph, start_id, stops)
+
+    first_half = _backtrack(dp, columns, bits, best_mask, best_j)
+    second_half = _backtrack(dp, columns, bits, (full ^ best_mask) | bits[best_j], best_j)
+    second_half.pop()
+    second_half.reverse()
+    return [stops[j] for j in first_half + second_half]
+
+
+def _backtrack(dp, columns, bits, mask, last):
+    """
+    Recovers the stop order of the path dp[mask][last], start stop first.
+    """
+    order = [last]
+    while mask & (mask - 1):
+        prev_mask = mask ^ bits[last]
+        prev_row = dp[prev_mask]
+        column = columns[last]
+        last = min(compress(range(len(bits)), (prev_mask & b for b in bits)),
+                   key=lambda k: prev_row[k] + column[k])
+        order.append(last)
+        mask = prev_mask
+    order.reverse()
+    return order
+
+
+def benchmark(pkg_table, graph, trucks):
+    """
+    Prints greedy versus exact mileage, late packages and solve time for
+    each loaded truck. Both tours are scored with a RouteEvaluator, so the
+    trucks and packages are left as they were.
+    """
+    from routing import group_stops
+    from route_cost import RouteEvaluator, stop_deadlines
+
+    hub_id = graph.get_address_id("HUB")
+    print("----- Held-Karp Benchmark -----")
+    greedy_total = exact_total = 0.0
+    for number, truck in enumerate(trucks, start=1):
+        stop_ids, _, _ = group_stops(graph, truck.get_loaded_packages())
+
+        greedy_route = nearest_neighbor_route(graph, hub_id, stop_ids)
+        started = time.perf_counter()
+        exact_route = held_karp_route(graph, hub_id, stop_ids)
+        elapsed = time.perf_counter() - started
+
+        evaluator = RouteEvaluator(graph, stop_deadlines(graph, truck.get_loaded_packages()),
+                                   hub_id, speed_mph=truck.get_speed())
+        greedy = evaluator.evaluate(truck.get_current_time(), greedy_route)
+        exact = evaluator.evaluate(truck.get_current_time(), exact_route)
+        greedy_total += greedy.miles
+        exact_total += exact.miles
+        print(f"Truck {number}: {len(stop_ids)} stops, "
+              f"greedy {greedy.miles:.2f} miles ({len(greedy.late)} late), "
+              f"exact {exact.miles:.2f} miles ({len(exact.late)} late), "
+              f"solved in {elapsed * 1000:.1f} ms")
+    print(f"Total: greedy {greedy_total:.2f} miles, exact {exact_total:.2f} miles")
+
+
+if __name__ == "__main__":
+    from main import load_packages_from_csv, load_distances_from_csv, load_trucks
+    from distance_graph import DistanceGraph
+    from package_hash_table import PackageHashTable
+
+    table = PackageHashTable()
+    distance_graph = DistanceGraph()
+    load_packages_from_csv("WGUPS_Package_File.csv", table)
+    load_distances_from_csv("WGUPS_Distance_Table.csv", distance_graph)
+    fleet = [Truck(), Truck(), Truck()]
+    load_trucks(table, fleet)
+    benchmark(table, distance_graph, fleet)
@@ -0,0 +1,221 @@
+"""
+Instrumentation.py
+Runtime metrics that cost nothing while switched off.
+
+enable() swaps counting wrappers onto DistanceGraph.get_distance and
+get_distance_by_id, and disable() puts the original methods back, so a
+normal run executes exactly the uninstrumented code. Each lookup is
+counted once, by the outermost counted method: the get_distance_by_id
+call inside get_distance is not counted again, and a get_distance miss
+includes addresses the graph does not know. Stage timers hand out
+a shared no-op context while disabled. Address normalization is counted
+from the lru_cache statistics it already keeps.
+
+Results can be exported as JSON or in the Prometheus text format:
+
+    WGUPS_METRICS=prometheus python main.py
+"""
+import json
+import time
+from contextlib import nullcontext
+
+from distance_graph import DistanceGraph, MISSING
+from address_normalizer import cache_info
+
+# Counting wrappers are installed for these methods on every class that
+# defines them
+COUNTED_METHODS = ("get_distance", "get_distance_by_id")
+
+_NO_STAGE = nullcontext()
+
+
+class Metrics:
+    """
+    Collects stage timings, call counters and per-truck figures.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}    # { name -> [wall seconds, cpu seconds, runs] }
+        self.counters = {}  # { name -> int }
+        self.trucks = []    # [{...}] one dict per truck, see record_fleet
+        self._originals = []
+        self._depth = [0]   # counted calls in progress, shared by the wrappers
+        self._normalize_base = 0
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.reset()
+        for cls in _classes_defining(DistanceGraph, COUNTED_METHODS):
+            for name in COUNTED_METHODS:
+                if name in cls.__dict__:
+                    original = cls.__dict__[name]
+                    self._originals.append((cls, name, original))
+                    setattr(cls, name, self._counting(name, original))
+
+    def disable(self):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        self.enabled = False
+
+    def reset(self):
+        self.stages = {}
+        # Cleared in place, the installed wrappers hold this dict
+        self.counters.clear()
+        for name in COUNTED_METHODS:
+            for kind in ("calls", "hits", "misses"):
+                self.counters[f"{name}_{kind}"] = 0
+        self.trucks = []
+        info = cache_info()
+        self._normalize_base = info.hits + info.misses
+
+    def stage(self, name):
+        """
+        Context manager timing one pipeline stage (wall and CPU seconds).
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return _StageTimer(self, name)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_fleet(self, simulator):
+        """
+        Stores stops, miles, idle time at the HUB and deadline slack for
+        every truck of a finished FleetSimulator run.
+
+        Slack is deadline minus delivery time; the minimum per truck shows
+        how close it came to being late (negative means late).
+        """
+        if not self.enabled:
+            return
+        slack = [[] for _ in simulator.trucks]
+        for package_id, truck_index in simulator.truck_of.items():
+            pkg = simulator.pkg_table.get_package(package_id)
+            if pkg is not None and pkg.get_delivery_time() is not None:
+                slack[truck_index].append(pkg.get_deadline_seconds() - pkg.get_delivery_time())
+        self.trucks = []
+        for index, truck in enumerate(simulator.trucks):
+            departed = simulator.get_departure_time(index)
+            self.trucks.append({
+                "truck": index + 1,
+                "stops": len(simulator.routes[index]),
+                "miles": round(truck.get_mileage(), 2),
+                "idle_seconds": None if departed is None else departed - simulator.start_time,
+                "min_slack_seconds": min(slack[index]) if slack[index] else None,
+                "late_packages": sum(1 for value in slack[index] if value < 0),
+            })
+
+    def snapshot(self):
+        """
+        All metrics as one dict.
+        """
+        info = cache_info()
+        counters = dict(self.counters)
+        counters["clean_address_calls"] = info.hits + info.misses - self._normalize_base
+        return {
+            "stages": {name: {"wall_seconds": wall, "cpu_seconds": cpu, "runs": runs}
+                       for name, (wall, cpu, runs) in self.stages.items()},
+            "counters": counters,
+            "trucks": self.trucks,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        data = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        stages = data["stages"]
+        family("wgups_stage_wall_seconds", "gauge", "Wall time spent in a pipeline stage.",
+               [({"stage": name}, s["wall_seconds"]) for name, s in stages.items()])
+        family("wgups_stage_cpu_seconds", "gauge", "CPU time spent in a pipeline stage.",
+               [({"stage": name}, s["cpu_seconds"]) for name, s in stages.items()])
+        for name, value in sorted(data["counters"].items()):
+            family(f"wgups_{name}_total", "counter", f"Count of {name.replace('_', ' ')}.",
+                   [({}, value)])
+        truck_fields = (("stops", "Stops on the truck's route."),
+                        ("miles", "Miles driven by the truck."),
+                        ("idle_seconds", "Seconds the truck waited at the HUB."),
+                        ("min_slack_seconds", "Smallest deadline slack on the truck."),
+                        ("late_packages", "Packages delivered after their deadline."))
+        for field, help_text in truck_fields:
+            family(f"wgups_truck_{field}", "gauge", help_text,
+                   [({"truck": t["truck"]}, t[field]) for t in data["trucks"]
+                    if t[field] is not None])
+        return "\n".join(lines) + "\n"
+
+    def _counting(self, name, original):
+        counters = self.counters
+        depth = self._depth
+        calls, hits, misses = f"{name}_calls", f"{name}_hits", f"{name}_misses"
+        miss_value = MISSING if name == "get_distance_by_id" else -1.0
+
+        def counted(graph, first, second):
+            if depth[0]:
+                # Inside another counted lookup, which counts this one
+                return original(graph, first, second)
+            depth[0] += 1
+            try:
+                distance = original(graph, first, second)
+            finally:
+                depth[0] -= 1
+            counters[calls] = counters.get(calls, 0) + 1
+            if distance == miss_value:
+                counters[misses] = counters.get(misses, 0) + 1
+            else:
+                counters[hits] = counters.get(hits, 0) + 1
+            return distance
+
+        counted.__wrapped__ = original
+        counted.__doc__ = original.__doc__
+        return counted
+
+
+class _StageTimer:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        totals = self.metrics.stages.setdefault(self.name, [0.0, 0.0, 0])
+        totals[0] += time.perf_counter() - self.wall
+        totals[1] += time.process_time() - self.cpu
+        totals[2] += 1
+        return False
+
+
+def _classes_defining(base, names):
+    found, pending = [], [base]
+    while pending:
+        cls = pending.pop()
+        if any(name in cls.__dict__ for name in names):
+            found.append(cls)
+        pending.extend(cls.__subclasses__())
+    return found
+
+
+# Shared instance used by main() and the other modules
+metrics = Metrics()
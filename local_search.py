@@ -0,0 +1,304 @@
+"""
+LocalSearch.py
+2-opt and Or-opt improvement of a planned route.
+
+Moves are only tried toward each stop's nearest neighbors among the other
+stops on the route (candidate lists) and stops whose surroundings have not
+changed are skipped with don't-look bits, so a pass over the route costs
+close to O(s * k) instead of O(s^2). Candidate lists are the DistanceGraph
+neighbor lists (built once per graph) filtered to the route, made when a
+stop is first searched; only a stop with too few neighbors on the route
+scans the route for its own.
+
+Given deadlines, a move is only made if every stop is still reached in
+time: 2-opt reversals are checked in O(1) on a RoutePlan (can_reverse),
+Or-opt moves by driving the moved route once, O(s), only when one would
+shorten the tour.
+"""
+import heapq
+import time
+from collections import deque
+
+from distance_graph import MISSING
+from route_plan import NO_DEADLINE, RoutePlan
+from truck import Truck
+
+# Candidate list size per stop
+DEFAULT_NEIGHBORS = 8
+# Graph neighbor lists filtered for the candidates; a stop keeping fewer
+# than half of DEFAULT_NEIGHBORS of them scans the route instead
+GRAPH_NEIGHBORS = 16
+# Default wall-clock budget for one improve_route call, in seconds
+DEFAULT_TIME_BUDGET = 1.0
+# Longest segment moved by an Or-opt move
+OR_OPT_MAX_SEGMENT = 3
+# Gains below this are treated as rounding noise
+EPSILON = 1e-9
+
+
+def improve_route(graph, start_id, route, time_budget=DEFAULT_TIME_BUDGET,
+                  neighbors=DEFAULT_NEIGHBORS, deadlines=None, start_time=0.0, speed_mph=None):
+    """
+    Returns a copy of route (ordered stop IDs, start_id excluded) improved
+    with 2-opt and Or-opt moves until no move helps or time_budget seconds
+    have passed. The tour is closed: it starts and ends at start_id.
+
+    deadlines, if given, maps stop IDs to the time (seconds) they must be
+    reached by, leaving start_id at start_time at speed_mph; moves that
+    would make a stop late are skipped. A route that already misses a
+    deadline is returned as is (see RoutePlan.repair_deadlines).
+    """
+    stops = [stop_id for stop_id in dict.fromkeys(route) if stop_id != start_id]
+    tour = [start_id] + stops
+    if len(tour) < 5:
+        return list(route)
+
+    timing = None
+    if deadlines is not None:
+        timing = (deadlines, start_time, speed_mph)
+        plan = RoutePlan(graph, start_id, stops, start_time, start_id,
+                         [deadlines.get(stop_id, NO_DEADLINE) for stop_id in stops], speed_mph)
+        if not plan.is_feasible():
+            return list(route)
+
+    search = _TourSearch(graph, tour, neighbors, timing)
+    search.run(time.perf_counter() + time_budget)
+
+    # Rotate so the tour starts at start_id again; keep a delivery at the HUB first
+    improved = search.tour
+    hub_pos = search.pos[start_id]
+    improved = improved[hub_pos + 1:] + improved[:hub_pos]
+    if start_id in route:
+        improved.insert(0, start_id)
+    return improved
+
+
+class _CandidateLists(dict):
+    """
+    { node -> its k nearest other nodes of the tour, nearest first }, each
+    list made on first lookup. The graph's neighbor lists are filtered to
+    the tour; a node left with fewer than k / 2 (a route over a few
+    addresses of a large graph) gets the k nearest from a scan of the tour.
+    Big O: O(K) per node for K graph neighbors, O(s log k) when scanned.
+    """
+
+    def __init__(self, graph, tour, k):
+        super().__init__()
+        self.graph = graph
+        self.tour = tour
+        self.nodes = set(tour)
+        self.k = k
+        self.graph_lists = graph.get_neighbor_lists(max(k, GRAPH_NEIGHBORS))
+
+    def __missing__(self, node):
+        nodes = self.nodes
+        nearest = [other for other in self.graph_lists[node] if other in nodes][:self.k]
+        if len(nearest) * 2 < min(self.k, len(nodes) - 1):
+            dist = self.graph.get_distance_by_id
+            row = [(dist(node, other), other) for other in self.tour if other != node]
+            nearest = [other for distance, other in heapq.nsmallest(self.k, row)
+                       if distance != MISSING]
+        self[node] = nearest
+        return nearest
+
+
+class _TourSearch:
+    """
+    Closed tour stored as a list plus a position lookup, with the
+    don't-look-bit queue shared by the 2-opt and Or-opt moves.
+
+    With timing, (deadlines, start time, speed) for a route driven from
+    tour[0] in list order, that order is kept: a 2-opt move reverses the
+    side of the tour without tour[0], and self.plan is the RoutePlan of
+    the current route, rebuilt after every move.
+    """
+
+    def __init__(self, graph, tour, neighbors, timing=None):
+        self.graph = graph
+        self.dist = graph.get_distance_by_id
+        self.hub = tour[0]
+        self.timing = timing
+        self.plan = None
+        self.tour = tour
+        self.pos = {node: i for i, node in enumerate(tour)}
+        self.candidates = _CandidateLists(graph, tour, neighbors)
+        self.queue = deque(tour)
+        self.active = set(tour)
+        self._replan()
+
+    def succ(self, node):
+        return self.tour[(self.pos[node] + 1) % len(self.tour)]
+
+    def pred(self, node):
+        return self.tour[self.pos[node] - 1]
+
+    def run(self, deadline):
+        """
+        Processes active nodes until none can be improved or time runs out.
+        """
+        checks = 0
+        while self.queue:
+            checks += 1
+            if checks % 64 == 0 and time.perf_counter() > deadline:
+                return
+            node = self.queue.popleft()
+            self.active.discard(node)
+            if not self._try_two_opt(node):
+                self._try_or_opt(node)
+
+    def _wake(self, *nodes):
+        for node in nodes:
+            if node not in self.active:
+                self.active.add(node)
+                self.queue.append(node)
+
+    def _try_two_opt(self, a):
+        """
+        Replaces edges (a, succ a) and (c, succ c) with (a, c) and
+        (succ a, succ c), or the mirror move on the predecessor side.
+        """
+        dist = self.dist
+        for forward in (True, False):
+            b = self.succ(a) if forward else self.pred(a)
+            d_ab = dist(a, b)
+            for c in self.candidates[a]:
+                g1 = d_ab - dist(a, c)
+                if g1 <= EPSILON:
+                    break  # candidates are sorted, nothing closer remains
+                d = self.succ(c) if forward else self.pred(c)
+                if c == b or d == a:
+                    continue
+                gain = g1 + dist(c, d) - dist(b, d)
+                if gain > EPSILON:
+                    first, last = (b, c) if forward else (c, b)
+                    if self.plan is not None:
+                        segment = self._segment_on_time(first, last)
+                        if segment is None:
+                            continue
+                        self._reverse(*segment, shorter=False)
+                        self._replan()
+                    else:
+                        self._reverse(self.pos[first], self.pos[last])
+                    self._wake(a, b, c, d)
+                    return True
+        return False
+
+    def _segment_on_time(self, first, last):
+        """
+        Tour positions (i, j) to reverse for the 2-opt move reversing first
+        to last, or None if it would make a stop late. When first..last
+        holds the hub the other side of the tour is reversed, which gives
+        the same tour, still driven from the hub in list order.
+        """
+        n = len(self.tour)
+        pos = self.pos
+        start, end = pos[first], pos[last]
+        if (pos[self.hub] - start) % n <= (end - start) % n:
+            start, end = (end + 1) % n, (start - 1) % n
+        hub_pos = pos[self.hub]
+        i, j = (start - hub_pos - 1) % n, (end - hub_pos - 1) % n
+        if not self.plan.can_reverse(i, j):
+            return None
+        return start, end
+
+    def _try_or_opt(self, a):
+        """
+        Moves the segment of 1..OR_OPT_MAX_SEGMENT stops starting at a next
+        to a candidate of either segment end, in either orientation.
+        """
+        dist = self.dist
+        n = len(self.tour)
+        segment = [a]
+        while len(segment) <= OR_OPT_MAX_SEGMENT and len(segment) + 3 <= n:
+            first, last = segment[0], segment[-1]
+            p, q = self.pred(first), self.succ(last)
+            removal_gain = dist(p, first) + dist(last, q) - dist(p, q)
+            inside = set(segment)
+            for end in (first, last) if len(segment) > 1 else (first,):
+                other = last if end == first else first
+                for c in self.candidates[end]:
+                    if dist(end, c) >= removal_gain:
+                        break  # candidates are sorted, no cheaper link remains
+                    if c in inside:
+                        continue
+                    # Neighbors of c once the segment has been taken out
+                    c_next = q if c == p else self.succ(c)
+                    c_prev = p if c == q else self.pred(c)
+                    # New edges (u, x) and (y, v) with the segment placed between u and v
+                    for u, v, x, y in ((c, c_next, end, other), (c_prev, c, other, end)):
+                        added = dist(u, x) + dist(y, v) - dist(u, v)
+                        if removal_gain - added > EPSILON:
+                            moved = self._moved_tour(segment, u, x == first)
+                            if self.plan is not None and not self._on_time(moved):
+                                continue
+                            self.tour = moved
+                            self.pos = {node: i for i, node in enumerate(moved)}
+                            self._replan()
+                            self._wake(p, q, u, v, first, last)
+                            return True
+            segment.append(q)
+        return False
+
+    def _reverse(self, i, j, shorter=True):
+        """
+        Reverses tour positions i..j (cyclic). Unless shorter is False, the
+        complementary segment is reversed instead when it is shorter, which
+        gives the same tour driven the other way round.
+        """
+        tour, pos = self.tour, self.pos
+        n = len(tour)
+        length = (j - i) % n + 1
+        if shorter and length * 2 > n:
+            i, j = (j + 1) % n, (i - 1) % n
+            length = n - length
+        for _ in range(length // 2):
+            tour[i], tour[j] = tour[j], tour[i]
+            pos[tour[i]] = i
+            pos[tour[j]] = j
+            i = (i + 1) % n
+            j = (j - 1) % n
+
+    def _moved_tour(self, segment, after, keep_order):
+        """
+        The tour with segment taken out and reinserted directly after node
+        `after`, reversed unless keep_order is set. O(s) per move.
+        """
+        inside = set(segment)
+        start = self.pos[self.succ(segment[-1])]
+        n = len(self.tour)
+        rest = [self.tour[(start + t) % n] for t in range(n)]
+        rest = [node for node in rest if node not in inside]
+        insert_at = rest.index(after) + 1
+        placed = segment if keep_order else segment[::-1]
+        return rest[:insert_at] + placed + rest[insert_at:]
+
+    def _route(self, tour):
+        """
+        The stops of tour in driving order, from the one after the hub.
+        """
+        hub_pos = tour.index(self.hub) if tour is not self.tour else self.pos[self.hub]
+        return tour[hub_pos + 1:] + tour[:hub_pos]
+
+    def _on_time(self, tour):
+        """
+        True if driving tour from the hub reaches every stop by its deadline.
+        """
+        deadlines, start_time, speed_mph = self.timing
+        dist = self.dist
+        miles, here = 0.0, self.hub
+        for stop_id in self._route(tour):
+            miles += dist(here, stop_id)
+            if start_time + Truck.travel_seconds(miles, speed_mph) > deadlines.get(stop_id,
+                                                                                   NO_DEADLINE):
+                return False
+            here = stop_id
+        return True
+
+    def _replan(self):
+        if self.timing is None:
+            return
+        deadlines, start_time, speed_mph = self.timing
+        stops = self._route(self.tour)
+        self.plan = RoutePlan(self.graph, self.hub, stops, start_time, self.hub,
+                              [deadlines.get(stop_id, NO_DEADLINE) for stop_id in stops],
+                              speed_mph)
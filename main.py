@@ -8,90 +8,146 @@ WGUPS Delivery System.
 Part 2, updated app.py to become main.py , added SID
 """
 import csv
+import os
 from package_hash_table import PackageHashTable
 from package import Package
-from distance_graph import DistanceGraph
+from distance_graph import TriangularDistanceGraph
 from truck import Truck
+from clock import SECONDS_PER_MINUTE, format_time, parse_time
+from routing import group_stops, nearest_neighbor_route
+from held_karp import held_karp_route
+from local_search import improve_route
+from fleet_planner import departure_times, plan_fleet
+from simulation import FleetSimulator
+from dataset_snapshot import load_dataset
+from address_normalizer import normalize_address
+from package_ingest import load_packages
+from package_constraints import ConstraintIndex
+from metric_closure import close_distances
+from instrumentation import metrics
+from trace_sink import TraceSink, TRACE_START, DRIVE, DELIVER, STOP_DONE, NO_ROUTE, \
+    RETURN, RETURNED
+
+NUM_TRUCKS = 3   # Trucks available at the HUB
+NUM_DRIVERS = 2  # Drivers, each drives one truck at a time
+
+# Replace listed distances with shortest-path distances (see metric_closure.py)
+# before routing, the table has legs longer than going through a third stop.
+# Tables over metric_closure.MAX_STDLIB_ADDRESSES are only closed with NumPy
+CLOSE_DISTANCES = True
+
+# Set to "json" or "prometheus" to collect metrics and print them at the
+# end of the run (or write them to METRICS_FILE_ENV if that is set)
+METRICS_ENV = "WGUPS_METRICS"
+METRICS_FILE_ENV = "WGUPS_METRICS_FILE"
+
+# Addresses corrected during the day: (package ID, address, time known)
+ADDRESS_CORRECTIONS = [
+    (9, "410 S State St", "10:20"),
+]
 
 def main():
+    metrics_format = os.environ.get(METRICS_ENV)
+    if metrics_format:
+        metrics.enable()
+
     print("Booting WGUPS Delivery System..", end="")
 
     # Initialize data structures
     pkg_table = PackageHashTable()
-    graph = DistanceGraph()
+    graph = TriangularDistanceGraph()
 
     print("..Done")
 
-    # Load packages from CSV
-    print("Loading Packages..", end="")
-    load_packages_from_csv("WGUPS_Package_File.csv", pkg_table)
+    # Load packages and distances, from the compiled snapshot when the
+    # CSV files have not changed since it was built
+    print("Loading Packages and Distance Matrix..", end="")
+    with metrics.stage("load"):
+        load_dataset("WGUPS_Distance_Table.csv", "WGUPS_Package_File.csv", graph, pkg_table,
+                     load_distances_from_csv, load_packages_from_csv)
+    if CLOSE_DISTANCES:
+        with metrics.stage("metric_closure"):
+            close_distances(graph)
     print("..Done")
 
-    # Load distances from CSV
-    print("Loading Distance Matrix..", end="")
-    load_distances_from_csv("WGUPS_Distance_Table.csv", graph)
-    print("..Done")
+    # Compile the special notes once: groups, truck-only, delays, corrections
+    with metrics.stage("constraints"):
+        constraints = ConstraintIndex.from_packages(pkg_table.get_all_packages())
+        for package_id, address, known_at in ADDRESS_CORRECTIONS:
+            constraints.add_correction(package_id, address, known_at)
 
     # Initialize trucks
-    truck1 = Truck()
-    truck2 = Truck()
-    truck3 = Truck()
-
-    # Load packages into trucks
-    load_trucks(pkg_table, truck1, truck2, truck3)
-
-    # Deliver packages on truck1 and truck2
+    fleet = [Truck() for _ in range(NUM_TRUCKS)]
+
+    # Load packages into trucks. The first truck leaves at 08:00 and one
+    # waits for each later time held packages become ready (09:05 delayed
+    # flight, 10:20 address correction); any others leave when a driver is back
+    depart_times = departure_times(constraints, len(fleet))
+    with metrics.stage("plan_fleet"):
+        plan_fleet(pkg_table, graph, fleet, constraints=constraints, depart_times=depart_times)
+    for number, truck in enumerate(fleet, start=1):
+        print(f"Truck{number} loaded with {len(truck.get_loaded_packages())} packages.")
+
+    # Run the day: the first NUM_DRIVERS trucks leave at 08:00, every later
+    # truck leaves as soon as a driver is back at the HUB.
     # Trace is enabled on Truck 1, will print its route onto the Terminal
-    deliver_all_packages(truck1, pkg_table, graph, trace=True)
-    deliver_all_packages(truck2, pkg_table, graph)
-
-    # Let truck3 leave once truck1 or truck2 is done, whichever is earlier
-    if time_to_minutes(truck1.get_current_time()) < time_to_minutes(truck2.get_current_time()):
-        truck3.set_current_time(truck1.get_current_time())
+    simulator = FleetSimulator(pkg_table, graph, fleet, NUM_DRIVERS,
+                               plan_route=ROUTE_PLANNERS["batched"], trace_trucks=(0,),
+                               constraints=constraints)
+    with metrics.stage("simulate"):
+        simulator.run()
+    metrics.record_fleet(simulator)
+    for number in range(NUM_DRIVERS + 1, len(fleet) + 1):
+        print(f"Truck{number} departs at {format_time(simulator.get_departure_time(number - 1))}")
+
+    with metrics.stage("report"):
+        # Display final statuses
+        pkg_table.display_all_packages()
+
+        # Display summary for trucks
+        lines = ["----- Truck Summary -----"]
+        total_miles = 0.0
+        for number, truck in enumerate(fleet, start=1):
+            lines.append(f"Truck {number} mileage: {truck.get_mileage():.2f} miles, "
+                         f"Returned to HUB at: {format_time(truck.get_current_time())}")
+            total_miles += truck.get_mileage()
+        lines.append(f"Total Miles driven by Trucks: {total_miles:.2f} miles")
+        print("\n".join(lines))
+
+    if metrics_format:
+        export_metrics(metrics_format, os.environ.get(METRICS_FILE_ENV))
+        metrics.disable()
+
+
+def export_metrics(metrics_format, path=None):
+    """
+    Prints the collected metrics as "json" or "prometheus" text, or
+    writes them to path.
+    """
+    text = metrics.to_prometheus() if metrics_format == "prometheus" else metrics.to_json()
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
     else:
-        truck3.set_current_time(truck2.get_current_time())
+        print(text)
 
-    print(f"Truck3 departs at {truck3.get_current_time()}")
-    deliver_all_packages(truck3, pkg_table, graph)
 
-    # Display final statuses
-    pkg_table.display_all_packages()
-
-    # Display summary for trucks
-    print("----- Truck Summary -----")
-    print(f"Truck 1 mileage: {truck1.get_mileage():.2f} miles, Returned to HUB at: {truck1.get_current_time()}")
-    print(f"Truck 2 mileage: {truck2.get_mileage():.2f} miles, Returned to HUB at: {truck2.get_current_time()}")
-    print(f"Truck 3 mileage: {truck3.get_mileage():.2f} miles, Returned to HUB at: {truck3.get_current_time()}")
-    total_miles = truck1.get_mileage() + truck2.get_mileage() + truck3.get_mileage()
-    print(f"Total Miles driven by Trucks: {total_miles:.2f} miles")
-
-
-def load_trucks(pkg_table, truck1, truck2, truck3):
+def load_trucks(pkg_table, trucks):
     """
-    Loads packages into the three trucks (first two are active;
-    third is staged until a driver is free).
+    Loads packages into the trucks first-fit in deadline order, without
+    regard to geography. plan_fleet in fleet_planner.py replaces this for
+    main(); it is kept as the simple baseline.
     """
-    all_packages = []
     loaded_ids = set()
+    constraints = ConstraintIndex.from_packages(pkg_table.get_all_packages())
 
-    # Gather all packages from the table
-    # Big O: n to check all packages in the table
-    for package_id in range(1, pkg_table.size() + 1):
-        pkg = pkg_table.get_package(package_id)
-        if pkg:
-            all_packages.append(pkg)
+    # Gather the packages still at the hub from the status index
+    # Big O: k for the k packages at the hub
+    all_packages = pkg_table.find_by_status("At hub")
 
-    # Sort packages by earliest deadline first with EOD considered last
-    def deadline_sort_key(pkg):
-        d = pkg.get_deadline()
-        if d == "EOD":
-            return 999999 #arbitrarily large number
-        return time_to_minutes(d)
-
-
-    #Big O :  O(n log n) to sort all packages by deadline
+    #Big O :  O(n log n) to sort all packages by deadline, EOD sorts last
     # This is the most expensive operation in this function
-    all_packages.sort(key=deadline_sort_key)
+    all_packages.sort(key=lambda pkg: (pkg.get_deadline_seconds(), pkg.get_package_id()))
 
     # Fill trucks in order, grouping if needed
     for pkg in all_packages:
@@ -99,28 +155,25 @@ def load_trucks(pkg_table, truck1, truck2, truck3):
             continue
 
         target_truck = None
-        if len(truck1.get_loaded_packages()) < Truck.MAX_CAPACITY:
-            target_truck = truck1
-        elif len(truck2.get_loaded_packages()) < Truck.MAX_CAPACITY:
-            target_truck = truck2
-        elif len(truck3.get_loaded_packages()) < Truck.MAX_CAPACITY:
-            target_truck = truck3
-        else:
+        for truck in trucks:
+            if len(truck.get_loaded_packages()) < truck.get_capacity():
+                target_truck = truck
+                break
+        if target_truck is None:
             print("All trucks full, cannot load more at this time.")
             break
 
-        # Check if this package has to be grouped with others
-        group_with = pkg.get_group_with()
-        if group_with:
+        # Check if this package has to be grouped with others (transitively)
+        if constraints.in_group(pkg.get_package_id()):
             # Attempt to load the entire group
             group = [pkg]
-            for group_id in group_with:
+            for group_id in constraints.get_group(pkg.get_package_id()):
                 other = pkg_table.get_package(group_id)
-                if other and (other.get_package_id() not in loaded_ids):
+                if other and other is not pkg and (group_id not in loaded_ids):
                     group.append(other)
 
             # Only load group if there's capacity
-            if len(target_truck.get_loaded_packages()) + len(group) <= Truck.MAX_CAPACITY:
+            if len(target_truck.get_loaded_packages()) + len(group) <= target_truck.get_capacity():
                 for p in group:
                     target_truck.load_package(p)
                     loaded_ids.add(p.get_package_id())
@@ -130,9 +183,8 @@ def load_trucks(pkg_table, truck1, truck2, truck3):
             target_truck.load_package(pkg)
             loaded_ids.add(pkg.get_package_id())
 
-    print(f"Truck1 loaded with {len(truck1.get_loaded_packages())} packages.")
-    print(f"Truck2 loaded with {len(truck2.get_loaded_packages())} packages.")
-    print(f"Truck3 loaded with {len(truck3.get_loaded_packages())} packages (waiting for driver).")
+    for number, truck in enumerate(trucks, start=1):
+        print(f"Truck{number} loaded with {len(truck.get_loaded_packages())} packages.")
 
 
 def load_distances_from_csv(filename, graph):
@@ -157,14 +209,14 @@ def load_distances_from_csv(filename, graph):
             for row_i, row in enumerate(rows[1:], start=1):
                 if not row:
                     continue
-                from_location = clean_address(row[0])
+                from_location = normalize_address(row[0])
                 #Big O: d
                 for col_i in range(1, len(row)):
                     dist_str = row[col_i].strip()
                     if dist_str:
                         try:
                             distance_val = float(dist_str)
-                            to_location = clean_address(addresses[col_i - 1])
+                            to_location = normalize_address(addresses[col_i - 1])
                             graph.add_distance(from_location, to_location, distance_val)
                         except ValueError:
                             print(f"Invalid number at row {row_i}, column {col_i}: {dist_str}")
@@ -175,88 +227,154 @@ def load_distances_from_csv(filename, graph):
 def load_packages_from_csv(filename, pkg_table):
     """
     Reads WGUPS_Package_File.csv lines and creates Package objects,
-    storing them into the PackageHashTable. Expects columns in this order:
-        ID, Address, City, State, Zip, Deadline, Weight, SpecialNote
-    skips header rows if needed.
+    storing them into the PackageHashTable. Columns are matched by the
+    header row (ID, Address, City, State, Zip, Deadline, Weight, SpecialNote),
+    rows before it are skipped and bad rows are reported and skipped. A file
+    without that header raises ValueError, so no empty snapshot is written.
 
-    O(n) to read row by row per package.
+    O(n) to read row by row per package, streamed in batches
+    (see package_ingest.py).
     """
     try:
-        with open(filename, "r", newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            line_num = 0
-            # Big-O O(n) to read row by row per package
-            for row in reader:
-                line_num += 1
-                if line_num <= 8:
-                    continue
-
-                package_id = int(row[0].strip())
-                address = clean_address(row[1].strip())
-                city = row[2].strip()
-                state = row[3].strip()
-                zip_code = row[4].strip()
-                deadline = row[5].strip()
-                weight = float(row[6].strip())
-                special_note = row[7].strip() if len(row) > 7 else ""
-
-                pkg = Package(package_id, address, city, state,
-                              zip_code, deadline, weight, special_note)
-                pkg_table.add_package(pkg)
+        load_packages(filename, pkg_table)
     except FileNotFoundError:
         print(f"Package CSV file not found: {filename}")
-    except ValueError as e:
-        print(f"Error parsing CSV data: {str(e)}")
 
 
-#non polymorphic method, uses python default value to make input 4 optional.
-def deliver_all_packages(truck, pkg_table, graph, trace=False):
+# Route planners for deliver_all_packages, keyed by engine name.
+# Each takes (graph, start_id, stop_ids) and returns the ordered stop IDs.
+ROUTE_PLANNERS = {
+    "batched": nearest_neighbor_route,
+    "held_karp": held_karp_route,
+}
+
+
+#non polymorphic method, uses python default value to make inputs 4 and 5 optional.
+def deliver_all_packages(truck, pkg_table, graph, trace=False, engine="nearest",
+                         improve=False, sink=None):
     """
     Delivers all packages loaded onto a truck using nearest-neighbor logic.
     Then sends the truck back to the HUB.
+
+    engine selects how the next stop is chosen:
+    - "nearest": scan the truck's packages one by one (find_nearest_package)
+    - "batched": group packages by address and pick each next stop with one
+      min() over a distance matrix row, delivering every package for that
+      address in a single stop. Produces the same route as "nearest".
+    - "held_karp": group packages by address and drive the provably
+      shortest HUB -> stops -> HUB tour (see held_karp.py).
+
+    improve runs 2-opt / Or-opt local search (see local_search.py) over the
+    planned route before driving it, never making a package late that the
+    route delivered on time; "nearest" is planned as "batched" then.
+
+    With trace, every step is recorded into sink (a TraceSink, see
+    trace_sink.py); without a sink the trace is printed to stdout.
     """
-    if trace:
-        print("----- Delivery Trace -----")
-        print("Truck starting at HUB\n")
+    owns_sink = trace and sink is None
+    if owns_sink:
+        sink = TraceSink.to_stdout()
+    record = sink.record if trace else None
+    if record:
+        record(TRACE_START)
 
+    if improve and engine not in ROUTE_PLANNERS:
+        engine = "batched"
+
+    truck.depart()
+
+    if engine in ROUTE_PLANNERS:
+        _deliver_planned(truck, pkg_table, graph, record, ROUTE_PLANNERS[engine], improve)
+    else:
+        _deliver_nearest(truck, pkg_table, graph, record)
+
+    # Return to HUB after finishing
+    distance_back = graph.get_distance(truck.get_current_location(), "HUB")
+    if record:
+        record(RETURN, from_address=truck.get_current_location(), miles=distance_back)
+
+    truck.go_home(distance_back)
+
+    if record:
+        record(RETURNED, at_time=truck.get_current_time(), miles=truck.get_mileage())
+    if owns_sink:
+        sink.close()
+
+
+def _deliver_nearest(truck, pkg_table, graph, record):
+    """
+    Original delivery loop, one find_nearest_package scan per package.
+    record is the trace sink's record method, or None when not tracing.
+
+    Big O: O(n^2) get_distance calls for n packages.
+    """
     # While truck still has packages
     while truck.get_loaded_packages():
         next_pkg = find_nearest_package(truck, graph)
         if not next_pkg:
-            if trace:
-                print(f"No valid package found from {truck.get_current_location()}")
+            if record:
+                record(NO_ROUTE, from_address=truck.get_current_location())
             break
 
-        distance = graph.get_distance(
-            clean_address(truck.get_current_location()),
-            clean_address(next_pkg.get_address())
-        )
-        if trace:
-            print(f"Driving from '{truck.get_current_location()}' "
-                  f"to '{next_pkg.get_address()}' [{distance:.2f} miles]")
+        distance = graph.get_distance(truck.get_current_location(),
+                                      next_pkg.get_address())
+        if record:
+            record(DRIVE, None, truck.get_current_location(), next_pkg.get_address(), distance)
 
         truck.deliver_package(next_pkg, distance)
         pkg_table.update_package_status(next_pkg.get_package_id(),
                                         "Delivered", truck.get_current_time())
 
-        if trace:
-            print(f"Delivered Package #{next_pkg.get_package_id()} at {truck.get_current_time()}")
-            print(f"Truck mileage: {truck.get_mileage():.2f} miles\n")
+        if record:
+            record(DELIVER, at_time=truck.get_current_time(), package_id=next_pkg.get_package_id())
+            record(STOP_DONE, miles=truck.get_mileage())
 
-    # Return to HUB after finishing
-    distance_back = graph.get_distance(
-        clean_address(truck.get_current_location()),
-        "HUB"
-    )
-    if trace:
-        print(f"Returning from '{truck.get_current_location()}' to HUB [{distance_back:.2f} miles]")
 
-    truck.go_home(distance_back)
+def _deliver_planned(truck, pkg_table, graph, record, plan_route, improve=False):
+    """
+    Plans the whole route over address IDs first with plan_route, optionally
+    improves it with local search, then drives it.
+
+    Big O: the planner's cost over s distinct stops, plus O(n) deliveries
+    for n packages.
+    """
+    stop_ids, packages_by_stop, unroutable = group_stops(graph, truck.get_loaded_packages())
+    start_id = graph.get_address_id(truck.get_current_location())
+    route = plan_route(graph, start_id, stop_ids) if start_id >= 0 else []
+    if improve and route:
+        deadlines = {stop_id: min(pkg.get_deadline_seconds() for pkg in packages_by_stop[stop_id])
+                     for stop_id in route}
+        route = improve_route(graph, start_id, route, deadlines=deadlines,
+                              start_time=truck.get_current_time(), speed_mph=truck.get_speed())
+    _drive_route(truck, pkg_table, graph, route, packages_by_stop, record)
 
-    if trace:
-        print(f"Truck returned to HUB at {truck.get_current_time()}, "
-              f"Total mileage: {truck.get_mileage():.2f} miles")
-        print("--------------------------\n")
+    if record and (unroutable or len(route) < len(stop_ids)):
+        record(NO_ROUTE, from_address=truck.get_current_location())
+
+
+def _drive_route(truck, pkg_table, graph, route, packages_by_stop, record):
+    """
+    Drives the truck through an ordered list of stop IDs, delivering every
+    package for a stop on arrival.
+    """
+    current_id = graph.get_address_id(truck.get_current_location())
+    for stop_id in route:
+        distance = graph.get_distance_by_id(current_id, stop_id)
+        if record:
+            record(DRIVE, None, truck.get_current_location(), graph.get_address(stop_id), distance)
+
+        for pkg in packages_by_stop[stop_id]:
+            truck.deliver_package(pkg, distance)
+            pkg_table.update_package_status(pkg.get_package_id(),
+                                            "Delivered", truck.get_current_time())
+            if record:
+                record(DELIVER, at_time=truck.get_current_time(), package_id=pkg.get_package_id())
+            # Remaining packages for this stop are dropped off without driving
+            distance = 0.0
+
+        if record:
+            record(STOP_DONE, miles=truck.get_mileage())
+        current_id = stop_id
 
 
 def find_nearest_package(truck, graph):
@@ -270,11 +388,10 @@ def find_nearest_package(truck, graph):
     # Big O: d to check all distances in the graph
 
     # Big O: n * d to check all packages in the truck and all distances in the graph  
+    # Addresses were normalized when the CSVs were read, so they are compared as is
+    current_location = truck.get_current_location()
     for pkg in truck.get_loaded_packages():
-        distance = graph.get_distance(
-            clean_address(truck.get_current_location()),
-            clean_address(pkg.get_address())
-        )
+        distance = graph.get_distance(current_location, pkg.get_address())
         if distance >= 0 and distance < min_distance:
             min_distance = distance
             nearest_pkg = pkg
@@ -288,16 +405,9 @@ def clean_address(raw):
     - Removes surrounding quotes
     - Removes parentheses
     - Strips whitespace
+    Kept for callers outside the loaders; see address_normalizer.py.
     """
-    if not raw:
-        return ""
-    raw = raw.replace('"', '').strip()
-    # Optionally remove anything inside parentheses
-    import re
-    raw = re.sub(r"\(.*?\)", "", raw).strip()
-    # Normalize multiple spaces
-    raw = re.sub(r"\s+", " ", raw)
-    return raw
+    return normalize_address(raw)
 
 
 def parse_complex_line(line):
@@ -324,31 +434,10 @@ def parse_complex_line(line):
 def time_to_minutes(time_str):
     """
     Converts 'HH:MM' or 'HH:MM AM/PM' to integer minutes.
-    EOD => a large number.
+    EOD => end of day. Times are parsed by clock.parse_time; packages and
+    trucks already carry parsed seconds, so routing code does not call this.
     """
-    if time_str.upper() == "EOD":
-        return 999999  #arbitrarily large number
-
-    time_str = time_str.strip().upper()
-
-    # If no AM/PM
-    if ("AM" not in time_str) and ("PM" not in time_str):
-        hr, mn = time_str.split(":")
-        return int(hr) * 60 + int(mn)
-
-    # If there's AM/PM
-    parts = time_str.split()
-    if len(parts) != 2:
-        raise ValueError(f"Invalid time format: {time_str}")
-    hh_mm, period = parts
-    hr, mn = hh_mm.split(":")
-    hr = int(hr)
-    mn = int(mn)
-
-    if period == "PM" and hr != 12: hr += 12
-    if period == "AM" and hr == 12: hr = 0
-
-    return hr * 60 + mn
+    return int(parse_time(time_str) // SECONDS_PER_MINUTE)
 
 
 if __name__ == "__main__":
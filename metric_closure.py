@@ -0,0 +1,240 @@
+"""
+MetricClosure.py
+Shortest-path closure of the distance table.
+
+The table in WGUPS_Distance_Table.csv does not always obey the triangle
+inequality: some listed distances are longer than driving through a third
+address. close_distances runs Floyd-Warshall over the graph and writes the
+shortest distances back, so every router works on a true metric, and keeps
+a next-hop table so the actual streets driven can be listed with path().
+
+Each pivot is processed a row at a time with C-level map() calls over
+array('d') rows, skipping rows the pivot cannot improve. If NumPy happens
+to be installed, each pivot is one broadcast minimum over the whole matrix
+instead. The result is kept on the graph (graph.metric_closure) and on disk
+next to the dataset snapshot, keyed by a hash of the raw distances, so it
+is computed once per distance table.
+
+Without NumPy the closure is cubic in the number of addresses (about 5 s
+at 400), so tables larger than MAX_STDLIB_ADDRESSES are left as listed
+unless a closure for them is already cached. A skipped closure is printed
+as a warning and counted in the metrics (metric_closure_skipped).
+"""
+import hashlib
+import json
+import os
+from array import array
+from itertools import chain, compress
+from operator import gt
+
+from distance_graph import MISSING
+from dataset_snapshot import DEFAULT_SNAPSHOT_DIR
+from instrumentation import metrics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CLOSURE_VERSION = 1
+CLOSURE_MANIFEST_FILE = "closure.json"
+CLOSURE_MATRIX_FILE = "closure.f64"
+CLOSURE_NEXT_HOP_FILE = "closure_next.i32"
+
+# Stored in the next-hop table when there is no path
+NO_PATH = -1
+
+# Largest table closed without NumPy when no cached closure exists
+MAX_STDLIB_ADDRESSES = 200
+
+
+class MetricClosure:
+    """
+    All-pairs shortest distances and next hops over a graph's address IDs.
+
+    distances and next_hop are row-major size x size arrays: distances[i *
+    size + j] is the shortest distance from i to j, next_hop[i * size + j]
+    the first address after i on that path (NO_PATH if there is none).
+    """
+
+    def __init__(self, size, distances, next_hop, improved=0):
+        self.size = size
+        self.distances = distances
+        self.next_hop = next_hop
+        self.improved = improved  # (from, to) pairs the closure shortened
+
+    def get_distance(self, from_id, to_id):
+        return self.distances[from_id * self.size + to_id]
+
+    def path(self, from_id, to_id):
+        """
+        Address IDs driven from from_id to to_id, both included, or [] if
+        to_id cannot be reached. Big O: O(length of the path).
+        """
+        if self.next_hop[from_id * self.size + to_id] == NO_PATH:
+            return []
+        path = [from_id]
+        while from_id != to_id:
+            from_id = self.next_hop[from_id * self.size + to_id]
+            path.append(from_id)
+        return path
+
+
+def close_distances(graph, cache_dir=DEFAULT_SNAPSHOT_DIR, max_size=MAX_STDLIB_ADDRESSES):
+    """
+    Replaces the graph's distances with shortest-path distances and returns
+    the MetricClosure. A closure cached on the graph or in cache_dir for
+    the same distances is reused. cache_dir=None disables the disk cache.
+
+    Without NumPy, a graph of more than max_size addresses with no cached
+    closure is left unchanged, a warning is printed and None is returned;
+    max_size=None lifts the limit.
+
+    Big O: O(d^3) for d addresses the first time, O(d^2) from the cache.
+    """
+    closure = graph.metric_closure
+    if closure is not None and closure.size == graph.size():
+        return closure
+
+    size = graph.size()
+    key = _matrix_key(graph)
+    closure = _read_cached(cache_dir, key, size) if cache_dir else None
+    if closure is None:
+        if numpy is None and max_size is not None and size > max_size:
+            print(f"Distance table of {size} addresses not closed: over {max_size} needs "
+                  f"NumPy or a cached closure, routing on the listed distances.")
+            metrics.count("metric_closure_skipped")
+            return None
+        rows = [graph.get_row(address_id) for address_id in range(size)]
+        if numpy is not None:
+            closure = _floyd_warshall_numpy(rows)
+        else:
+            closure = _floyd_warshall_rows(rows)
+        closure.improved = sum(map(gt, chain.from_iterable(rows), closure.distances))
+        if cache_dir:
+            try:
+                _write_cached(cache_dir, key, closure)
+            except OSError as e:
+                print(f"Could not cache distance closure: {e}")
+
+    graph.load_matrix(graph.addresses, closure.distances)
+    graph.metric_closure = closure
+    return closure
+
+
+def _floyd_warshall_rows(rows):
+    """
+    Floyd-Warshall over the rows of a symmetric matrix.
+
+    For pivot k only the part of row i right of the diagonal is compared
+    (one map() over list slices), and each shorter distance is mirrored
+    into row j, which halves the work. Row i can only improve where
+    d(i, k) + d(k, j) < d(i, j), so it is skipped when d(i, k) plus the
+    shortest edge out of k is already no less than the longest distance in
+    row i (MISSING counts as the longest, it can always improve).
+    """
+    size = len(rows)
+    rows = [row.tolist() for row in rows]
+    next_hop = [[j if dist != MISSING else NO_PATH for j, dist in enumerate(row)]
+                for row in rows]
+    row_max = [max(row, default=0.0) for row in rows]
+    for k in range(size):
+        row_k = rows[k]
+        shortest_out = min(row_k[:k] + row_k[k + 1:], default=MISSING)
+        for i in range(size - 1):
+            row_i = rows[i]
+            d_ik = row_i[k]
+            if i == k or d_ik == MISSING or d_ik + shortest_out >= row_max[i]:
+                continue
+            first = i + 1
+            better = list(compress(range(first, size),
+                                   map(gt, row_i[first:], map(d_ik.__add__, row_k[first:]))))
+            if not better:
+                continue
+            next_i = next_hop[i]
+            hop = next_i[k]
+            for j in better:
+                row_i[j] = rows[j][i] = d_ik + row_k[j]
+                next_i[j] = hop
+                next_hop[j][i] = next_hop[j][k]
+            # Rows j only got shorter, their old maximum is still a bound
+            row_max[i] = max(row_i)
+
+    distances = array("d")
+    hops = array("i")
+    for row, next_row in zip(rows, next_hop):
+        distances.extend(row)
+        hops.extend(next_row)
+    return MetricClosure(size, distances, hops)
+
+
+def _floyd_warshall_numpy(rows):
+    """
+    Floyd-Warshall with one broadcast minimum over the matrix per pivot,
+    written into preallocated buffers.
+    """
+    size = len(rows)
+    dist = numpy.frombuffer(b"".join(row.tobytes() for row in rows),
+                            dtype=numpy.float64).reshape(size, size).copy()
+    hops = numpy.where(numpy.isinf(dist), NO_PATH,
+                       numpy.arange(size, dtype=numpy.int32)[numpy.newaxis, :]).astype(numpy.int32)
+    candidate = numpy.empty_like(dist)
+    better = numpy.empty(dist.shape, dtype=bool)
+    for k in range(size):
+        numpy.add(dist[:, k, numpy.newaxis], dist[numpy.newaxis, k, :], out=candidate)
+        numpy.less(candidate, dist, out=better)
+        if better.any():
+            numpy.copyto(dist, candidate, where=better)
+            numpy.copyto(hops, hops[:, k, numpy.newaxis], where=better)
+    distances = array("d", dist.tobytes())
+    next_hop = array("i", hops.tobytes())
+    return MetricClosure(size, distances, next_hop)
+
+
+def _matrix_key(graph):
+    """
+    Hash of the graph's distances as it stores them, read without copying.
+    """
+    digest = hashlib.sha256(graph.MATRIX_LAYOUT.encode("ascii"))
+    for block in graph.stored_matrix():
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_cached(cache_dir, key, size):
+    try:
+        with open(os.path.join(cache_dir, CLOSURE_MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest.get("version") != CLOSURE_VERSION or manifest.get("key") != key
+                or manifest.get("size") != size):
+            return None
+        distances = array("d")
+        next_hop = array("i")
+        with open(os.path.join(cache_dir, CLOSURE_MATRIX_FILE), "rb") as f:
+            distances.frombytes(f.read())
+        with open(os.path.join(cache_dir, CLOSURE_NEXT_HOP_FILE), "rb") as f:
+            next_hop.frombytes(f.read())
+    except (OSError, ValueError):
+        return None
+    if len(distances) != size * size or len(next_hop) != size * size:
+        return None
+    return MetricClosure(size, distances, next_hop, manifest.get("improved", 0))
+
+
+def _write_cached(cache_dir, key, closure):
+    """
+    Writes the closure files, then the manifest, so a half-written cache is
+    never read back.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, CLOSURE_MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    with open(os.path.join(cache_dir, CLOSURE_MATRIX_FILE), "wb") as f:
+        f.write(closure.distances.tobytes())
+    with open(os.path.join(cache_dir, CLOSURE_NEXT_HOP_FILE), "wb") as f:
+        f.write(closure.next_hop.tobytes())
+    manifest = {"version": CLOSURE_VERSION, "key": key, "size": closure.size,
+                "improved": closure.improved}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
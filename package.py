@@ -3,12 +3,19 @@ Package.py
 
 :author Taylor Ketterling 3/21/2025
 """
+from clock import format_time, parse_time
+from package_constraints import parse_group_with
 
 class Package:
     """
     Manages package delivery details in the WGUPS network.
     """
 
+    # Fixed attribute set, no per-instance __dict__
+    __slots__ = ("package_id", "address", "city", "state", "zip", "deadline",
+                 "deadline_seconds", "weight", "status", "delivery_time",
+                 "special_note", "group_with", "observer")
+
     def __init__(self, package_id, address, city, state,
                  zip_code, deadline, weight, special_note):
         """
@@ -19,7 +26,8 @@ class Package:
         :param city: city (str)
         :param state: state abbreviation (str)
         :param zip_code: zip code (str)
-        :param deadline: string representing delivery deadline ("EOD" or "HH:MM AM/PM")
+        :param deadline: string representing delivery deadline ("EOD" or "HH:MM AM/PM"),
+                         also parsed once into seconds since midnight
         :param weight: package weight in kg (float)
         :param special_note: any special instructions or constraints (str)
         """
@@ -29,23 +37,17 @@ class Package:
         self.state = state
         self.zip = zip_code
         self.deadline = deadline
+        self.deadline_seconds = parse_time(deadline)
         self.weight = weight
         self.status = "At hub"
-        self.delivery_time = "N/A"
+        self.delivery_time = None  # seconds since midnight once delivered
         self.special_note = special_note
+        # Table notified of status and address changes (see PackageHashTable)
+        self.observer = None
 
         # If the package must be delivered with specific other packages, store their IDs
-        self.group_with = []
-        if "Must be delivered with" in special_note:
-            # Try to parse out additional package IDs
-            parts = special_note.split("with")
-            if len(parts) > 1:
-                # remove non-digits & commas, then split by comma
-                possible_ids = parts[1].replace("[^0-9,]", "").split(",")
-                for pid in possible_ids:
-                    pid_clean = ''.join(ch for ch in pid if ch.isdigit())
-                    if pid_clean:
-                        self.group_with.append(int(pid_clean))
+        # (see package_constraints.py for the full constraint index)
+        self.group_with = parse_group_with(special_note)
 
     def get_package_id(self):
         return self.package_id
@@ -65,6 +67,9 @@ class Package:
     def get_deadline(self):
         return self.deadline
 
+    def get_deadline_seconds(self):
+        return self.deadline_seconds
+
     def get_weight(self):
         return self.weight
 
@@ -81,14 +86,25 @@ class Package:
         return self.group_with
 
     def set_address(self, address):
+        old_address = self.address
         self.address = address
+        if self.observer is not None:
+            self.observer.on_address_change(self, old_address)
 
-    def set_status(self, status):
+    def set_status(self, status, at_time=None):
+        """
+        Sets the status; at_time (seconds) is when the change happened and
+        is passed on to the observer for its event log.
+        """
+        old_status = self.status
         self.status = status
+        if self.observer is not None:
+            self.observer.on_status_change(self, old_status, at_time)
 
     def set_delivery_time(self, delivery_time):
         self.delivery_time = delivery_time
 
     def __str__(self):
+        delivered_at = "N/A" if self.delivery_time is None else format_time(self.delivery_time)
         return (f"Package #{self.package_id} to {self.address}, "
-                f"Status: {self.status}, Delivered at: {self.delivery_time}")
+                f"Status: {self.status}, Delivered at: {delivered_at}")
@@ -0,0 +1,292 @@
+"""
+PackageConstraints.py
+Special-note constraints, compiled once into an index.
+
+The notes in the package file are parsed with precompiled patterns when a
+package is added, and the planner then asks the index instead of reading
+notes again:
+- "Must be delivered with A, B": packages joined in a union-find, so groups
+  are transitive (13 with 15 and 15 with 19 puts 13, 15 and 19 together)
+- "Can only be on truck N": the truck the package (and its group) must use
+- "Delayed ... until HH:MM": the time the package reaches the hub
+- "Wrong address listed": held until a correction is registered with
+  add_correction, and only ships once the correction is known
+Packages that reach the hub during the day without a note are registered
+with add_arrival.
+"""
+import re
+
+from clock import parse_time
+from address_normalizer import normalize_address
+
+_GROUP_NOTE = re.compile(r"must be delivered with\s+(.*)", re.IGNORECASE)
+_PACKAGE_IDS = re.compile(r"\d+")
+_TRUCK_NOTE = re.compile(r"can only be on truck\s+(\d+)", re.IGNORECASE)
+_DELAY_NOTE = re.compile(r"delayed\b.*?\buntil\s+(\d{1,2}:\d{2}(?:\s*[ap]m)?)", re.IGNORECASE)
+_WRONG_ADDRESS_NOTE = re.compile(r"wrong address", re.IGNORECASE)
+
+# Ready time of a package with no delay
+AVAILABLE_AT_START = 0.0
+
+
+def parse_group_with(special_note):
+    """
+    Package IDs listed in a "Must be delivered with" note, or [].
+    """
+    match = _GROUP_NOTE.search(special_note) if special_note else None
+    if match is None:
+        return []
+    return [int(package_id) for package_id in _PACKAGE_IDS.findall(match.group(1))]
+
+
+class UnionFind:
+    """
+    Disjoint sets over arbitrary hashable keys, with union by size and
+    path halving. find and union are O(alpha(n)) amortized.
+
+    Each root also keeps the list of its members, merged smaller into
+    larger, so listing a component costs O(size of the component).
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.members = {}  # { root -> [key, ...] }
+
+    def add(self, key):
+        if key not in self.parent:
+            self.parent[key] = key
+            self.members[key] = [key]
+
+    def find(self, key):
+        parent = self.parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(self, a, b):
+        """
+        Joins the sets of a and b. Returns (root, absorbed_root), or None
+        if they were already in the same set.
+        """
+        self.add(a)
+        self.add(b)
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return None
+        if len(self.members[root_a]) < len(self.members[root_b]):
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.members[root_a].extend(self.members.pop(root_b))
+        return root_a, root_b
+
+    def component(self, key):
+        if key not in self.parent:
+            return [key]
+        return self.members[self.find(key)]
+
+
+class ConstraintIndex:
+    """
+    Per-package and per-group constraints compiled from special notes.
+
+    Group level answers (truck, ready time) are kept on the union-find
+    root and merged on every union, so every query is a find plus a dict
+    lookup.
+    """
+
+    def __init__(self):
+        self.groups = UnionFind()
+        self.required_truck = {}     # { package_id -> truck number, 1-based }
+        self.available_at = {}       # { package_id -> seconds }
+        self.wrong_address = set()   # package IDs waiting for a correction
+        self.corrections = {}        # { package_id -> (address, seconds) }
+        # Aggregates per union-find root, only for grouped packages
+        self.group_truck = {}
+        self.group_available = {}
+
+    @classmethod
+    def from_packages(cls, packages):
+        index = cls()
+        for pkg in packages:
+            index.add_package(pkg)
+        return index
+
+    def add_package(self, pkg):
+        """
+        Compiles one package's note into the index.
+        Big O: O(L) for a note of length L, plus O(alpha(n)) per group link.
+        """
+        package_id = pkg.get_package_id()
+        note = pkg.get_special_note()
+        if not note:
+            return
+
+        match = _TRUCK_NOTE.search(note)
+        if match:
+            self.required_truck[package_id] = int(match.group(1))
+        match = _DELAY_NOTE.search(note)
+        if match:
+            self.available_at[package_id] = parse_time(match.group(1))
+        if _WRONG_ADDRESS_NOTE.search(note):
+            self.wrong_address.add(package_id)
+
+        group_with = pkg.get_group_with() or parse_group_with(note)
+        if group_with:
+            self._join(package_id, package_id)
+            for other_id in group_with:
+                self._join(package_id, other_id)
+        elif package_id in self.groups.parent:
+            # Linked into a group by an earlier package's note
+            self._merge_own(package_id)
+
+    def add_correction(self, package_id, address, at_time):
+        """
+        Registers the corrected address for a "Wrong address listed"
+        package, known from at_time (seconds or "HH:MM") on.
+        """
+        if isinstance(at_time, str):
+            at_time = parse_time(at_time)
+        self.corrections[package_id] = (normalize_address(address), at_time)
+        if package_id in self.groups.parent:
+            root = self.groups.find(package_id)
+            available = AVAILABLE_AT_START
+            for member in self.groups.members[root]:
+                available = _merge_available(available, self._own_available(member))
+            self.group_available[root] = available
+
+    def add_arrival(self, package_id, at_time):
+        """
+        Registers that the package only reaches the hub at at_time (seconds
+        or "HH:MM"), like a "Delayed ... until" note. A later delay already
+        known is kept.
+        """
+        if isinstance(at_time, str):
+            at_time = parse_time(at_time)
+        self.available_at[package_id] = max(self.available_at.get(package_id, AVAILABLE_AT_START),
+                                            at_time)
+        if package_id in self.groups.parent:
+            self._merge_own(package_id)
+
+    def get_group(self, package_id):
+        """
+        IDs of every package that must travel with package_id, itself
+        included. O(alpha(n)) plus the size of the group.
+        """
+        return self.groups.component(package_id)
+
+    def get_group_id(self, package_id):
+        """
+        A key shared by every package in package_id's group. O(alpha(n)).
+        """
+        if package_id in self.groups.parent:
+            return self.groups.find(package_id)
+        return package_id
+
+    def in_group(self, package_id):
+        return package_id in self.groups.parent and len(self.get_group(package_id)) > 1
+
+    def same_group(self, a, b):
+        if a not in self.groups.parent or b not in self.groups.parent:
+            return a == b
+        return self.groups.find(a) == self.groups.find(b)
+
+    def get_required_truck(self, package_id):
+        """
+        Truck number (1-based) the package's group must ride on, or None.
+        """
+        if package_id in self.groups.parent:
+            return self.group_truck.get(self.groups.find(package_id))
+        return self.required_truck.get(package_id)
+
+    def get_available_time(self, package_id):
+        """
+        Seconds since midnight from which the package (and its whole
+        group) can leave the hub. A wrong-address package is available once
+        its correction is known; without one it never is (None).
+        """
+        if package_id in self.groups.parent:
+            return self.group_available.get(self.groups.find(package_id), AVAILABLE_AT_START)
+        return self._own_available(package_id)
+
+    def get_ready_times(self):
+        """
+        Sorted distinct times (seconds) at which held packages become ready
+        to leave: delayed arrivals and known address corrections.
+        Big O: O(h log h) for h delayed or wrong-address packages.
+        """
+        ready = (self._own_available(package_id)
+                 for package_id in self.available_at.keys() | self.wrong_address)
+        return sorted({at_time for at_time in ready if at_time is not None})
+
+    def get_correction(self, package_id):
+        """
+        (address, seconds) for a corrected package, or None.
+        """
+        return self.corrections.get(package_id)
+
+    def apply_corrections(self, packages, at_time):
+        """
+        Sets the corrected address on every package in packages whose
+        correction is known by at_time. Returns the packages changed.
+        """
+        changed = []
+        for pkg in packages:
+            correction = self.corrections.get(pkg.get_package_id())
+            if correction and correction[1] <= at_time and pkg.get_address() != correction[0]:
+                pkg.set_address(correction[0])
+                changed.append(pkg)
+        return changed
+
+    def _own_available(self, package_id):
+        available = self.available_at.get(package_id, AVAILABLE_AT_START)
+        if package_id in self.wrong_address:
+            correction = self.corrections.get(package_id)
+            if correction is None:
+                return None
+            available = max(available, correction[1])
+        return available
+
+    def _merge_own(self, package_id):
+        """
+        Merges a grouped package's own truck and ready time into its root.
+        They may have been compiled after an earlier package linked it into
+        the group, when the root only knew the defaults.
+        """
+        root = self.groups.find(package_id)
+        self.group_truck[root] = _merge_truck(self.group_truck[root],
+                                              self.required_truck.get(package_id), package_id)
+        self.group_available[root] = _merge_available(self.group_available[root],
+                                                      self._own_available(package_id))
+
+    def _join(self, a, b):
+        for package_id in (a, b):
+            if package_id not in self.groups.parent:
+                self.groups.add(package_id)
+                self.group_truck[package_id] = self.required_truck.get(package_id)
+                self.group_available[package_id] = self._own_available(package_id)
+        self._merge_own(a)
+
+        merged = self.groups.union(a, b)
+        if merged is None:
+            return
+        root, absorbed = merged
+        self.group_truck[root] = _merge_truck(self.group_truck[root],
+                                              self.group_truck.pop(absorbed), a)
+        self.group_available[root] = _merge_available(self.group_available[root],
+                                                      self.group_available.pop(absorbed))
+
+
+def _merge_truck(truck, other, package_id):
+    if truck is None:
+        return other
+    if other is not None and other != truck:
+        print(f"Package #{package_id} is grouped across trucks {truck} and {other}, "
+              f"keeping truck {truck}.")
+    return truck
+
+
+def _merge_available(available, other):
+    if available is None or other is None:
+        return None
+    return max(available, other)
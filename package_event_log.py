@@ -0,0 +1,124 @@
+"""
+PackageEventLog.py
+Append-only, time-ordered log of package status changes.
+
+Answers "what was the status of package P at time T" in O(log k) for a
+package with k events, and streams a full-table snapshot at any time
+without rerunning the simulation.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class PackageEventLog:
+    """
+    Keeps every status change twice: once in the global log, sorted by
+    time, and once in a per-package list used for point lookups.
+    """
+
+    def __init__(self):
+        # Global log, parallel columns sorted by time
+        self.times = array("d")
+        self.package_ids = array("q")
+        self.statuses = []
+        # { int(package_id) -> (array of times, [status, ...]) }
+        self.by_package = {}
+
+    def record(self, package_id, status, at_time):
+        """
+        Records that package_id changed to status at at_time (seconds).
+        Events usually arrive in time order and are appended; an older
+        event is inserted at its sorted position instead.
+        """
+        if not self.times or at_time >= self.times[-1]:
+            self.times.append(at_time)
+            self.package_ids.append(package_id)
+            self.statuses.append(status)
+        else:
+            position = bisect_right(self.times, at_time)
+            self.times.insert(position, at_time)
+            self.package_ids.insert(position, package_id)
+            self.statuses.insert(position, status)
+
+        entry = self.by_package.get(package_id)
+        if entry is None:
+            entry = self.by_package[package_id] = (array("d"), [])
+        times, statuses = entry
+        if not times or at_time >= times[-1]:
+            times.append(at_time)
+            statuses.append(status)
+        else:
+            position = bisect_right(times, at_time)
+            times.insert(position, at_time)
+            statuses.insert(position, status)
+
+    def discard(self, package_id, status):
+        """
+        Removes package_id's events with status from both logs, so they can
+        be recorded again at new times. Returns how many were removed.
+
+        Big O: O(k) for k events on this package, plus O(log n) to find
+        each removed event among the n in the global log and the shift of
+        the arrays after it.
+        """
+        entry = self.by_package.get(package_id)
+        if entry is None:
+            return 0
+        times, statuses = entry
+        removed = 0
+        for position in range(len(statuses) - 1, -1, -1):
+            if statuses[position] != status:
+                continue
+            at_time = times[position]
+            del times[position]
+            del statuses[position]
+            removed += 1
+            for index in range(bisect_left(self.times, at_time), bisect_right(self.times, at_time)):
+                if self.package_ids[index] == package_id and self.statuses[index] == status:
+                    del self.times[index]
+                    del self.package_ids[index]
+                    del self.statuses[index]
+                    break
+        return removed
+
+    def status_at(self, package_id, at_time):
+        """
+        Returns (status, since) for the package at at_time, where since is
+        when that status was recorded, or (None, None) if the package had
+        no recorded status yet.
+
+        Big O: O(log k) for k events on this package.
+        """
+        entry = self.by_package.get(package_id)
+        if entry is None:
+            return None, None
+        times, statuses = entry
+        position = bisect_right(times, at_time) - 1
+        if position < 0:
+            return None, None
+        return statuses[position], times[position]
+
+    def snapshot_at(self, at_time):
+        """
+        Yields (package_id, status, since) for every package known at
+        at_time, one package at a time.
+
+        Big O: O(p log k) for p packages, O(1) extra memory.
+        """
+        for package_id in self.by_package:
+            status, since = self.status_at(package_id, at_time)
+            if status is not None:
+                yield package_id, status, since
+
+    def events_between(self, start, end):
+        """
+        Yields (time, package_id, status) for events with start <= time < end.
+        """
+        low = 0 if start is None else bisect_left(self.times, start)
+        for position in range(low, len(self.times)):
+            if end is not None and self.times[position] >= end:
+                break
+            yield self.times[position], self.package_ids[position], self.statuses[position]
+
+    def size(self):
+        return len(self.times)
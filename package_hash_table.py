@@ -2,32 +2,213 @@
 PackageHashTable.py
 Transcribed from the Java 'PackageHashTable' class.
 """
+from bisect import bisect_left, insort
+
 from package import Package
+from package_event_log import PackageEventLog
+from clock import format_time
+from address_normalizer import normalize_address
+
+# Time at which packages added without a time are logged as present
+START_OF_DAY = 0.0
 
 class PackageHashTable:
     """
     A simple hash table that stores Package objects by their package_id.
+
+    Secondary indexes on address, city, zip, status and deadline are kept
+    up to date on every add and on every status or address change, so
+    lookups by those fields do not scan the table. Packages notify the
+    table of changes through Package.observer.
+
+    Every timed status change is also appended to event_log, so the table
+    can answer what any package's status was at an earlier time.
     """
 
     def __init__(self):
         self.packages = {}  # { int(package_id) -> Package }
 
-    def add_package(self, pkg):
-        self.packages[pkg.get_package_id()] = pkg
+        # Secondary indexes: { value -> set(package_id) }
+        self.by_address = {}
+        self.by_city = {}
+        self.by_zip = {}
+        self.by_status = {}
+        self.by_deadline = {}    # { deadline seconds -> set(package_id) }
+        self.deadline_keys = []  # sorted distinct deadlines in by_deadline
+
+        self.event_log = PackageEventLog()
+
+    def add_package(self, pkg, at_time=START_OF_DAY):
+        """
+        Adds or replaces a package and indexes it. Its current status is
+        logged as of at_time, by default the start of the day.
+        Big O: O(1), plus O(log d) when a new distinct deadline appears.
+        """
+        package_id = pkg.get_package_id()
+        old = self.packages.get(package_id)
+        if old is not None:
+            self._unindex(old)
+            old.observer = None
+        self.packages[package_id] = pkg
+        pkg.observer = self
+        self._index(pkg)
+        self.event_log.record(package_id, pkg.get_status(), at_time)
+
+    def add_packages(self, packages, at_time=START_OF_DAY):
+        """
+        Adds a batch of packages. Same result as add_package on each, but
+        the sorted deadline list is rebuilt once for the batch instead of
+        being kept sorted package by package.
+        Big O: O(b) for b packages, plus O(d log d) for d distinct deadlines.
+        """
+        for pkg in packages:
+            package_id = pkg.get_package_id()
+            old = self.packages.get(package_id)
+            if old is not None:
+                self._unindex(old, sort_keys=False)
+                old.observer = None
+            self.packages[package_id] = pkg
+            pkg.observer = self
+            self._index(pkg, sort_keys=False)
+            self.event_log.record(package_id, pkg.get_status(), at_time)
+        self.deadline_keys = sorted(self.by_deadline)
 
     def get_package(self, package_id):
         return self.packages.get(package_id)
 
+    def get_all_packages(self):
+        return list(self.packages.values())
+
     def update_package_status(self, package_id, status, delivery_time):
         pkg = self.packages.get(package_id)
         if pkg:
-            pkg.set_status(status)
+            pkg.set_status(status, delivery_time)
             pkg.set_delivery_time(delivery_time)
 
+    def set_address(self, package_id, address):
+        """
+        Corrects a package's address, e.g. after a "Wrong address listed" note.
+        The new address is normalized like the ones read from the CSV.
+        """
+        pkg = self.packages.get(package_id)
+        if pkg:
+            pkg.set_address(normalize_address(address))
+
+    def find_by_address(self, address):
+        return self._lookup(self.by_address, address)
+
+    def find_by_city(self, city):
+        return self._lookup(self.by_city, city)
+
+    def find_by_zip(self, zip_code):
+        return self._lookup(self.by_zip, zip_code)
+
+    def find_by_status(self, status):
+        return self._lookup(self.by_status, status)
+
+    def find_by_deadline(self, start=None, end=None):
+        """
+        Returns packages with start <= deadline < end (seconds since
+        midnight), earliest deadline first. Either bound may be None.
+
+        Big O: O(log d + k) for d distinct deadlines and k packages found.
+        """
+        keys = self.deadline_keys
+        low = 0 if start is None else bisect_left(keys, start)
+        high = len(keys) if end is None else bisect_left(keys, end)
+        found = []
+        for key in keys[low:high]:
+            found.extend(self.packages[package_id] for package_id in self.by_deadline[key])
+        return found
+
+    def get_status_at(self, package_id, at_time):
+        """
+        Returns (status, since) for a package at at_time (seconds), where
+        since is when it entered that status. O(log k) for k changes.
+        """
+        return self.event_log.status_at(package_id, at_time)
+
+    def snapshot_at(self, at_time):
+        """
+        Streams (package_id, status, since) for every package at at_time.
+        """
+        return self.event_log.snapshot_at(at_time)
+
+    def display_packages_at(self, at_time):
+        lines = [f"----- Package Status at {format_time(at_time)} -----"]
+        for package_id, status, since in self.snapshot_at(at_time):
+            pkg = self.packages.get(package_id)
+            address = pkg.get_address() if pkg else "?"
+            lines.append(f"Package #{package_id} to {address}, "
+                         f"Status: {status} since {format_time(since)}")
+        # One write for the whole table instead of one per package
+        print("\n".join(lines))
+
+    def on_status_change(self, pkg, old_status, at_time=None):
+        """
+        Called by Package.set_status. Logs the change when the status
+        actually changed and its time is known. O(1) for in-order changes.
+        """
+        package_id = pkg.get_package_id()
+        _remove(self.by_status, old_status, package_id)
+        self.by_status.setdefault(pkg.get_status(), set()).add(package_id)
+        if at_time is not None and pkg.get_status() != old_status:
+            self.event_log.record(package_id, pkg.get_status(), at_time)
+
+    def on_address_change(self, pkg, old_address):
+        """
+        Called by Package.set_address. O(1).
+        """
+        package_id = pkg.get_package_id()
+        _remove(self.by_address, old_address, package_id)
+        self.by_address.setdefault(pkg.get_address(), set()).add(package_id)
+
+    def _lookup(self, index, value):
+        return [self.packages[package_id] for package_id in index.get(value, ())]
+
+    def _index(self, pkg, sort_keys=True):
+        package_id = pkg.get_package_id()
+        self.by_address.setdefault(pkg.get_address(), set()).add(package_id)
+        self.by_city.setdefault(pkg.get_city(), set()).add(package_id)
+        self.by_zip.setdefault(pkg.get_zip(), set()).add(package_id)
+        self.by_status.setdefault(pkg.get_status(), set()).add(package_id)
+        deadline = pkg.get_deadline_seconds()
+        if deadline not in self.by_deadline:
+            self.by_deadline[deadline] = set()
+            if sort_keys:
+                insort(self.deadline_keys, deadline)
+        self.by_deadline[deadline].add(package_id)
+
+    def _unindex(self, pkg, sort_keys=True):
+        package_id = pkg.get_package_id()
+        _remove(self.by_address, pkg.get_address(), package_id)
+        _remove(self.by_city, pkg.get_city(), package_id)
+        _remove(self.by_zip, pkg.get_zip(), package_id)
+        _remove(self.by_status, pkg.get_status(), package_id)
+        deadline = pkg.get_deadline_seconds()
+        if _remove(self.by_deadline, deadline, package_id) and sort_keys:
+            del self.deadline_keys[bisect_left(self.deadline_keys, deadline)]
+
     def display_all_packages(self):
-        print("----- Package Status -----")
-        for pkg in self.packages.values():
-            print(pkg)
+        lines = ["----- Package Status -----"]
+        lines.extend(map(str, self.packages.values()))
+        # One write for the whole table instead of one per package
+        print("\n".join(lines))
 
     def size(self):
         return len(self.packages)
+
+
+def _remove(index, value, package_id):
+    """
+    Removes package_id from index[value], dropping the entry when it
+    empties. Returns True if the entry was dropped.
+    """
+    ids = index.get(value)
+    if ids is None:
+        return False
+    ids.discard(package_id)
+    if not ids:
+        del index[value]
+        return True
+    return False
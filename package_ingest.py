@@ -0,0 +1,214 @@
+"""
+PackageIngest.py
+Streaming package ingestion.
+
+Rows are read lazily from a CSV or JSON Lines file, turned into Package
+objects and inserted into the package table in batches. Only one batch is
+held in memory at a time, rows that cannot be parsed are handed to a reject
+callback instead of stopping the load, and the caller gets each batch as
+soon as it is inserted, so routing can start before the file is fully read.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+from itertools import islice
+
+from package import Package
+from address_normalizer import normalize_address
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Header names accepted for each Package field, compared after collapsing
+# whitespace and lowercasing (the WGUPS header splits names across lines)
+FIELD_ALIASES = {
+    "package_id": ("package id", "package_id", "id"),
+    "address": ("address",),
+    "city": ("city",),
+    "state": ("state",),
+    "zip": ("zip", "zip code", "zip_code"),
+    "deadline": ("delivery deadline", "deadline"),
+    "weight": ("weight kilo", "weight"),
+    "special_note": ("special notes", "special note", "special_note", "notes"),
+}
+REQUIRED_FIELDS = ("package_id", "address", "deadline", "weight")
+
+# A row that could not be turned into a Package
+Rejected = namedtuple("Rejected", ["line", "row", "reason"])
+
+
+def ingest_packages(filename, pkg_table, batch_size=DEFAULT_BATCH_SIZE,
+                    reader=None, on_reject=None):
+    """
+    Streams packages from filename into pkg_table, batch_size at a time.
+
+    Yields each batch (a list of Package) right after it is inserted, so a
+    caller can plan routes for packages already loaded while the rest of the
+    file is still being read. Iterate to the end to load the whole file.
+
+    :param reader: row reader, picked from the file extension by default
+                   (see READERS)
+    :param on_reject: called with a Rejected for every bad row; by default
+                      the row is reported and skipped
+    """
+    if reader is None:
+        reader = reader_for(filename)
+    if on_reject is None:
+        on_reject = print_reject
+    packages = parse_packages(reader(filename), on_reject)
+    for batch in batched(packages, batch_size):
+        pkg_table.add_packages(batch)
+        yield batch
+
+
+def load_packages(filename, pkg_table, batch_size=DEFAULT_BATCH_SIZE,
+                  reader=None, on_reject=None):
+    """
+    Loads the whole file. Returns the number of packages added.
+    """
+    loaded = 0
+    for batch in ingest_packages(filename, pkg_table, batch_size, reader, on_reject):
+        loaded += len(batch)
+    return loaded
+
+
+def read_csv_rows(filename):
+    """
+    Yields (line_number, {field: text}) for each data row of a CSV file.
+
+    Lines before the header (titles, blank rows) are skipped. The header is
+    the first row that names a package ID and an address column; its column
+    names decide which cell feeds which field. A file without such a row
+    raises ValueError instead of loading nothing.
+    """
+    with open(filename, "r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        columns = None
+        for row in reader:
+            if columns is None:
+                columns = _match_header(row)
+                continue
+            if not any(cell.strip() for cell in row):
+                continue
+            yield reader.line_num, {field: row[i] for field, i in columns.items()
+                                    if i < len(row)}
+    if columns is None:
+        raise ValueError(f"No package header (package ID and address columns) in '{filename}'")
+
+
+def read_jsonl_rows(filename):
+    """
+    Yields (line_number, {field: value}) for each object in a JSON Lines
+    file. Keys may use any name in FIELD_ALIASES. A line that is not valid
+    JSON is yielded as its raw text so it ends up in the reject stream.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_number, line.rstrip("\n")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, record
+                continue
+            fields = {}
+            for key, value in record.items():
+                field = _field_for(key)
+                if field is not None:
+                    fields[field] = value
+            yield line_number, fields
+
+
+# Readers by file extension
+READERS = {
+    ".csv": read_csv_rows,
+    ".jsonl": read_jsonl_rows,
+    ".ndjson": read_jsonl_rows,
+}
+
+
+def reader_for(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"No package reader for '{extension}' files")
+    return READERS[extension]
+
+
+def parse_packages(rows, on_reject):
+    """
+    Turns (line_number, fields) rows into Package objects, passing rows
+    that fail to parse to on_reject.
+    """
+    for line_number, fields in rows:
+        try:
+            yield _to_package(fields)
+        except (ValueError, TypeError, KeyError) as e:
+            on_reject(Rejected(line_number, fields, str(e)))
+
+
+def batched(iterable, size):
+    """
+    Yields lists of up to size items from iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def print_reject(rejected):
+    print(f"Skipping package row at line {rejected.line}: {rejected.reason}")
+
+
+def _to_package(fields):
+    if not isinstance(fields, dict):
+        raise ValueError("not a package record")
+    values = {field: _text(value) for field, value in fields.items()}
+    for field in REQUIRED_FIELDS:
+        if not values.get(field):
+            raise ValueError(f"missing {field}")
+    return Package(int(values["package_id"]),
+                   normalize_address(values["address"]),
+                   values.get("city", ""),
+                   values.get("state", ""),
+                   values.get("zip", ""),
+                   values["deadline"],
+                   float(values["weight"]),
+                   values.get("special_note", ""))
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.strip()
+    return "" if value is None else str(value)
+
+
+def _match_header(row):
+    """
+    Returns {field: column index} if row is the header, else None.
+    """
+    columns = {}
+    for i, cell in enumerate(row):
+        field = _field_for(cell)
+        if field is not None and field not in columns:
+            columns[field] = i
+    if "package_id" in columns and "address" in columns:
+        return columns
+    return None
+
+
+def _field_for(name):
+    name = " ".join(str(name).split()).lower()
+    for field, aliases in FIELD_ALIASES.items():
+        if name in aliases:
+            return field
+    # The WGUPS notes header has page text glued in front of its name
+    for field, aliases in FIELD_ALIASES.items():
+        if name.endswith(aliases[0]):
+            return field
+    return None
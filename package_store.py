@@ -0,0 +1,279 @@
+"""
+PackageStore.py
+Columnar package storage with the same API as PackageHashTable.
+
+Each field lives in its own typed array (struct of arrays) instead of one
+Python object per package, and repeated strings such as cities, zips and
+statuses are stored once and referenced by integer code. get_package
+returns a small PackageView that reads and writes those columns, so Truck
+and the planners work with either table unchanged.
+"""
+from array import array
+from itertools import compress, repeat
+from operator import and_, eq, lt, ne
+
+from package import Package
+from clock import format_time, parse_time
+from address_normalizer import normalize_address
+
+# Status codes stored in the status column
+AT_HUB = 0
+EN_ROUTE = 1
+DELIVERED = 2
+STATUS_NAMES = ["At hub", "En route", "Delivered"]
+
+# Stored in the delivery time column until a package is delivered
+NOT_DELIVERED = float("nan")
+# Package IDs below this bound (or twice the package count) are mapped to
+# rows through a flat array instead of a dict
+DENSE_ID_SLACK = 1024
+
+
+class _StringTable:
+    """
+    Interns strings to small integer codes.
+    """
+
+    def __init__(self, initial=()):
+        self.values = list(initial)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+
+class PackageStore:
+    """
+    Stores packages column by column, indexed by row number.
+    A package's row never changes once it has been added.
+    """
+
+    def __init__(self):
+        self.dense_rows = array("l")   # [ package_id -> row + 1 ], 0 when absent
+        self.sparse_rows = {}          # { int(package_id) -> int(row) } for large IDs
+        self.ids = array("q")
+        self.address_codes = array("i")
+        self.city_codes = array("i")
+        self.state_codes = array("i")
+        self.zip_codes = array("i")
+        self.deadline_codes = array("i")  # original deadline text, for display
+        self.deadline_seconds = array("d")
+        self.weights = array("d")
+        self.statuses = array("b")
+        self.delivery_times = array("d")
+        self.note_codes = array("i")
+        self.group_with = {}           # { int(row) -> [package_id, ...] }, sparse
+
+        self.strings = _StringTable([""])
+        self.status_table = _StringTable(STATUS_NAMES)
+
+    def add_package(self, pkg):
+        """
+        Copies a Package (or PackageView) into the columns.
+        Re-adding a package ID overwrites its row.
+        """
+        strings = self.strings
+        package_id = pkg.get_package_id()
+        row = self._row_of(package_id)
+        values = (
+            (self.address_codes, strings.code(pkg.get_address())),
+            (self.city_codes, strings.code(pkg.get_city())),
+            (self.state_codes, strings.code(pkg.get_state())),
+            (self.zip_codes, strings.code(pkg.get_zip())),
+            (self.deadline_codes, strings.code(pkg.get_deadline())),
+            (self.deadline_seconds, pkg.get_deadline_seconds()),
+            (self.weights, pkg.get_weight()),
+            (self.statuses, self.status_table.code(pkg.get_status())),
+            (self.delivery_times, NOT_DELIVERED if pkg.get_delivery_time() is None
+                                  else pkg.get_delivery_time()),
+            (self.note_codes, strings.code(pkg.get_special_note())),
+        )
+        if row is None:
+            row = len(self.ids)
+            self._set_row(package_id, row)
+            self.ids.append(package_id)
+            for column, value in values:
+                column.append(value)
+        else:
+            for column, value in values:
+                column[row] = value
+        if pkg.get_group_with():
+            self.group_with[row] = list(pkg.get_group_with())
+        else:
+            self.group_with.pop(row, None)
+
+    def add_packages(self, packages):
+        """
+        Adds a batch of packages, see add_package.
+        """
+        for pkg in packages:
+            self.add_package(pkg)
+
+    def _row_of(self, package_id):
+        """
+        Row for a package ID, or None. O(1).
+        """
+        if 0 <= package_id < len(self.dense_rows):
+            row = self.dense_rows[package_id] - 1
+            if row >= 0:
+                return row
+        return self.sparse_rows.get(package_id)
+
+    def _set_row(self, package_id, row):
+        if 0 <= package_id < max(DENSE_ID_SLACK, 2 * len(self.ids)):
+            missing = package_id + 1 - len(self.dense_rows)
+            if missing > 0:
+                # Grow geometrically so sequential IDs cost O(1) amortized
+                self.dense_rows.extend(repeat(0, max(missing, len(self.dense_rows))))
+            self.dense_rows[package_id] = row + 1
+        else:
+            self.sparse_rows[package_id] = row
+
+    def get_package(self, package_id):
+        row = self._row_of(package_id)
+        return None if row is None else PackageView(self, row)
+
+    def get_all_packages(self):
+        return [PackageView(self, row) for row in range(len(self.ids))]
+
+    def find_by_status(self, status):
+        return [PackageView(self, self._row_of(package_id))
+                for package_id in self.select(status=status)]
+
+    def update_package_status(self, package_id, status, delivery_time):
+        row = self._row_of(package_id)
+        if row is not None:
+            self.statuses[row] = self.status_table.code(status)
+            self.delivery_times[row] = NOT_DELIVERED if delivery_time is None else delivery_time
+
+    def set_address(self, package_id, address):
+        row = self._row_of(package_id)
+        if row is not None:
+            self.address_codes[row] = self.strings.code(normalize_address(address))
+
+    def select(self, status=None, exclude_status=None, deadline_before=None):
+        """
+        Returns the IDs of packages matching every given filter, e.g.
+        select(exclude_status="Delivered", deadline_before="10:30 AM").
+
+        Each filter is one pass over a typed column with map/compress, so
+        the scan runs in C without building a Python object per package.
+
+        :param status: keep only packages with this status (str)
+        :param exclude_status: drop packages with this status (str)
+        :param deadline_before: keep deadlines strictly earlier than this
+                                time ("HH:MM AM/PM" or seconds)
+        """
+        mask = None
+        if status is not None:
+            code = self.status_table.codes.get(status, -1)
+            mask = map(eq, self.statuses, repeat(code))
+        if exclude_status is not None:
+            code = self.status_table.codes.get(exclude_status, -1)
+            keep = map(ne, self.statuses, repeat(code))
+            mask = keep if mask is None else map(and_, mask, keep)
+        if deadline_before is not None:
+            if isinstance(deadline_before, str):
+                deadline_before = parse_time(deadline_before)
+            keep = map(lt, self.deadline_seconds, repeat(deadline_before))
+            mask = keep if mask is None else map(and_, mask, keep)
+        if mask is None:
+            return list(self.ids)
+        return list(compress(self.ids, mask))
+
+    def display_all_packages(self):
+        lines = ["----- Package Status -----"]
+        lines.extend(str(PackageView(self, row)) for row in range(len(self.ids)))
+        print("\n".join(lines))
+
+    def size(self):
+        return len(self.ids)
+
+
+class PackageView:
+    """
+    One package in a PackageStore, with the same getters and setters as
+    Package. Views are cheap to create and compare equal by row.
+    """
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __eq__(self, other):
+        return (isinstance(other, PackageView) and other.store is self.store
+                and other.row == self.row)
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    def get_package_id(self):
+        return self.store.ids[self.row]
+
+    def get_address(self):
+        return self.store.strings.values[self.store.address_codes[self.row]]
+
+    def get_city(self):
+        return self.store.strings.values[self.store.city_codes[self.row]]
+
+    def get_state(self):
+        return self.store.strings.values[self.store.state_codes[self.row]]
+
+    def get_zip(self):
+        return self.store.strings.values[self.store.zip_codes[self.row]]
+
+    def get_deadline(self):
+        return self.store.strings.values[self.store.deadline_codes[self.row]]
+
+    def get_deadline_seconds(self):
+        return self.store.deadline_seconds[self.row]
+
+    def get_weight(self):
+        return self.store.weights[self.row]
+
+    def get_status(self):
+        return self.store.status_table.values[self.store.statuses[self.row]]
+
+    def get_delivery_time(self):
+        delivery_time = self.store.delivery_times[self.row]
+        return None if delivery_time != delivery_time else delivery_time  # NaN check
+
+    def get_special_note(self):
+        return self.store.strings.values[self.store.note_codes[self.row]]
+
+    def get_group_with(self):
+        return self.store.group_with.get(self.row, [])
+
+    def set_address(self, address):
+        self.store.address_codes[self.row] = self.store.strings.code(normalize_address(address))
+
+    def set_status(self, status, at_time=None):
+        self.store.statuses[self.row] = self.store.status_table.code(status)
+
+    def set_delivery_time(self, delivery_time):
+        self.store.delivery_times[self.row] = (NOT_DELIVERED if delivery_time is None
+                                               else delivery_time)
+
+    def to_package(self):
+        """
+        Builds a standalone Package with this view's current values.
+        """
+        pkg = Package(self.get_package_id(), self.get_address(), self.get_city(),
+                      self.get_state(), self.get_zip(), self.get_deadline(),
+                      self.get_weight(), self.get_special_note())
+        pkg.set_status(self.get_status())
+        pkg.set_delivery_time(self.get_delivery_time())
+        return pkg
+
+    def __str__(self):
+        delivery_time = self.get_delivery_time()
+        delivered_at = "N/A" if delivery_time is None else format_time(delivery_time)
+        return (f"Package #{self.get_package_id()} to {self.get_address()}, "
+                f"Status: {self.get_status()}, Delivered at: {delivered_at}")
@@ -0,0 +1,623 @@
+"""
+PlanningService.py
+Resident planning daemon answering JSON Lines requests.
+
+Loads the distance table and package file once, plans and simulates the
+day, then serves requests over a Unix socket or stdin/stdout until
+stopped, instead of paying the full start-up for every question:
+
+    python planning_service.py                        # stdin -> stdout
+    python planning_service.py --socket /tmp/wgups.sock
+
+One JSON object per line in, one per line out, matched by "id":
+    {"id": 1, "op": "status_at", "package_id": 9, "time": "10:30"}
+    {"id": 2, "op": "add_package", "package": {"package_id": 41, "address": ...},
+     "time": "11:15"}
+    {"id": 3, "op": "plan_day"}
+    {"id": 4, "op": "replan_truck", "truck": 2, "engine": "held_karp"}
+    {"id": 5, "op": "route_metrics", "truck": 2}
+    {"id": 6, "op": "evaluate_route", "truck": 2, "stops": ["1060 Dalton Ave S", ...],
+     "departs": "09:30"}
+
+A request that fails, for any reason, is answered with "ok": false and
+the service keeps serving. `python planning_service.py --self-check`
+replays a few bad requests to check that.
+
+Status and metric queries are answered from memory on the event loop.
+evaluate_route scores a candidate order of stops for a truck without
+changing the plan, from a cache of recent routes (see route_cost.py), so
+what-if tools can try many orders cheaply.
+Planning runs in a process pool whose workers share the distance matrix
+(see scenario_runner.shared_graph_pool), so queries keep being answered
+while a plan is computed. Responses to planning requests can therefore
+come back after later requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import stat
+import sys
+import time
+from collections import defaultdict
+
+from address_normalizer import normalize_address
+from clock import format_time, parse_time
+from distance_graph import TriangularDistanceGraph
+from package import Package
+from package_hash_table import START_OF_DAY, PackageHashTable
+from package_event_log import PackageEventLog
+from dataset_snapshot import load_dataset
+from metric_closure import close_distances
+from local_search import improve_route
+from route_plan import RoutePlan
+from route_cost import RouteEvaluator
+from truck import Truck
+from scenario_runner import (DISTANCE_CSV, PACKAGE_CSV, Scenario, package_record,
+                             shared_graph_pool, simulate_scenario, worker_graph)
+from main import CLOSE_DISTANCES, ROUTE_PLANNERS, load_distances_from_csv, load_packages_from_csv
+
+# Fields of an add_package request, in Package constructor order
+PACKAGE_FIELDS = ("package_id", "address", "city", "state", "zip", "deadline", "weight",
+                  "special_note")
+
+
+class RequestError(Exception):
+    """
+    A request that cannot be served; its message is sent back to the client.
+    """
+
+
+class PlanningService:
+    """
+    The day's plan and package timelines, kept in memory between requests.
+
+    Every package's status changes are kept in one PackageEventLog, so
+    status_at is a dict lookup and a binary search. plan_day adopts the log
+    of the day it simulated, replan_truck only re-records the deliveries of
+    the truck it re-plans. Planning requests take turns (planning_lock), in
+    the order they arrived, while queries are answered in between.
+    """
+
+    def __init__(self, graph, records, scenario=None, executor=None):
+        """
+        :param records: Package constructor arguments, one list per package
+        :param scenario: fleet parameters for plan_day (a scenario_runner.Scenario)
+        :param executor: pool the planning work runs in; None runs it on the
+                         event loop
+        """
+        self.graph = graph
+        self.scenario = scenario or Scenario("service")
+        self.executor = executor
+        self.records = {}      # { package_id -> record }
+        self.deadlines = {}    # { package_id -> seconds }
+        self.added_at = {}     # { package_id -> seconds } for add_package
+        self.event_log = PackageEventLog()
+        self.trucks = []       # one dict per truck, see _plan_day
+        self.evaluators = {}   # { truck number -> RouteEvaluator }, per plan_day
+        self.left_at_hub = []
+        self.unplanned = set() # packages added since the last plan_day
+        self.planning_lock = asyncio.Lock()
+        for record in records:
+            self._add_record(record)
+
+    @classmethod
+    def load(cls, distance_csv=DISTANCE_CSV, package_csv=PACKAGE_CSV, close=CLOSE_DISTANCES,
+             **kwargs):
+        graph = TriangularDistanceGraph()
+        pkg_table = PackageHashTable()
+        load_dataset(distance_csv, package_csv, graph, pkg_table,
+                     load_distances_from_csv, load_packages_from_csv)
+        if close:
+            close_distances(graph)
+        return cls(graph, [package_record(pkg) for pkg in pkg_table.get_all_packages()], **kwargs)
+
+    async def handle(self, request):
+        """
+        Serves one decoded request and returns the response dict. Errors
+        other than RequestError are reported to the client too, and printed
+        to stderr, so one bad request never stops the service.
+        """
+        response = {"id": request.get("id")} if isinstance(request, dict) else {"id": None}
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("request must be a JSON object")
+            handler = self.handlers.get(request.get("op"))
+            if handler is None:
+                raise RequestError(f"unknown op {request.get('op')!r}")
+            result = handler(self, request)
+            if asyncio.iscoroutine(result):
+                result = await result
+            response["ok"] = True
+            response["result"] = result
+        except RequestError as e:
+            response["ok"] = False
+            response["error"] = str(e)
+        except Exception as e:
+            print(f"Request {response['id']!r} failed: {e!r}", file=sys.stderr)
+            response["ok"] = False
+            response["error"] = f"internal error: {e!r}"
+        return response
+
+    def status_at(self, request):
+        """
+        Status of one package ("package_id") or of every package at
+        "time" ("HH:MM" or seconds, default end of day).
+        Big O: O(log k) for one package with k status changes.
+        """
+        at_time = _time_field(request, "time", float("inf"))
+        package_id = request.get("package_id")
+        if package_id is None:
+            return [{"package_id": pid, "status": status, "since": format_time(since)}
+                    for pid, status, since in self.event_log.snapshot_at(at_time)]
+        if not isinstance(package_id, int):
+            raise RequestError("package_id must be an integer")
+        if package_id not in self.records:
+            raise RequestError(f"no package #{package_id}")
+        status, since = self.event_log.status_at(package_id, at_time)
+        return {"package_id": package_id, "status": status,
+                "since": None if since is None else format_time(since)}
+
+    def add_package(self, request):
+        """
+        Adds a package at the hub. It is planned by the next plan_day, or
+        right away if "plan" is true. The address is normalized as in the
+        package file and must be in the distance table. The package reaches
+        the hub at "time" ("HH:MM" or seconds, default now) and no truck
+        takes it before then.
+        """
+        fields = request.get("package")
+        if isinstance(fields, dict):
+            record = [fields.get(name, "") for name in PACKAGE_FIELDS]
+        elif isinstance(fields, list) and len(fields) == len(PACKAGE_FIELDS):
+            record = list(fields)
+        else:
+            raise RequestError(f"package must be an object with {', '.join(PACKAGE_FIELDS)}")
+        if not isinstance(record[0], int):
+            raise RequestError("package_id must be an integer")
+        if record[0] in self.records:
+            raise RequestError(f"package #{record[0]} already exists")
+        added_at = _time_field(request, "time", _time_of_day())
+        address = normalize_address(record[1]) if isinstance(record[1], str) else ""
+        if self.graph.get_address_id(address) < 0:
+            raise RequestError(f"unknown address {record[1]!r}")
+        record[1] = address
+        try:
+            record[6] = float(record[6])
+        except (TypeError, ValueError):
+            raise RequestError(f"weight must be a number, not {record[6]!r}")
+        try:
+            Package(*record)
+        except (TypeError, ValueError, AttributeError) as e:
+            raise RequestError(f"invalid package: {e}")
+        self._add_record(record, added_at)
+        self.added_at[record[0]] = added_at
+        self.unplanned.add(record[0])
+        if request.get("plan"):
+            return self.plan_day(request)
+        return {"package_id": record[0], "planned": False}
+
+    async def plan_day(self, request=None):
+        """
+        Plans and simulates the whole day again with every package.
+        """
+        async with self.planning_lock:
+            records = list(self.records.values())
+            day = await self._offload(_plan_day, self.scenario, records, dict(self.added_at))
+            self.trucks = day["trucks"]
+            self.evaluators = {}
+            self.left_at_hub = day["left_at_hub"]
+            event_log = day["event_log"]
+            # Packages added while the plan was computed are still at the hub
+            for package_id in self.records.keys() - event_log.by_package.keys():
+                status, since = self.event_log.status_at(package_id, float("inf"))
+                event_log.record(package_id, status, since)
+            self.event_log = event_log
+            self.unplanned.difference_update(record[0] for record in records)
+        return self._day_metrics()
+
+    async def replan_truck(self, request):
+        """
+        Re-plans one truck's route ("truck", 1-based) with "engine" and
+        optional local search ("improve"), keeping its load and departure.
+        Only that truck's delivery times change; later trucks still leave
+        when they did (plan_day re-runs the whole day).
+        """
+        engine = request.get("engine", self.scenario.engine)
+        if engine not in ROUTE_PLANNERS:
+            raise RequestError(f"unknown engine {engine!r}")
+        async with self.planning_lock:
+            truck = self._truck(request)
+            if truck["departs"] is None:
+                raise RequestError(f"truck {truck['truck']} does not leave the hub")
+            route = await self._offload(_plan_truck, engine, bool(request.get("improve")),
+                                        truck["departs"], truck["speed_mph"], truck["packages"])
+            truck.update(stops=route["stops"], miles=route["miles"], returned=route["returned"])
+            for package_id, _, _ in truck["packages"]:
+                self.event_log.discard(package_id, "Delivered")
+                delivered = route["deliveries"].get(package_id)
+                if delivered is not None:
+                    self.event_log.record(package_id, "Delivered", delivered)
+        return self._truck_metrics(truck)
+
+    def route_metrics(self, request):
+        """
+        Miles, times, stops and deadline slack for one truck ("truck") or
+        for the whole fleet.
+        """
+        if request.get("truck") is not None:
+            return self._truck_metrics(self._truck(request))
+        return self._day_metrics()
+
+    def evaluate_route(self, request):
+        """
+        Miles, arrival times and late packages if one truck ("truck") drove
+        "stops" (addresses, in order) leaving the hub at "departs" (default
+        its planned departure). The plan is not changed. Repeated and
+        one-stop-longer routes are answered from the truck's route cache.
+        """
+        truck = self._truck(request)
+        stops = request.get("stops")
+        if not isinstance(stops, list):
+            raise RequestError("stops must be a list of addresses")
+        stop_ids = []
+        for address in stops:
+            stop_id = self.graph.get_address_id(address) if isinstance(address, str) else -1
+            if stop_id < 0:
+                raise RequestError(f"unknown address {address!r}")
+            stop_ids.append(stop_id)
+        departs = _time_field(request, "departs", truck["departs"])
+        if departs is None:
+            raise RequestError(f"truck {truck['truck']} does not leave the hub, give departs")
+
+        cost = self._evaluator(truck).evaluate(departs, stop_ids)
+        visited = set(stop_ids)
+        return {
+            "truck": truck["truck"],
+            "departs": format_time(departs),
+            "returned": format_time(cost.finish),
+            "miles": round(cost.miles, 2),
+            "arrivals": [format_time(arrival) for arrival in cost.arrivals],
+            "late_packages": list(cost.late),
+            "unvisited": [package_id for package_id, address, _ in truck["packages"]
+                          if self.graph.get_address_id(address) not in visited],
+        }
+
+    handlers = {
+        "status_at": status_at,
+        "add_package": add_package,
+        "plan_day": plan_day,
+        "replan_truck": replan_truck,
+        "route_metrics": route_metrics,
+        "evaluate_route": evaluate_route,
+    }
+
+    async def _offload(self, function, *args):
+        if self.executor is None:
+            return function(*args, graph=self.graph)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _add_record(self, record, at_time=START_OF_DAY):
+        package_id = record[0]
+        self.records[package_id] = record
+        self.deadlines[package_id] = parse_time(record[5])
+        self.event_log.record(package_id, "At hub", at_time)
+
+    def _truck(self, request):
+        number = request.get("truck")
+        if not isinstance(number, int) or not 1 <= number <= len(self.trucks):
+            raise RequestError(f"truck must be 1..{len(self.trucks)}")
+        return self.trucks[number - 1]
+
+    def _evaluator(self, truck):
+        evaluator = self.evaluators.get(truck["truck"])
+        if evaluator is None:
+            deadlines = defaultdict(list)
+            for package_id, address, deadline in truck["packages"]:
+                deadlines[self.graph.get_address_id(address)].append((package_id, deadline))
+            evaluator = RouteEvaluator(self.graph, deadlines, speed_mph=truck["speed_mph"])
+            self.evaluators[truck["truck"]] = evaluator
+        return evaluator
+
+    def _truck_metrics(self, truck):
+        slack = []
+        late = []
+        for package_id, _, _ in truck["packages"]:
+            status, delivered = self.event_log.status_at(package_id, float("inf"))
+            if status == "Delivered":
+                slack.append(self.deadlines[package_id] - delivered)
+                if slack[-1] < 0:
+                    late.append(package_id)
+        return {
+            "truck": truck["truck"],
+            "departs": None if truck["departs"] is None else format_time(truck["departs"]),
+            "returned": None if truck["returned"] is None else format_time(truck["returned"]),
+            "miles": round(truck["miles"], 2),
+            "stops": len(truck["stops"]),
+            "packages": len(truck["packages"]),
+            "min_slack_seconds": min(slack) if slack else None,
+            "late_packages": late,
+        }
+
+    def _day_metrics(self):
+        trucks = [self._truck_metrics(truck) for truck in self.trucks]
+        return {
+            "total_miles": round(sum(truck["miles"] for truck in self.trucks), 2),
+            "late_packages": [pid for truck in trucks for pid in truck["late_packages"]],
+            "left_at_hub": self.left_at_hub,
+            "unplanned": sorted(self.unplanned),
+            "trucks": trucks,
+        }
+
+
+def _plan_day(scenario, records, added_at, graph=None):
+    """
+    Runs in a worker: plans and simulates the day and returns its trucks
+    as plain data, with the PackageEventLog of the simulated day.
+    added_at holds the arrival times of packages added during the day.
+    """
+    if graph is None:
+        graph = worker_graph()
+    pkg_table, fleet, simulator, left_over = simulate_scenario(scenario, graph, records,
+                                                               arrivals=added_at)
+    packages = [[] for _ in fleet]
+    for package_id, truck_index in simulator.truck_of.items():
+        pkg = pkg_table.get_package(package_id)
+        packages[truck_index].append((package_id, pkg.get_address(), pkg.get_deadline_seconds()))
+    trucks = []
+    for index, truck in enumerate(fleet):
+        departs = simulator.get_departure_time(index)
+        trucks.append({
+            "truck": index + 1,
+            "departs": departs,
+            "returned": truck.get_current_time() if departs is not None else None,
+            "miles": truck.get_mileage(),
+            "speed_mph": truck.get_speed(),
+            "stops": [graph.get_address(stop_id) for stop_id in simulator.routes[index]],
+            "packages": packages[index],
+        })
+    return {
+        "trucks": trucks,
+        "event_log": pkg_table.event_log,
+        "left_at_hub": [pkg.get_package_id() for pkg in left_over],
+    }
+
+
+def _plan_truck(engine, improve, departs, speed_mph, packages, graph=None):
+    """
+    Runs in a worker: plans a route from the hub at departs for packages,
+    given as (package_id, address, deadline seconds), and returns its
+    stops, miles and delivery times. Deadlines are repaired as in the
+    simulator (RoutePlan.repair_deadlines) before local search, which then
+    keeps them met.
+    """
+    if graph is None:
+        graph = worker_graph()
+    hub_id = graph.get_address_id("HUB")
+    by_stop = defaultdict(list)
+    for package_id, address, deadline in packages:
+        by_stop[graph.get_address_id(address)].append((package_id, deadline))
+    unroutable = by_stop.pop(-1, [])
+    stop_ids = list(by_stop)
+    route = ROUTE_PLANNERS[engine](graph, hub_id, stop_ids) if stop_ids else []
+    stop_deadline = {stop_id: min(deadline for _, deadline in by_stop[stop_id])
+                     for stop_id in stop_ids}
+    plan = RoutePlan(graph, hub_id, route, departs, hub_id,
+                     [stop_deadline[stop_id] for stop_id in route], speed_mph)
+    plan.repair_deadlines()
+    if improve and plan.stops:
+        route = improve_route(graph, hub_id, plan.stops, deadlines=stop_deadline,
+                              start_time=departs, speed_mph=speed_mph)
+        plan = RoutePlan(graph, hub_id, route, departs, hub_id,
+                         [stop_deadline[stop_id] for stop_id in route], speed_mph)
+    deliveries = {}
+    for position, stop_id in enumerate(plan.stops):
+        for package_id, _ in by_stop[stop_id]:
+            deliveries[package_id] = plan.arrival_time(position)
+    miles = plan.total_distance()
+    return {
+        "stops": [graph.get_address(stop_id) for stop_id in plan.stops],
+        "miles": miles,
+        "returned": departs + Truck.travel_seconds(miles, speed_mph),
+        "deliveries": deliveries,
+        "unroutable": [package_id for package_id, _ in unroutable],
+    }
+
+
+def _time_of_day():
+    """
+    Seconds since local midnight.
+    """
+    now = time.localtime()
+    return float(now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec)
+
+
+def _time_field(request, name, default):
+    value = request.get(name)
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return parse_time(value)
+    except (TypeError, ValueError, AttributeError):
+        raise RequestError(f"{name} must be seconds or \"HH:MM\"")
+
+
+async def serve_stream(service, reader, write):
+    """
+    Answers every request line from reader, writing response lines with
+    write(bytes). Planning requests run as tasks, so later queries are not
+    held up by them. add_package with "plan" adds the package in order, so
+    the next request sees it, and only its plan_day runs as a task.
+    Returns once reader is exhausted and every task is done.
+    """
+    tasks = set()
+
+    async def respond(request):
+        write(_encode(await service.handle(request)))
+
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write(_encode({"id": None, "ok": False, "error": f"invalid JSON: {e}"}))
+            continue
+        op = request.get("op") if isinstance(request, dict) else None
+        if op == "add_package" and request.get("plan"):
+            added = await service.handle(dict(request, plan=False))
+            if not added["ok"]:
+                write(_encode(added))
+                continue
+            request, op = {"id": request.get("id"), "op": "plan_day"}, "plan_day"
+        if op in ("plan_day", "replan_truck"):
+            task = asyncio.create_task(respond(request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        else:
+            await respond(request)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def serve_stdio(service):
+    """
+    Serves requests from stdin and writes responses to stdout until EOF.
+    """
+    loop = asyncio.get_running_loop()
+    out = sys.stdout.buffer
+
+    def write(data):
+        out.write(data)
+        out.flush()
+
+    reader = asyncio.StreamReader()
+    mode = os.fstat(sys.stdin.fileno()).st_mode
+    if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or sys.stdin.isatty():
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    else:
+        # Regular files (and /dev/null) cannot be watched by the event loop,
+        # read them whole
+        reader.feed_data(sys.stdin.buffer.read())
+        reader.feed_eof()
+    await serve_stream(service, reader, write)
+
+
+async def serve_socket(service, path):
+    """
+    Serves every client connecting to the Unix socket at path, until the
+    task is cancelled (Ctrl+C).
+    """
+    async def client(reader, writer):
+        try:
+            await serve_stream(service, reader, writer.write)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(client, path)
+    print(f"Planning service listening on {path}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _encode(response):
+    return (json.dumps(response) + "\n").encode("utf-8")
+
+
+async def _run(service, socket_path):
+    await service.plan_day()
+    if socket_path:
+        await serve_socket(service, socket_path)
+    else:
+        await serve_stdio(service)
+
+
+# (request, expected "ok") pairs replayed by --self-check, each failing
+# request followed by one that must still be served
+SELF_CHECK_REQUESTS = [
+    ({"id": 1, "op": "status_at", "package_id": [9]}, False),
+    ({"id": 2, "op": "status_at", "package_id": 9, "time": "10:30"}, True),
+    ({"id": 3, "op": ["status_at"]}, False),
+    ({"id": 4, "op": "route_metrics", "truck": 1}, True),
+    ({"id": 5, "op": "plan_day"}, False),  # the planning pool is broken
+    ({"id": 6, "op": "status_at", "package_id": 9}, True),
+]
+
+
+class _BrokenPool:
+
+    def submit(self, *args, **kwargs):
+        raise RuntimeError("planning pool is broken")
+
+
+async def self_check(service):
+    """
+    Replays SELF_CHECK_REQUESTS through serve_stream with a broken planning
+    pool and returns the responses. Raises AssertionError if a request goes
+    unanswered or gets the wrong "ok".
+    """
+    await service.plan_day()
+    service.executor = _BrokenPool()
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"".join(_encode(request) for request, _ in SELF_CHECK_REQUESTS))
+    reader.feed_eof()
+    responses = []
+    await serve_stream(service, reader, lambda data: responses.append(json.loads(data)))
+    answers = {response["id"]: response["ok"] for response in responses}
+    for request, ok in SELF_CHECK_REQUESTS:
+        answer = answers.get(request["id"])
+        assert answer == ok, f"request {request} answered {answer}"
+    return responses
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve WGUPS planning requests as JSON Lines.")
+    parser.add_argument("--socket", help="Unix socket path (default: stdin/stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="planning processes (default: one per CPU, 0 plans in-process)")
+    parser.add_argument("--distances", default=DISTANCE_CSV)
+    parser.add_argument("--packages", default=PACKAGE_CSV)
+    parser.add_argument("--raw-distances", action="store_true",
+                        help="route on the listed distances, without the shortest-path closure")
+    parser.add_argument("--self-check", action="store_true",
+                        help="check that failing requests are answered, then exit")
+    args = parser.parse_args(argv)
+
+    service = PlanningService.load(args.distances, args.packages, close=not args.raw_distances)
+    if args.self_check:
+        asyncio.run(self_check(service))
+        print(f"Self-check passed: {len(SELF_CHECK_REQUESTS)} requests answered")
+        return
+    # Stopped by a supervisor: shut down like Ctrl+C, so the socket file and
+    # the shared memory block are removed
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        if args.workers == 0:
+            asyncio.run(_run(service, args.socket))
+            return
+        with shared_graph_pool(service.graph, (), args.workers) as pool:
+            service.executor = pool
+            asyncio.run(_run(service, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+RouteCost.py
+Side-effect-free cost of a truck route, with a bounded LRU cache.
+
+deliver_all_packages only learns a route's miles and finish time by
+driving it: Truck.deliver_package and go_home move the truck and mark
+packages delivered as they go. RouteEvaluator works the same figures out
+from the distance graph alone (miles, arrival time at every stop, packages
+that would be late), so optimizers and what-if tools can score a candidate
+route as often as they like without touching trucks or packages.
+
+Results are cached by (start time, stop tuple) in an OrderedDict kept in
+least-recently-used order and bounded to max_size routes. A route that
+extends a cached one (extend(), or evaluate() on a route one stop longer
+than a cached route) starts from the cached route's last stop, so only
+the new legs are computed.
+"""
+from collections import OrderedDict, namedtuple
+
+from truck import Truck
+
+# Routes kept by a RouteEvaluator before the least recently used is dropped
+DEFAULT_CACHE_SIZE = 4096
+
+RouteCost = namedtuple("RouteCost", ["start_time", "stops", "distances", "arrivals", "late",
+                                     "miles", "finish"])
+RouteCost.__doc__ = """
+    Cost of start -> stops -> end, leaving at start_time (seconds).
+    distances[k] and arrivals[k] are the miles driven and the time of
+    arrival at stops[k]; late holds the IDs of the packages that would be
+    delivered after their deadline, in stop order. miles and finish include
+    the leg back to the end address.
+    """
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "extensions", "misses", "maxsize", "currsize"])
+
+
+def stop_deadlines(graph, packages):
+    """
+    Groups Package objects into the { stop ID -> [(package ID, deadline
+    seconds), ...] } form RouteEvaluator takes. Packages whose address is
+    not in the graph are left out.
+    """
+    deadlines = {}
+    for pkg in packages:
+        stop_id = graph.get_address_id(pkg.get_address())
+        if stop_id >= 0:
+            deadlines.setdefault(stop_id, []).append((pkg.get_package_id(),
+                                                      pkg.get_deadline_seconds()))
+    return deadlines
+
+
+class RouteEvaluator:
+    """
+    Scores routes over DistanceGraph address IDs for one truck: each route
+    starts at start_id and ends at end_id (both the HUB by default) and is
+    driven at speed_mph (Truck.SPEED_MPH if None).
+
+    deadlines maps a stop ID to the (package ID, deadline seconds) pairs of
+    the packages dropped off there (see stop_deadlines). Arrival times are
+    computed from the miles driven so far, as RoutePlan does. The graph and
+    deadlines must not change while routes are cached; call clear() after
+    changing either.
+    """
+
+    def __init__(self, graph, deadlines=None, start_id=None, end_id=None, speed_mph=None,
+                 max_size=DEFAULT_CACHE_SIZE):
+        self.graph = graph
+        self.start_id = graph.get_address_id("HUB") if start_id is None else start_id
+        self.end_id = self.start_id if end_id is None else end_id
+        self.speed_mph = speed_mph
+        self.max_size = max_size
+        # Pairs sorted by deadline, and the earliest deadline per stop, so a
+        # stop reached in time costs one comparison
+        self.deadlines = {}
+        self.earliest = {}
+        for stop_id, pairs in (deadlines or {}).items():
+            if pairs:
+                self.deadlines[stop_id] = sorted(pairs, key=lambda pair: pair[1])
+                self.earliest[stop_id] = self.deadlines[stop_id][0][1]
+        self.cache = OrderedDict()  # { (start_time, stops) -> RouteCost }
+        self.hits = 0
+        self.extensions = 0
+        self.misses = 0
+
+    def evaluate(self, start_time, stops):
+        """
+        RouteCost of driving stops in order, leaving at start_time.
+
+        Big O: O(s) to hash the s stops for a cached route, plus one leg
+        when the route without its last stop is cached, O(s) legs otherwise.
+        """
+        stops = tuple(stops)
+        key = (start_time, stops)
+        cost = self.cache.get(key)
+        if cost is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return cost
+
+        base = self.cache.get((start_time, stops[:-1])) if stops else None
+        if base is not None:
+            self.extensions += 1
+            self.cache.move_to_end((start_time, stops[:-1]))
+        else:
+            self.misses += 1
+        return self._store(key, self._compute(start_time, stops, base))
+
+    def extend(self, cost, more_stops):
+        """
+        RouteCost of cost's route (from this evaluator) followed by
+        more_stops. Only the new legs are computed, whether or not cost is
+        still cached. Big O: O(k) legs for k new stops.
+        """
+        stops = cost.stops + tuple(more_stops)
+        key = (cost.start_time, stops)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return cached
+        self.extensions += 1
+        return self._store(key, self._compute(cost.start_time, stops, cost))
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.extensions, self.misses, self.max_size, len(self.cache))
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = self.extensions = self.misses = 0
+
+    def _compute(self, start_time, stops, base):
+        """
+        Drives stops from where base (a RouteCost for a prefix of stops, or
+        None) left off.
+        """
+        dist = self.graph.get_distance_by_id
+        speed_mph = self.speed_mph
+        deadlines = self.deadlines
+        earliest = self.earliest
+        no_deadline = float("inf")
+        if base is None or not base.stops:
+            first, miles, here = 0, 0.0, self.start_id
+            distances, arrivals, late = [], [], []
+        else:
+            first, miles, here = len(base.stops), base.distances[-1], base.stops[-1]
+            distances, arrivals, late = list(base.distances), list(base.arrivals), list(base.late)
+
+        for stop_id in stops[first:]:
+            miles += dist(here, stop_id)
+            arrival = start_time + Truck.travel_seconds(miles, speed_mph)
+            distances.append(miles)
+            arrivals.append(arrival)
+            if earliest.get(stop_id, no_deadline) < arrival:
+                for package_id, deadline in deadlines[stop_id]:
+                    if deadline >= arrival:
+                        break
+                    late.append(package_id)
+            here = stop_id
+
+        total = miles + dist(here, self.end_id)
+        return RouteCost(start_time, stops, tuple(distances), tuple(arrivals), tuple(late),
+                         total, start_time + Truck.travel_seconds(total, speed_mph))
+
+    def _store(self, key, cost):
+        self.cache[key] = cost
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+        return cost
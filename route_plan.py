@@ -0,0 +1,317 @@
+"""
+RoutePlan.py
+A truck's remaining route with cached prefix distances and arrival times.
+
+The plan is start -> stops -> end over DistanceGraph address IDs. Prefix
+distances and arrival times are cached per stop, so the cost of inserting
+or removing one stop is O(1) to evaluate, the cheapest insertion point is
+one O(s) scan, and applying a change only recomputes the caches from the
+changed position on. This is what lets a single package change be repaired
+in place instead of re-planning the whole fleet.
+
+Each stop may also carry a deadline (the earliest one of its packages).
+The plan then keeps every stop's slack (deadline minus arrival), its
+suffix minimum, and a sparse table for range minimums, so whether an
+insertion, removal or 2-opt reversal keeps every deadline met is answered
+in O(1) without re-simulating the truck.
+"""
+from array import array
+
+from truck import Truck
+
+# Deadline of a stop whose packages have none
+NO_DEADLINE = float("inf")
+
+
+class RoutePlan:
+    """
+    Ordered stops for one truck, starting from start_id at start_time and
+    ending at end_id (the HUB).
+
+    stops is used as given, not copied, so the simulator can keep driving
+    the same list it hands in. deadlines, if given, holds one time in
+    seconds per stop. speed_mph is the truck's speed (Truck.SPEED_MPH if
+    None).
+
+    The feasibility checks (can_insert, can_remove, can_reverse)
+    look at the stops a move affects and assume symmetric distances.
+    """
+
+    def __init__(self, graph, start_id, stops, start_time=0.0, end_id=None, deadlines=None,
+                 speed_mph=None):
+        self.graph = graph
+        self.speed_mph = speed_mph
+        self.start_id = start_id
+        self.end_id = start_id if end_id is None else end_id
+        self.start_time = start_time
+        self.stops = stops
+        self.deadlines = array("d", deadlines if deadlines is not None
+                               else [NO_DEADLINE] * len(stops))
+        self.prefix = array("d")    # [k] miles from start_id to stops[k]
+        self.arrivals = array("d")  # [k] seconds at which stops[k] is reached
+        self._slack_tables = None   # built on the first feasibility query
+        self._refresh(0)
+
+    def size(self):
+        return len(self.stops)
+
+    def distance_to(self, position):
+        """
+        Miles driven from the start up to stops[position].
+        """
+        return self.prefix[position]
+
+    def arrival_time(self, position):
+        return self.arrivals[position]
+
+    def slack(self, position):
+        """
+        Seconds stops[position] can still be delayed before it is late.
+        """
+        return self.deadlines[position] - self.arrivals[position]
+
+    def set_deadline(self, position, deadline):
+        self.deadlines[position] = deadline
+        self._slack_tables = None
+
+    def is_feasible(self):
+        """
+        True when every stop is reached by its deadline. O(1) once the
+        slack tables are built.
+        """
+        return self._suffix_slack(0) >= 0
+
+    def total_distance(self):
+        """
+        Miles for the whole plan, including the leg back to end_id.
+        """
+        if not self.stops:
+            return self.graph.get_distance_by_id(self.start_id, self.end_id)
+        return self.prefix[-1] + self.graph.get_distance_by_id(self.stops[-1], self.end_id)
+
+    def index(self, stop_id, first_position=0):
+        """
+        Position of stop_id at or after first_position, or -1.
+        """
+        try:
+            return self.stops.index(stop_id, first_position)
+        except ValueError:
+            return -1
+
+    def insertion_cost(self, stop_id, position):
+        """
+        Extra miles for inserting stop_id before stops[position]
+        (position == size() appends before the leg to end_id). O(1).
+        """
+        dist = self.graph.get_distance_by_id
+        before, after = self._neighbors(position, position)
+        return dist(before, stop_id) + dist(stop_id, after) - dist(before, after)
+
+    def removal_saving(self, position):
+        """
+        Miles saved by dropping stops[position]. O(1).
+        """
+        dist = self.graph.get_distance_by_id
+        before, after = self._neighbors(position, position + 1)
+        stop_id = self.stops[position]
+        return dist(before, stop_id) + dist(stop_id, after) - dist(before, after)
+
+    def cheapest_insertion(self, stop_id, first_position=0, deadline=None):
+        """
+        Returns (extra miles, position) of the cheapest place to insert
+        stop_id at or after first_position.
+
+        With a deadline, only positions that keep every deadline met are
+        considered; if there is none, the cheapest position overall is
+        returned, since a late delivery beats none.
+
+        Big O: O(s) for s stops.
+        """
+        best_cost, best_position = float("inf"), len(self.stops)
+        fallback_cost, fallback_position = float("inf"), len(self.stops)
+        for position in range(first_position, len(self.stops) + 1):
+            cost = self.insertion_cost(stop_id, position)
+            if cost < fallback_cost:
+                fallback_cost, fallback_position = cost, position
+            if cost < best_cost and (deadline is None or
+                                     self.can_insert(stop_id, position, deadline)):
+                best_cost, best_position = cost, position
+        if best_cost == float("inf"):
+            return fallback_cost, fallback_position
+        return best_cost, best_position
+
+    def insert(self, stop_id, position, deadline=NO_DEADLINE):
+        """
+        Inserts stop_id before stops[position]. O(s - position).
+        """
+        self.stops.insert(position, stop_id)
+        self.deadlines.insert(position, deadline)
+        self._refresh(position)
+
+    def remove(self, position):
+        """
+        Removes and returns stops[position]. O(s - position).
+        """
+        stop_id = self.stops.pop(position)
+        del self.deadlines[position]
+        self._refresh(position)
+        return stop_id
+
+    def repair_deadlines(self):
+        """
+        Reorders the plan so late stops are on time, if it can. Every late
+        stop is taken out, together with every stop due later than the
+        latest of them, then they are put back in deadline order, each at
+        its cheapest insertion that keeps every deadline met (or its
+        cheapest one, if none does). Returns the number of stops moved.
+
+        On metric distances (see metric_closure.py) taking stops out never
+        delays the others, so the stops left are all on time.
+
+        Big O: O(m * s) for m stops moved out of s.
+        """
+        if self.is_feasible():
+            return 0
+        latest = max(self.deadlines[position] for position in range(len(self.stops))
+                     if self.slack(position) < 0)
+        moved = [(self.deadlines[position], position, self.stops[position])
+                 for position in range(len(self.stops))
+                 if self.slack(position) < 0 or self.deadlines[position] > latest]
+        for _, position, _ in reversed(moved):
+            self.remove(position)
+        for deadline, _, stop_id in sorted(moved):
+            _, position = self.cheapest_insertion(stop_id, 0, deadline)
+            self.insert(stop_id, position, deadline)
+        return len(moved)
+
+    def can_insert(self, stop_id, position, deadline=NO_DEADLINE):
+        """
+        True if inserting stop_id before stops[position] keeps it and
+        every later stop on time. O(1).
+        """
+        before, _ = self._neighbors(position, position)
+        arrival = self._time_at(position - 1) + self._seconds(before, stop_id)
+        if arrival > deadline:
+            return False
+        delay = Truck.travel_seconds(self.insertion_cost(stop_id, position), self.speed_mph)
+        return self._suffix_slack(position) >= delay
+
+    def can_remove(self, position):
+        """
+        True if dropping stops[position] keeps every later stop on time
+        (it can only fail if the shortcut is longer than the detour). O(1).
+        """
+        delay = -Truck.travel_seconds(self.removal_saving(position), self.speed_mph)
+        return self._suffix_slack(position + 1) >= delay
+
+    def can_reverse(self, i, j):
+        """
+        True if reversing stops[i..j] (a 2-opt move) keeps every stop from
+        position i on, on time. O(1).
+
+        In the reversed segment stops[k] is reached at
+        t + arrivals[j] - arrivals[k], where t is the new arrival at
+        stops[j], so the whole segment is on time exactly when the minimum
+        of deadlines[k] + arrivals[k] over i..j is at least t + arrivals[j].
+        """
+        if i > j:
+            i, j = j, i
+        if i == j:
+            return self._suffix_slack(i) >= 0
+        stops = self.stops
+        arrival_j = self._time_at(i - 1) + self._seconds(self._node(i - 1), stops[j])
+        if self._range_deadline_plus_arrival(i, j) < arrival_j + self.arrivals[j]:
+            return False
+        arrival_i = arrival_j + self.arrivals[j] - self.arrivals[i]
+        return self._tail_ok(j, stops[i], arrival_i)
+
+    def _tail_ok(self, position, stop_id, arrival):
+        """
+        True if the stops after position stay on time when stop_id, now at
+        position, is reached at arrival.
+        """
+        if position + 1 >= len(self.stops):
+            return True
+        delay = (arrival + self._seconds(stop_id, self.stops[position + 1])
+                 - self.arrivals[position + 1])
+        return self._suffix_slack(position + 1) >= delay
+
+    def _node(self, position):
+        return self.stops[position] if position >= 0 else self.start_id
+
+    def _time_at(self, position):
+        return self.arrivals[position] if position >= 0 else self.start_time
+
+    def _seconds(self, from_id, to_id):
+        return Truck.travel_seconds(self.graph.get_distance_by_id(from_id, to_id), self.speed_mph)
+
+    def _suffix_slack(self, position):
+        if position >= len(self.stops):
+            return float("inf")
+        return self._tables()[0][position]
+
+    def _range_deadline_plus_arrival(self, low, high):
+        return self._tables()[1].query(low, high)
+
+    def _tables(self):
+        """
+        (suffix minimum slack, range-min table over deadline + arrival),
+        rebuilt after the plan changes.
+        Big O: O(s log s) to build.
+        """
+        if self._slack_tables is None:
+            slack = array("d", map(float.__sub__, self.deadlines, self.arrivals))
+            suffix = array("d", slack)
+            for position in range(len(suffix) - 2, -1, -1):
+                if suffix[position + 1] < suffix[position]:
+                    suffix[position] = suffix[position + 1]
+            keyed = array("d", map(float.__add__, self.deadlines, self.arrivals))
+            self._slack_tables = (suffix, RangeMin(keyed))
+        return self._slack_tables
+
+    def _neighbors(self, before_position, after_position):
+        before = self.stops[before_position - 1] if before_position > 0 else self.start_id
+        after = self.stops[after_position] if after_position < len(self.stops) else self.end_id
+        return before, after
+
+    def _refresh(self, position):
+        """
+        Recomputes the prefix caches from stops[position] on.
+        """
+        dist = self.graph.get_distance_by_id
+        self._slack_tables = None
+        del self.prefix[position:]
+        del self.arrivals[position:]
+        miles = self.prefix[position - 1] if position > 0 else 0.0
+        here = self.stops[position - 1] if position > 0 else self.start_id
+        for stop_id in self.stops[position:]:
+            miles += dist(here, stop_id)
+            self.prefix.append(miles)
+            self.arrivals.append(self.start_time + Truck.travel_seconds(miles, self.speed_mph))
+            here = stop_id
+
+
+class RangeMin:
+    """
+    Sparse table over a list of numbers: O(n log n) to build, then the
+    minimum of any index range in O(1).
+    """
+
+    def __init__(self, values):
+        self.levels = [array("d", values)]
+        width = 1
+        while 2 * width <= len(values):
+            previous = self.levels[-1]
+            self.levels.append(array("d", map(min, previous[:len(previous) - width],
+                                               previous[width:])))
+            width *= 2
+
+    def query(self, low, high):
+        """
+        Minimum of values[low..high] (inclusive), inf for an empty range.
+        """
+        if low > high:
+            return float("inf")
+        level = (high - low + 1).bit_length() - 1
+        row = self.levels[level]
+        return min(row[low], row[high - (1 << level) + 1])
@@ -0,0 +1,62 @@
+"""
+Routing.py
+Route construction helpers that work on interned address IDs
+from the DistanceGraph instead of address strings.
+"""
+from functools import partial
+
+from distance_graph import MISSING
+
+
+def group_stops(graph, packages):
+    """
+    Groups packages by destination so each address is visited once.
+
+    Returns (stop_ids, packages_by_stop, unroutable) where stop_ids keeps the
+    order in which addresses first appear in `packages`, packages_by_stop maps
+    each stop ID to its packages and unroutable lists packages whose address
+    is not in the graph.
+
+    Big O: O(n) for n packages.
+    """
+    stop_ids = []
+    packages_by_stop = {}
+    unroutable = []
+    for pkg in packages:
+        stop_id = graph.get_address_id(pkg.get_address())
+        if stop_id < 0:
+            unroutable.append(pkg)
+            continue
+        if stop_id not in packages_by_stop:
+            packages_by_stop[stop_id] = []
+            stop_ids.append(stop_id)
+        packages_by_stop[stop_id].append(pkg)
+    return stop_ids, packages_by_stop, unroutable
+
+
+def nearest_neighbor_route(graph, start_id, stop_ids):
+    """
+    Orders stop IDs greedily, always driving to the closest remaining stop.
+
+    Each step is a single min() over the remaining stops, one ID lookup per
+    stop, so it costs O(s) no matter how many addresses the graph holds
+    (a whole matrix row would be O(d), and on a TriangularDistanceGraph
+    has to be gathered). Ties go to the stop that appears first in
+    stop_ids, which reproduces the order of find_nearest_package. Stops
+    that cannot be reached from the current location are left out of the
+    returned route.
+
+    Big O: O(s^2) for s distinct stops.
+    """
+    dist = graph.get_distance_by_id
+    remaining = list(stop_ids)
+    route = []
+    current = start_id
+    while remaining:
+        best = min(remaining, key=partial(dist, current))
+        if dist(current, best) == MISSING:
+            break
+        remaining.remove(best)
+        route.append(best)
+        current = best
+    return route
@@ -0,0 +1,297 @@
+"""
+ScenarioRunner.py
+Parallel what-if runs of the delivery day.
+
+A scenario is one set of parameters (fleet size, drivers, capacity, speed,
+departure times, routing engine). run_scenarios loads the CSV files once,
+puts the distance matrix into one multiprocessing.shared_memory block and
+runs the scenarios across a ProcessPoolExecutor. Every worker maps the
+same read-only matrix into a DistanceGraph, and every scenario builds its
+own packages from the parsed records, so no run sees another's state.
+
+    python scenario_runner.py                    # a few built-in what-ifs
+    python scenario_runner.py -s sweep.json -w 8 # scenarios from a file
+
+A scenario file is a JSON list of objects with Scenario's fields; missing
+fields keep their defaults, e.g.
+    [{"name": "fast", "speed_mph": 25}, {"name": "big", "capacity": 20}]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from clock import format_time, parse_time
+from distance_graph import DistanceGraph, TriangularDistanceGraph
+from package import Package
+from package_hash_table import PackageHashTable
+from package_constraints import ConstraintIndex
+from metric_closure import close_distances
+from truck import Truck
+from fleet_planner import departure_times, plan_fleet
+from simulation import FleetSimulator
+from main import (ADDRESS_CORRECTIONS, CLOSE_DISTANCES, NUM_DRIVERS, NUM_TRUCKS, ROUTE_PLANNERS,
+                  load_distances_from_csv, load_packages_from_csv)
+
+DISTANCE_CSV = "WGUPS_Distance_Table.csv"
+PACKAGE_CSV = "WGUPS_Package_File.csv"
+
+# Same day as main(): departures derived from the package constraints
+# (fleet_planner.departure_times)
+DEFAULT_DEPARTURES = None
+
+Scenario = namedtuple("Scenario", ["name", "num_trucks", "num_drivers", "capacity",
+                                   "speed_mph", "depart_times", "engine"],
+                      defaults=[NUM_TRUCKS, NUM_DRIVERS, Truck.MAX_CAPACITY, Truck.SPEED_MPH,
+                                DEFAULT_DEPARTURES, "batched"])
+Scenario.__doc__ = """
+    Parameters of one what-if run. depart_times holds "HH:MM" (or None)
+    per truck, the earliest each may leave; trucks past the end of the
+    list leave whenever a driver is free. depart_times=None derives them
+    from the packages' constraints, as main() does. engine is a key of
+    main.ROUTE_PLANNERS.
+    """
+
+BUILT_IN_SCENARIOS = [
+    Scenario("baseline"),
+    Scenario("truck 3 at 9:05", depart_times=("08:00", "09:05", "09:05")),
+    Scenario("25 mph", speed_mph=25.0),
+    Scenario("capacity 20", capacity=20),
+    Scenario("held-karp", engine="held_karp"),
+    Scenario("3 drivers", num_drivers=3),
+]
+
+TABLE_COLUMNS = [
+    ("scenario", "name", "<"), ("trucks", "num_trucks", ">"), ("drivers", "num_drivers", ">"),
+    ("cap", "capacity", ">"), ("mph", "speed_mph", ">"), ("engine", "engine", "<"),
+    ("miles", "total_miles", ">"), ("finish", "finish", ">"), ("late", "late", ">"),
+    ("left", "left_at_hub", ">"),
+]
+
+# Set in each worker by _init_worker
+_worker = {}
+
+
+def run_scenarios(scenarios, distance_csv=DISTANCE_CSV, package_csv=PACKAGE_CSV,
+                  max_workers=None, close=CLOSE_DISTANCES):
+    """
+    Runs every scenario and returns their results (see run_scenario) in
+    the same order. max_workers=0 runs them in this process.
+
+    The distance matrix is shared, not copied: it is written once into a
+    shared memory block that the workers map read-only. Package records are
+    sent to each worker once, at start-up.
+    """
+    graph = TriangularDistanceGraph()
+    pkg_table = PackageHashTable()
+    load_distances_from_csv(distance_csv, graph)
+    load_packages_from_csv(package_csv, pkg_table)
+    if close:
+        close_distances(graph)
+    records = [package_record(pkg) for pkg in pkg_table.get_all_packages()]
+
+    if max_workers == 0:
+        _worker["graph"] = graph
+        _worker["records"] = records
+        try:
+            return [run_scenario(scenario) for scenario in scenarios]
+        finally:
+            _worker.clear()
+
+    with shared_graph_pool(graph, records, max_workers) as pool:
+        return list(pool.map(run_scenario, scenarios))
+
+
+@contextlib.contextmanager
+def shared_graph_pool(graph, records=(), max_workers=None):
+    """
+    ProcessPoolExecutor whose workers all read graph's distances from one
+    shared memory block. Inside a worker, worker_graph() returns that graph
+    and worker_records() the package records given here.
+    """
+    size = graph.size()
+    block = shared_memory.SharedMemory(create=True, size=max(1, size * size * 8))
+    try:
+        matrix = block.buf.cast("d")
+        for address_id in range(size):
+            matrix[address_id * size:(address_id + 1) * size] = graph.get_row(address_id)
+        matrix.release()
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker,
+                                 initargs=(block.name, graph.addresses, records)) as pool:
+            yield pool
+    finally:
+        block.close()
+        block.unlink()
+
+
+def worker_graph():
+    return _worker["graph"]
+
+
+def worker_records():
+    return _worker["records"]
+
+
+def run_scenario(scenario):
+    """
+    Runs one scenario against the worker's shared graph and returns a dict
+    of its parameters, miles, finish time and missed deadlines.
+    """
+    pkg_table, fleet, simulator, left_over = simulate_scenario(scenario, worker_graph(),
+                                                               worker_records())
+    late = [pkg.get_package_id() for pkg in pkg_table.get_all_packages()
+            if pkg.get_delivery_time() is not None
+            and pkg.get_delivery_time() > pkg.get_deadline_seconds()]
+    undelivered = [pkg.get_package_id() for pkg in pkg_table.get_all_packages()
+                   if pkg.get_status() != "Delivered"]
+    used = [index for index in range(len(fleet)) if simulator.get_departure_time(index) is not None]
+    result = scenario._asdict()
+    result.update({
+        "total_miles": round(sum(truck.get_mileage() for truck in fleet), 2),
+        "truck_miles": [round(truck.get_mileage(), 2) for truck in fleet],
+        "finish": format_time(max((fleet[index].get_current_time() for index in used),
+                                  default=simulator.start_time)),
+        "late": len(late),
+        "late_packages": late,
+        "left_at_hub": len(left_over),
+        "undelivered": len(undelivered),
+    })
+    return result
+
+
+def simulate_scenario(scenario, graph, records, corrections=ADDRESS_CORRECTIONS, arrivals=None):
+    """
+    Plans and simulates the day for one scenario on fresh packages built
+    from records. arrivals maps the IDs of packages that reach the hub
+    during the day to that time (seconds); they are logged "At hub" and
+    can leave from then on. Returns (pkg_table, fleet, simulator, packages
+    left at the hub).
+    """
+    arrivals = arrivals or {}
+    packages = [Package(*record) for record in records]
+    pkg_table = PackageHashTable()
+    pkg_table.add_packages([pkg for pkg in packages if pkg.get_package_id() not in arrivals])
+    for pkg in packages:
+        if pkg.get_package_id() in arrivals:
+            pkg_table.add_package(pkg, arrivals[pkg.get_package_id()])
+    constraints = ConstraintIndex.from_packages(pkg_table.get_all_packages())
+    for package_id, address, known_at in corrections:
+        if pkg_table.get_package(package_id) is not None:
+            constraints.add_correction(package_id, address, known_at)
+
+    fleet = [Truck(scenario.capacity, scenario.speed_mph) for _ in range(scenario.num_trucks)]
+    if scenario.depart_times is None:
+        departures = departure_times(constraints, len(fleet))
+    else:
+        departures = [parse_time(time_text) if time_text else None
+                      for time_text in scenario.depart_times][:len(fleet)]
+        departures += [None] * (len(fleet) - len(departures))
+    # Registered after the departures are derived: a package added during
+    # the day rides a truck that leaves after it, it does not hold one back
+    for package_id, at_time in arrivals.items():
+        constraints.add_arrival(package_id, at_time)
+    # Warnings printed by the planner would interleave across workers
+    with contextlib.redirect_stdout(io.StringIO()):
+        left_over = plan_fleet(pkg_table, graph, fleet, constraints=constraints,
+                               depart_times=departures)
+        simulator = FleetSimulator(pkg_table, graph, fleet, scenario.num_drivers,
+                                   plan_route=ROUTE_PLANNERS[scenario.engine],
+                                   constraints=constraints, depart_times=departures)
+        simulator.run()
+    return pkg_table, fleet, simulator, left_over
+
+
+def format_table(results):
+    """
+    The results as an aligned text table, one row per scenario.
+    """
+    rows = [[header for header, _, _ in TABLE_COLUMNS]]
+    for result in results:
+        rows.append([f"{result[key]:.2f}" if isinstance(result[key], float) else str(result[key])
+                     for _, key, _ in TABLE_COLUMNS])
+    widths = [max(len(row[column]) for row in rows) for column in range(len(TABLE_COLUMNS))]
+    lines = []
+    for row in rows:
+        lines.append("  ".join(f"{cell:{align}{width}}" for cell, (_, _, align), width
+                               in zip(row, TABLE_COLUMNS, widths)).rstrip())
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def load_scenarios(path):
+    """
+    Reads a JSON list of scenario objects. Unknown fields are reported and
+    the scenario skipped.
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    scenarios = []
+    for number, entry in enumerate(entries, start=1):
+        entry = dict(entry)
+        entry.setdefault("name", f"scenario {number}")
+        if entry.get("depart_times") is not None:
+            entry["depart_times"] = tuple(entry["depart_times"])
+        try:
+            scenario = Scenario(**entry)
+        except TypeError as e:
+            print(f"Skipping scenario {number}: {e}")
+            continue
+        if scenario.engine not in ROUTE_PLANNERS:
+            print(f"Skipping scenario {number}: unknown engine {scenario.engine!r}")
+            continue
+        scenarios.append(scenario)
+    return scenarios
+
+
+def _init_worker(block_name, addresses, records):
+    block = shared_memory.SharedMemory(name=block_name)
+    graph = DistanceGraph()
+    graph.load_matrix(addresses, block.buf.toreadonly().cast("d"))
+    # The block must stay open for as long as the graph reads from it
+    _worker["block"] = block
+    _worker["graph"] = graph
+    _worker["records"] = records
+
+
+def package_record(pkg):
+    """
+    The Package constructor arguments for pkg, as a list.
+    """
+    return [pkg.get_package_id(), pkg.get_address(), pkg.get_city(), pkg.get_state(),
+            pkg.get_zip(), pkg.get_deadline(), pkg.get_weight(), pkg.get_special_note()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare what-if runs of the WGUPS delivery day.")
+    parser.add_argument("-s", "--scenarios", help="JSON file with a list of scenarios "
+                                                  "(default: a few built-in ones)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU, 0 runs in-process)")
+    parser.add_argument("--distances", default=DISTANCE_CSV)
+    parser.add_argument("--packages", default=PACKAGE_CSV)
+    parser.add_argument("--raw-distances", action="store_true",
+                        help="route on the listed distances, without the shortest-path closure")
+    parser.add_argument("--json", action="store_true", help="print the full results as JSON")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios) if args.scenarios else BUILT_IN_SCENARIOS
+    if not scenarios:
+        print("No scenarios to run.")
+        return
+    workers = args.workers
+    if workers is None:
+        workers = min(len(scenarios), os.cpu_count() or 1)
+    results = run_scenarios(scenarios, args.distances, args.packages, workers,
+                            close=not args.raw_distances)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
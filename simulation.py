@@ -0,0 +1,338 @@
+"""
+Simulation.py
+Discrete-event simulation of a fleet of trucks sharing a pool of drivers.
+
+Every truck action is an event on one heapq priority queue ordered by
+time, so trucks progress concurrently against a single global clock and
+the package table always reflects that clock. A driver freed by a truck
+returning to the HUB is reassigned to the next waiting truck right away,
+or once that truck's delayed packages have arrived.
+"""
+import heapq
+from itertools import count
+
+from clock import parse_time
+from routing import group_stops, nearest_neighbor_route
+from route_plan import RoutePlan
+from trace_sink import TraceSink, DEPART as TRACE_DEPART, DRIVE, DELIVER, STOP_DONE, \
+    RETURN as TRACE_RETURN, RETURNED, REROUTE
+
+# Event kinds, processed in this order when they share a timestamp
+RETURN = 0   # truck back at the HUB, its driver is free again
+DEPART = 1   # a driver takes a loaded truck out
+ARRIVE = 2   # truck reaches its next stop and delivers there
+CHANGE = 3   # a package's address changes mid-day, its truck is re-routed
+
+
+class FleetSimulator:
+    """
+    Runs the delivery day for a fleet of loaded trucks.
+
+    Events are (seconds, kind, sequence, truck_index) tuples; the sequence
+    number keeps events at the same time in scheduling order. CHANGE events
+    carry a package ID in place of the truck index.
+    """
+
+    def __init__(self, pkg_table, graph, trucks, num_drivers,
+                 plan_route=nearest_neighbor_route, start_time="08:00",
+                 trace_trucks=(), hub="HUB", constraints=None, trace_sink=None,
+                 depart_times=None):
+        """
+        :param trucks: loaded trucks, dispatched in list order (list of Truck)
+        :param num_drivers: drivers available at the start of the day (int)
+        :param plan_route: route planner taking (graph, start_id, stop_ids)
+        :param start_time: "HH:MM" at which the first drivers leave
+        :param trace_trucks: indexes of trucks whose events are traced, or "all"
+        :param constraints: ConstraintIndex giving package arrival times and
+                            address corrections, or None
+        :param trace_sink: TraceSink receiving the trace events; by default
+                           they are printed to stdout
+        :param depart_times: per truck, the earliest time (seconds) it may
+                             leave, or None; None for the whole list means
+                             no truck waits beyond its driver and packages,
+                             and trucks past the end of the list have no
+                             earliest time
+        """
+        self.pkg_table = pkg_table
+        self.graph = graph
+        self.trucks = trucks
+        self.num_drivers = num_drivers
+        self.plan_route = plan_route
+        self.start_time = parse_time(start_time)
+        self.trace_trucks = set(range(len(trucks)) if trace_trucks == "all" else trace_trucks)
+        self.trace_sink = trace_sink
+        self.hub_id = graph.get_address_id(hub)
+        self.constraints = constraints
+        self.earliest_departures = depart_times
+
+        self.now = self.start_time
+        self.events = []
+        self.sequence = count()
+        self.free_drivers = num_drivers
+        self.waiting = list(range(len(trucks)))[::-1]  # stack, next truck last
+
+        # Per truck route state, indexed like self.trucks
+        self.routes = [[] for _ in trucks]
+        self.route_pos = [0] * len(trucks)
+        self.location_ids = [self.hub_id] * len(trucks)
+        self.depart_times = [None] * len(trucks)
+        self.packages_by_stop = [{} for _ in trucks]
+        self.plans = [None] * len(trucks)  # RoutePlan over self.routes[i]
+        self.out = [False] * len(trucks)   # between DEPART and RETURN
+        self.pending_depart = set()        # dispatched, DEPART not yet processed
+        self.another_trip = set()          # trucks to send out again once back
+        self.truck_of = {}                 # { package_id -> truck index } once out
+        self.pending_changes = {}          # { package_id -> [address, ...] }
+        self.event_count = 0
+
+    def get_departure_time(self, truck_index):
+        """
+        Seconds since midnight at which the truck left the HUB, or None if
+        it never left.
+        """
+        return self.depart_times[truck_index]
+
+    def schedule(self, at_time, kind, truck_index):
+        heapq.heappush(self.events, (at_time, kind, next(self.sequence), truck_index))
+
+    def schedule_address_change(self, at_time, package_id, address):
+        """
+        Changes a package's address at at_time (seconds) during run(). If
+        the package is already out on a truck, only that truck's remaining
+        route is repaired (see reroute).
+        """
+        self.pending_changes.setdefault(package_id, []).append(address)
+        self.schedule(at_time, CHANGE, package_id)
+
+    def reroute(self, pkg):
+        """
+        Repairs the remaining route of the truck carrying pkg after its
+        address changed: the old stop is dropped if nothing else is
+        delivered there, and the new address is added to the stop already
+        on the route or at its cheapest insertion point that keeps every
+        deadline met. The stop the truck is driving to is left in place.
+
+        Packages still at the hub need nothing, their truck's route is
+        planned when it departs. A truck already heading home, or back at
+        the HUB, has no route left to repair, so it is sent out again with
+        the package once it (and a driver) is at the HUB.
+        Returns True if a route was changed.
+
+        Big O: O(s) for the s stops left on the truck's route.
+        """
+        package_id = pkg.get_package_id()
+        truck_index = self.truck_of.get(package_id)
+        if truck_index is None or pkg.get_status() == "Delivered":
+            return False
+        plan = self.plans[truck_index]
+        buckets = self.packages_by_stop[truck_index]
+        first = self.route_pos[truck_index] + 1  # stops after the one being driven to
+        if plan is None:
+            return False
+        if first > plan.size():
+            return self._send_again(truck_index, pkg)
+
+        for stop_id, packages in buckets.items():
+            if pkg in packages:
+                packages.remove(pkg)
+                position = plan.index(stop_id, first)
+                if not packages:
+                    del buckets[stop_id]
+                    if position >= 0:
+                        plan.remove(position)
+                elif position >= 0:
+                    plan.set_deadline(position, min(p.get_deadline_seconds() for p in packages))
+                break
+
+        new_id = self.graph.get_address_id(pkg.get_address())
+        if new_id < 0:
+            print(f"Package #{package_id} has no route to {pkg.get_address()}, left on the truck.")
+            return True
+        deadline = pkg.get_deadline_seconds()
+        if new_id in buckets:
+            buckets[new_id].append(pkg)
+            position = plan.index(new_id, first)
+            if position >= 0 and deadline < plan.deadlines[position]:
+                plan.set_deadline(position, deadline)
+        else:
+            _, position = plan.cheapest_insertion(new_id, first, deadline)
+            plan.insert(new_id, position, deadline)
+            buckets[new_id] = [pkg]
+        if truck_index in self.trace_trucks:
+            self.trace_sink.record(REROUTE, truck_index, to_address=pkg.get_address(),
+                                   package_id=package_id)
+        return True
+
+    def _send_again(self, truck_index, pkg):
+        """
+        Queues another trip for a truck whose route is done but which still
+        carries pkg. Its packages are routed afresh when it departs.
+        """
+        package_id = pkg.get_package_id()
+        if self.graph.get_address_id(pkg.get_address()) < 0:
+            print(f"Package #{package_id} has no route to {pkg.get_address()}, left on the truck.")
+            return False
+        if self.out[truck_index]:
+            self.another_trip.add(truck_index)
+        # A truck already waiting or dispatched routes the package when it leaves
+        elif truck_index not in self.waiting and truck_index not in self.pending_depart:
+            self.waiting.append(truck_index)
+            if self.free_drivers:
+                self._dispatch(self.now)
+        if truck_index in self.trace_trucks:
+            self.trace_sink.record(REROUTE, truck_index, to_address=pkg.get_address(),
+                                   package_id=package_id)
+        return True
+
+    def run(self):
+        """
+        Processes events until every truck is back at the HUB.
+        Returns the time of the last event in seconds since midnight.
+
+        Big O: O(e log e) for e events, one per stop plus two per truck.
+        """
+        owns_sink = self.trace_trucks and self.trace_sink is None
+        if owns_sink:
+            self.trace_sink = TraceSink.to_stdout()
+        try:
+            return self._run()
+        finally:
+            if owns_sink:
+                self.trace_sink.close()
+                self.trace_sink = None
+            elif self.trace_sink is not None:
+                self.trace_sink.flush()
+
+    def _run(self):
+        while self.free_drivers and self.waiting:
+            self._dispatch(self.start_time)
+
+        events = self.events
+        handlers = (self._on_return, self._on_depart, self._on_arrive, self._on_change)
+        pop = heapq.heappop
+        while events:
+            at_time, kind, _, truck_index = pop(events)
+            self.now = at_time
+            self.event_count += 1
+            handlers[kind](truck_index)
+        return self.now
+
+    def _dispatch(self, at_time):
+        """
+        Hands a free driver the next waiting truck. The truck leaves once
+        every package on it has reached the hub, and not before its
+        earliest departure time.
+        """
+        self.free_drivers -= 1
+        truck_index = self.waiting.pop()
+        self.pending_depart.add(truck_index)
+        if (self.earliest_departures is not None
+                and truck_index < len(self.earliest_departures)):
+            earliest = self.earliest_departures[truck_index]
+            if earliest is not None and earliest > at_time:
+                at_time = earliest
+        if self.constraints is not None:
+            for pkg in self.trucks[truck_index].get_loaded_packages():
+                ready = self.constraints.get_available_time(pkg.get_package_id())
+                if ready is not None and ready > at_time:
+                    at_time = ready
+        self.schedule(at_time, DEPART, truck_index)
+
+    def _on_depart(self, truck_index):
+        truck = self.trucks[truck_index]
+        truck.depart(self.now)
+        self.out[truck_index] = True
+        self.pending_depart.discard(truck_index)
+        if self.depart_times[truck_index] is None:
+            self.depart_times[truck_index] = self.now
+        if self.constraints is not None:
+            self.constraints.apply_corrections(truck.get_loaded_packages(), self.now)
+        stop_ids, packages_by_stop, _ = group_stops(self.graph, truck.get_loaded_packages())
+        start_id = self.location_ids[truck_index]
+        self.routes[truck_index] = self.plan_route(self.graph, start_id, stop_ids) if start_id >= 0 else []
+        self.packages_by_stop[truck_index] = packages_by_stop
+        self.route_pos[truck_index] = 0
+        deadlines = [min(pkg.get_deadline_seconds() for pkg in packages_by_stop[stop_id])
+                     for stop_id in self.routes[truck_index]]
+        self.plans[truck_index] = RoutePlan(self.graph, start_id, self.routes[truck_index],
+                                            self.now, self.hub_id, deadlines, truck.get_speed())
+        # plan_route orders stops by distance only
+        self.plans[truck_index].repair_deadlines()
+        for pkg in truck.get_loaded_packages():
+            self.truck_of[pkg.get_package_id()] = truck_index
+
+        if truck_index in self.trace_trucks:
+            self.trace_sink.record(TRACE_DEPART, truck_index, at_time=self.now)
+        self._schedule_next_leg(truck_index)
+
+    def _on_arrive(self, truck_index):
+        truck = self.trucks[truck_index]
+        stop_id = self.routes[truck_index][self.route_pos[truck_index]]
+        distance = self.graph.get_distance_by_id(self.location_ids[truck_index], stop_id)
+        record = self.trace_sink.record if truck_index in self.trace_trucks else None
+        if record:
+            record(DRIVE, truck_index, truck.get_current_location(),
+                   self.graph.get_address(stop_id), distance)
+
+        # Popped, so a stop added again later by reroute starts a new list
+        for pkg in self.packages_by_stop[truck_index].pop(stop_id, ()):
+            truck.deliver_package(pkg, distance)
+            self.pkg_table.update_package_status(pkg.get_package_id(),
+                                                 "Delivered", truck.get_current_time())
+            if record:
+                record(DELIVER, truck_index, at_time=truck.get_current_time(),
+                       package_id=pkg.get_package_id())
+            # Remaining packages for this stop are dropped off without driving
+            distance = 0.0
+        if record:
+            record(STOP_DONE, truck_index, miles=truck.get_mileage())
+
+        self.location_ids[truck_index] = stop_id
+        self.route_pos[truck_index] += 1
+        self._schedule_next_leg(truck_index)
+
+    def _on_return(self, truck_index):
+        truck = self.trucks[truck_index]
+        distance = self.graph.get_distance_by_id(self.location_ids[truck_index], self.hub_id)
+        tracing = truck_index in self.trace_trucks
+        if tracing:
+            self.trace_sink.record(TRACE_RETURN, truck_index, truck.get_current_location(),
+                                   miles=distance)
+        truck.go_home(distance)
+        self.location_ids[truck_index] = self.hub_id
+        self.out[truck_index] = False
+        if tracing:
+            self.trace_sink.record(RETURNED, truck_index, at_time=truck.get_current_time(),
+                                   miles=truck.get_mileage())
+
+        self.free_drivers += 1
+        if truck_index in self.another_trip:
+            # Goes out again before the trucks that have not left yet
+            self.another_trip.discard(truck_index)
+            self.waiting.append(truck_index)
+        if self.waiting:
+            self._dispatch(self.now)
+
+    def _on_change(self, package_id):
+        address = self.pending_changes[package_id].pop(0)
+        pkg = self.pkg_table.get_package(package_id)
+        if pkg is None:
+            return
+        self.pkg_table.set_address(package_id, address)
+        self.reroute(pkg)
+
+    def _schedule_next_leg(self, truck_index):
+        """
+        Schedules arrival at the next stop, or the return to the HUB once
+        the route is done.
+        """
+        route = self.routes[truck_index]
+        position = self.route_pos[truck_index]
+        here = self.location_ids[truck_index]
+        if position < len(route):
+            target, kind = route[position], ARRIVE
+        else:
+            target, kind = self.hub_id, RETURN
+        distance = self.graph.get_distance_by_id(here, target)
+        truck = self.trucks[truck_index]
+        self.schedule(self.now + truck.travel_seconds(distance, truck.get_speed()), kind, truck_index)
@@ -0,0 +1,254 @@
+"""
+TraceSink.py
+Buffered, structured delivery trace.
+
+Delivery code records each step as a small tuple
+(kind, truck, from, to, miles, time, package) instead of printing it.
+Tuples are collected in a list and handed over in batches to a background
+thread, which renders and writes them: as the familiar text trace, as JSON
+Lines, or as a compact binary file. Recording is one tuple and one append,
+so tracing every truck costs little more than tracing none.
+"""
+import json
+import queue
+import struct
+import sys
+import threading
+
+from clock import format_time
+
+# Event kinds
+TRACE_START = 0  # deliver_all_packages begins
+DEPART = 1       # truck leaves the HUB (simulator)
+DRIVE = 2        # from -> to, miles
+DELIVER = 3      # package delivered at time
+STOP_DONE = 4    # miles is the truck's mileage after the stop
+NO_ROUTE = 5     # packages left that cannot be reached from `from`
+RETURN = 6       # from -> HUB, miles
+RETURNED = 7     # back at the HUB at time, miles is the total mileage
+REROUTE = 8      # package moved to address `to`
+
+KIND_NAMES = ["trace_start", "depart", "drive", "deliver", "stop_done",
+              "no_route", "return", "returned", "reroute"]
+
+DEFAULT_BATCH_SIZE = 4096
+
+
+def render_text(event):
+    """
+    The text the original print-based trace showed for one event.
+    """
+    kind, truck, from_address, to_address, miles, at_time, package_id = event
+    if kind == DRIVE:
+        return f"Driving from '{from_address}' to '{to_address}' [{miles:.2f} miles]\n"
+    if kind == DELIVER:
+        return f"Delivered Package #{package_id} at {format_time(at_time)}\n"
+    if kind == STOP_DONE:
+        return f"Truck mileage: {miles:.2f} miles\n\n"
+    if kind == DEPART:
+        return (f"----- Delivery Trace, Truck {truck + 1} -----\n"
+                f"Truck departs HUB at {format_time(at_time)}\n\n")
+    if kind == TRACE_START:
+        return "----- Delivery Trace -----\nTruck starting at HUB\n\n"
+    if kind == NO_ROUTE:
+        return f"No valid package found from {from_address}\n"
+    if kind == RETURN:
+        return f"Returning from '{from_address}' to HUB [{miles:.2f} miles]\n"
+    if kind == RETURNED:
+        return (f"Truck returned to HUB at {format_time(at_time)}, "
+                f"Total mileage: {miles:.2f} miles\n--------------------------\n\n")
+    if kind == REROUTE:
+        return f"Rerouted Truck {truck + 1} for Package #{package_id} to '{to_address}'\n\n"
+    return ""
+
+
+def _json_value(value):
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return json.dumps(value)
+    return repr(value)
+
+
+class TextWriter:
+    """
+    Writes events as the human-readable trace. The stream is closed with
+    the writer only if close_stream is set (not for sys.stdout).
+    """
+
+    def __init__(self, stream, close_stream=False):
+        self.stream = stream
+        self.close_stream = close_stream
+
+    def write(self, events):
+        self.stream.write("".join(map(render_text, events)))
+        self.stream.flush()
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+
+
+class JsonlWriter:
+    """
+    Writes one JSON object per event.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, events):
+        # Formatted by hand, json.dumps on a dict per event costs several
+        # times more; only the addresses need escaping
+        value = _json_value
+        lines = [f'{{"kind": "{KIND_NAMES[kind]}", "truck": {value(truck)}, '
+                 f'"from": {value(from_address)}, "to": {value(to_address)}, '
+                 f'"miles": {value(miles)}, "time": {value(at_time)}, '
+                 f'"package": {value(package_id)}}}'
+                 for kind, truck, from_address, to_address, miles, at_time, package_id in events]
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+
+class BinaryWriter:
+    """
+    Writes fixed-size little-endian records. Addresses are written once,
+    as a STRING record giving their number, and referenced by that number
+    afterwards. read_binary turns a file back into event tuples.
+    """
+
+    RECORD = struct.Struct("<BiiiddQ")  # kind, truck, from, to, miles, time, package
+    STRING = 255                        # then a uint32 length and utf-8 bytes
+    NONE = -1                           # stored for a missing truck, address or number
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.string_ids = {}
+
+    def write(self, events):
+        pack = self.RECORD.pack
+        chunks = []
+        for kind, truck, from_address, to_address, miles, at_time, package_id in events:
+            chunks.append(pack(kind,
+                               self.NONE if truck is None else truck,
+                               self._string_id(from_address, chunks),
+                               self._string_id(to_address, chunks),
+                               float("nan") if miles is None else miles,
+                               float("nan") if at_time is None else at_time,
+                               0 if package_id is None else package_id + 1))
+        self.stream.write(b"".join(chunks))
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+    def _string_id(self, text, chunks):
+        if text is None:
+            return self.NONE
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = self.string_ids[text] = len(self.string_ids)
+            data = text.encode("utf-8")
+            chunks.append(struct.pack("<BI", self.STRING, len(data)) + data)
+        return string_id
+
+
+def read_binary(path):
+    """
+    Yields the event tuples stored by BinaryWriter.
+    """
+    record = BinaryWriter.RECORD
+    strings = []
+    with open(path, "rb") as f:
+        while True:
+            head = f.read(1)
+            if not head:
+                return
+            if head[0] == BinaryWriter.STRING:
+                (length,) = struct.unpack("<I", f.read(4))
+                strings.append(f.read(length).decode("utf-8"))
+                continue
+            kind, truck, from_id, to_id, miles, at_time, package = record.unpack(
+                head + f.read(record.size - 1))
+            yield (kind,
+                   None if truck == BinaryWriter.NONE else truck,
+                   None if from_id == BinaryWriter.NONE else strings[from_id],
+                   None if to_id == BinaryWriter.NONE else strings[to_id],
+                   None if miles != miles else miles,
+                   None if at_time != at_time else at_time,
+                   None if package == 0 else package - 1)
+
+
+class TraceSink:
+    """
+    Collects event tuples and writes them in batches on a background
+    thread. flush() waits until everything recorded so far is written;
+    close() flushes and stops the thread.
+    """
+
+    def __init__(self, writer, batch_size=DEFAULT_BATCH_SIZE):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.buffer = []
+        self.batches = queue.Queue()
+        self.thread = threading.Thread(target=self._drain, name="trace-sink", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def to_stdout(cls, batch_size=DEFAULT_BATCH_SIZE):
+        return cls(TextWriter(sys.stdout), batch_size)
+
+    @classmethod
+    def to_file(cls, path, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Sink writing to path, as JSON Lines for .jsonl, binary records for
+        .bin and text otherwise.
+        """
+        if path.endswith(".jsonl"):
+            writer = JsonlWriter(open(path, "w", encoding="utf-8"))
+        elif path.endswith(".bin"):
+            writer = BinaryWriter(open(path, "wb"))
+        else:
+            writer = TextWriter(open(path, "w", encoding="utf-8"), close_stream=True)
+        return cls(writer, batch_size)
+
+    def record(self, kind, truck=None, from_address=None, to_address=None,
+               miles=None, at_time=None, package_id=None):
+        self.buffer.append((kind, truck, from_address, to_address, miles, at_time, package_id))
+        if len(self.buffer) >= self.batch_size:
+            self.batches.put(self.buffer)
+            self.buffer = []
+
+    def flush(self):
+        if self.buffer:
+            self.batches.put(self.buffer)
+            self.buffer = []
+        self.batches.join()
+
+    def close(self):
+        self.flush()
+        self.batches.put(None)
+        self.thread.join()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _drain(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                if batch is None:
+                    return
+                self.writer.write(batch)
+            except (OSError, ValueError) as e:
+                print(f"Trace output failed: {e}", file=sys.stderr)
+            finally:
+                self.batches.task_done()
@@ -4,6 +4,7 @@ Truck.py
 :author Taylor Ketterling 3/21/2025 
 """
 from package import Package
+from clock import SECONDS_PER_HOUR, parse_time
 
 class Truck:
     """
@@ -15,40 +16,62 @@ class Truck:
     MAX_CAPACITY = 16         # Max number of packages
     SPEED_MPH = 18.0          # Speed in miles/hour
 
-    def __init__(self):
+    def __init__(self, capacity=None, speed_mph=None):
         """
         Constructs a Truck with an empty load, zero mileage,
         location at 'HUB', and time at '08:00'.
+
+        capacity and speed_mph default to MAX_CAPACITY and SPEED_MPH; what-if
+        scenarios (see scenario_runner.py) set them per truck.
+
+        current_time is kept in float seconds since midnight; use
+        clock.format_time to display it.
         """
+        self.capacity = Truck.MAX_CAPACITY if capacity is None else capacity
+        self.speed_mph = Truck.SPEED_MPH if speed_mph is None else speed_mph
         self.loaded_packages = []
         self.mileage = 0.0
         self.current_location = "HUB"
-        self.current_time = "08:00"
+        self.current_time = parse_time("08:00")
 
     def load_package(self, pkg):
         """
-        Loads a package onto the truck if capacity allows.
+        Loads a package onto the truck if capacity allows. The package
+        stays "At hub" until the truck departs.
         """
-        if len(self.loaded_packages) < Truck.MAX_CAPACITY:
+        if len(self.loaded_packages) < self.capacity:
             self.loaded_packages.append(pkg)
-            pkg.set_status("En route")
         else:
             print(f"Truck capacity reached, cannot load package #{pkg.get_package_id()}")
 
+    def depart(self, at_time=None):
+        """
+        Leaves the current location at at_time (the truck's current time
+        if None) and marks every loaded package "En route" as of then.
+        """
+        if at_time is not None:
+            self.current_time = at_time
+        for pkg in self.loaded_packages:
+            pkg.set_status("En route", self.current_time)
+
     def deliver_package(self, pkg, distance_to_package):
         """
         Delivers a package, updates mileage, location, and delivery timestamp.
+
+        The package is stamped with the time the truck arrives at its
+        address, after the leg of distance_to_package is driven.
         """
         self.mileage += distance_to_package
-        pkg.set_status("Delivered")
+
+        # Convert distance to hours traveled at the truck's speed
+        time_traveled = distance_to_package / self.speed_mph
+        self._update_current_time(time_traveled)
+
+        pkg.set_status("Delivered", self.current_time)
         pkg.set_delivery_time(self.current_time)
         self.loaded_packages.remove(pkg)
         self.current_location = pkg.get_address()
 
-        # Convert distance to hours traveled at SPEED_MPH
-        time_traveled = distance_to_package / Truck.SPEED_MPH
-        self._update_current_time(time_traveled)
-
     def go_home(self, distance_to_home):
         """
         Sends the truck back to the HUB.
@@ -56,26 +79,31 @@ class Truck:
         self.mileage += distance_to_home
         self.current_location = "HUB"
 
-        time_traveled = distance_to_home / Truck.SPEED_MPH
+        time_traveled = distance_to_home / self.speed_mph
         self._update_current_time(time_traveled)
 
     def _update_current_time(self, hours):
         """
-        Updates the truck's current_time (HH:MM) after traveling
-        in float hours.
+        Advances the truck's current_time (seconds) after traveling
+        in float hours. No rounding, so partial minutes are kept.
+        """
+        self.current_time += hours * SECONDS_PER_HOUR
+
+    @staticmethod
+    def travel_seconds(distance, speed_mph=None):
+        """
+        Seconds needed to drive distance miles at speed_mph (SPEED_MPH if
+        None), computed the same way the truck's clock is advanced.
         """
-        # Convert current_time to total minutes
-        hr, min_ = map(int, self.current_time.split(":"))
-        total_current_minutes = hr * 60 + min_
-
-        # Add traveled minutes
-        traveled_minutes = int(round(hours * 60))
-        total_new_minutes = total_current_minutes + traveled_minutes
-
-        # Convert back to HH:MM (24-hour style)
-        new_hr = total_new_minutes // 60
-        new_min = total_new_minutes % 60
-        self.current_time = f"{new_hr:02d}:{new_min:02d}"
+        if speed_mph is None:
+            speed_mph = Truck.SPEED_MPH
+        return distance / speed_mph * SECONDS_PER_HOUR
+
+    def get_capacity(self):
+        return self.capacity
+
+    def get_speed(self):
+        return self.speed_mph
 
     def get_mileage(self):
         return self.mileage